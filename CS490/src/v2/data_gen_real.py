@@ -120,5 +120,5 @@ if __name__ == "__main__":
             output_dir=args.output_dir,
             samples_per_image=args.samples_per_image,
             hr_size=args.hr_size,
-            scale=args.scale,
+            scale=args.scale_factor,
         )
@@ -0,0 +1,244 @@
+"""
+Architecture/latency sweep over NinaSR hyperparameters.
+
+Builds every combination of the given depth, width, expansion and attention
+settings, measures its CPU latency per megapixel on a schematic page through
+the tiled inference engine (same harness as `benchmark.py`), runs a short
+proxy fine-tune on a fixed subset of the HR/LR dataset and reports the
+Pareto frontier of latency against validation L1. Results are appended to a
+CSV as they come in, so an interrupted sweep resumes where it stopped.
+
+Usage:
+    python arch_sweep.py --dataset-root dataset -o sweep.csv \\
+        --resblocks 4 6 8 10 --feats 8 12 16 --expansion 1.5 2.0
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+import argparse
+import csv
+import itertools
+import json
+import os
+import random
+
+import torch
+from benchmark import count_flops, load_or_make_image, time_call
+from dataset import HRLRDataset
+from losses import FusedLoss
+from machine_profile import apply_threads, load_profile, resolve_settings
+from ninasr import NinaSR
+from run_fine_tune import train, validate
+from tiling import TiledUpscaler
+from torch.utils.data import DataLoader, Subset
+
+FIELDS = [
+    "name",
+    "config",
+    "params",
+    "gflops_per_mpx",
+    "s_per_mpx",
+    "val_l1",
+    "pareto",
+]
+
+
+def candidate_configs(args) -> list[dict]:
+    return [
+        {
+            "n_resblocks": n_resblocks,
+            "n_feats": n_feats,
+            "expansion": expansion,
+            "attn_reduction": reduction,
+            "attn_stride": stride,
+        }
+        for n_resblocks, n_feats, expansion, reduction, stride in itertools.product(
+            args.resblocks, args.feats, args.expansion, args.reduction, args.stride
+        )
+        # The attention bottleneck needs at least one channel.
+        if int(n_feats * expansion) // reduction >= 1
+    ]
+
+
+def config_name(config: dict) -> str:
+    return (
+        f"r{config['n_resblocks']}_f{config['n_feats']}_e{config['expansion']}"
+        f"_a{config['attn_reduction']}s{config['attn_stride']}"
+    )
+
+
+def _subset(dataset, n: int, seed: int):
+    """The same `n` random samples for every candidate."""
+    if n <= 0 or n >= len(dataset):
+        return dataset
+    return Subset(dataset, random.Random(seed).sample(range(len(dataset)), n))
+
+
+def measure_latency(model, img, args) -> float:
+    """Seconds per input megapixel of tiled inference over `img`."""
+    upscaler = TiledUpscaler(
+        model, args.scale, args.chop_size, args.chop_overlap, tile_batch=args.tile_batch
+    )
+    with torch.no_grad():
+        seconds = time_call(
+            lambda: upscaler.upscale(img, preprocess=False), args.repeats
+        )
+    return seconds / (img.shape[0] * img.shape[1] / 1e6)
+
+
+def proxy_fine_tune(model, train_loader, val_loader, device, args) -> float:
+    """Short L1+edge fine-tune from scratch; returns the final val L1."""
+    loss_fns = {"fused": FusedLoss(lambda_edge=args.lambda_edge).to(device)}
+    optim = torch.optim.Adam(model.parameters(), lr=args.lr)
+    for _ in range(args.proxy_epochs):
+        train(model, train_loader, optim, device, loss_fns)
+    _, comps = validate(model, val_loader, device, {"l1": FusedLoss().to(device)})
+    return comps["l1"]
+
+
+def pareto_frontier(rows: list[dict]) -> list[dict]:
+    """Rows not beaten on both latency and val L1 by another row."""
+    frontier = []
+    best_l1 = float("inf")
+    for r in sorted(rows, key=lambda r: (r["s_per_mpx"], r["val_l1"])):
+        if r["val_l1"] < best_l1:
+            frontier.append(r)
+            best_l1 = r["val_l1"]
+    return frontier
+
+
+def _read_rows(path: str) -> list[dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path, newline="") as f:
+        rows = list(csv.DictReader(f))
+    for r in rows:
+        r["params"] = int(r["params"])
+        for k in ("gflops_per_mpx", "s_per_mpx", "val_l1"):
+            r[k] = float(r[k])
+    return rows
+
+
+def _write_rows(path: str, rows: list[dict]):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Sweep NinaSR architectures")
+    p.add_argument("--dataset-root", required=True)
+    p.add_argument("-o", "--output", default="arch_sweep.csv")
+    p.add_argument("--scale", type=int, default=2)
+    p.add_argument("--resblocks", type=int, nargs="+", default=[4, 6, 8, 10])
+    p.add_argument("--feats", type=int, nargs="+", default=[8, 12, 16, 24])
+    p.add_argument("--expansion", type=float, nargs="+", default=[1.5, 2.0])
+    p.add_argument("--reduction", type=int, nargs="+", default=[4])
+    p.add_argument("--stride", type=int, nargs="+", default=[16])
+
+    p.add_argument("--train-samples", type=int, default=512)
+    p.add_argument("--val-samples", type=int, default=128)
+    p.add_argument("--proxy-epochs", type=int, default=3)
+    p.add_argument("--batch-size", type=int, default=4)
+    p.add_argument("--lr", type=float, default=1e-3)
+    p.add_argument("--lambda-edge", type=float, default=0.25)
+    p.add_argument("--seed", type=int, default=0)
+
+    p.add_argument("-i", "--image", default=None, help="Page used for latency")
+    p.add_argument("--size", type=int, default=512, help="Synthetic page size")
+    p.add_argument("--repeats", type=int, default=3)
+    p.add_argument("--chop-size", type=int, default=None)
+    p.add_argument("--chop-overlap", type=int, default=32)
+    p.add_argument("--tile-batch", type=int, default=None)
+    p.add_argument(
+        "--budget",
+        type=float,
+        default=None,
+        help="Latency budget in s/MPx: report the best frontier model within it",
+    )
+    p.add_argument("--no-profile", action="store_true")
+    args = p.parse_args()
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+
+    # Latency is what production inference would see, so use its settings.
+    profile = {} if args.no_profile else load_profile()
+    section = profile.get("inference", {})
+    resolve_settings(args, section, ["chop_size", "tile_batch"])
+    args.chop_size = args.chop_size or 256
+    args.tile_batch = args.tile_batch or 1
+    apply_threads(section.get("num_threads"), section.get("interop_threads"))
+
+    train_loader = DataLoader(
+        _subset(
+            HRLRDataset(args.dataset_root, split="train", augment=True),
+            args.train_samples,
+            args.seed,
+        ),
+        batch_size=args.batch_size,
+        shuffle=True,
+    )
+    val_loader = DataLoader(
+        _subset(
+            HRLRDataset(args.dataset_root, split="val", augment=False),
+            args.val_samples,
+            args.seed,
+        ),
+        batch_size=args.batch_size,
+    )
+    img = load_or_make_image(args.image, args.size)
+
+    rows = _read_rows(args.output)
+    done = {r["name"] for r in rows}
+    configs = candidate_configs(args)
+    for i, config in enumerate(configs, 1):
+        name = config_name(config)
+        if name in done:
+            continue
+        # Same initialization and batch order for every candidate.
+        torch.manual_seed(args.seed)
+        random.seed(args.seed)
+        model = NinaSR(scale=args.scale, **config).to(device)
+        row = {
+            "name": name,
+            "config": json.dumps(config),
+            "params": sum(p.numel() for p in model.parameters()),
+            "gflops_per_mpx": count_flops(model, (1, 3, 256, 256))
+            / 1e9
+            / (256 * 256 / 1e6),
+            "s_per_mpx": measure_latency(model.eval(), img, args),
+            "val_l1": proxy_fine_tune(model, train_loader, val_loader, device, args),
+        }
+        print(
+            f"[{i}/{len(configs)}] {name:<22} {row['params']:>8} params "
+            f"{row['s_per_mpx']:.3f} s/MPx val L1={row['val_l1']:.5f}"
+        )
+        rows.append(row)
+        _write_rows(args.output, rows)
+
+    frontier = pareto_frontier(rows)
+    on_frontier = {r["name"] for r in frontier}
+    for r in rows:
+        r["pareto"] = int(r["name"] in on_frontier)
+    _write_rows(args.output, rows)
+
+    print(f"\nPareto frontier ({len(frontier)} of {len(rows)} configurations):")
+    print(f"{'name':<24}{'params':>9}{'GFLOP/MPx':>11}{'s/MPx':>9}{'val L1':>10}")
+    for r in frontier:
+        print(
+            f"{r['name']:<24}{r['params']:>9}{r['gflops_per_mpx']:>11.2f}"
+            f"{r['s_per_mpx']:>9.3f}{r['val_l1']:>10.5f}"
+        )
+    if args.budget is not None:
+        within = [r for r in frontier if r["s_per_mpx"] <= args.budget]
+        if within:
+            print(f"Best within {args.budget} s/MPx: {within[-1]['config']}")
+        else:
+            print(f"No configuration runs within {args.budget} s/MPx")
+
+
+if __name__ == "__main__":
+    main()
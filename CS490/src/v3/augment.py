@@ -0,0 +1,100 @@
+"""
+Batched tensor-space augmentation for HR/LR training batches.
+
+Applies the same random transforms as `HRLRDataset`'s PIL path (a right
+angle or a free rotation in [-30, 30] degrees, then vertical and horizontal
+flips, each with probability 0.5) to a whole collated batch on the training
+device. Right angles and flips are index ops; free rotations are one
+`affine_grid`/`grid_sample` call per batch. The affine grid works in
+normalized coordinates that span the full image at any resolution, so LR
+and HR are rotated about the same physical center by exactly the same
+angle, which separate PIL rotations of both images do not guarantee.
+"""
+
+import math
+
+import torch
+import torch.nn.functional as F
+
+# Batch entries at HR resolution that follow the LR geometry.
+HR_KEYS = ("hr", "teacher")
+
+
+class BatchAugment:
+    """
+    Args:
+        max_angle: free rotations are drawn from [-max_angle, max_angle]
+        seed: seed of the generator for the per-sample parameters
+    """
+
+    def __init__(self, max_angle: float = 30.0, seed: int = 0):
+        self.max_angle = max_angle
+        self.generator = torch.Generator().manual_seed(seed)
+
+    def _rand(self, n: int) -> torch.Tensor:
+        return torch.rand(n, generator=self.generator)
+
+    def params(self, n: int, square: bool) -> dict[str, torch.Tensor]:
+        """Per-sample transform parameters, drawn on the CPU."""
+        right = self._rand(n) < 0.5
+        quarter = torch.randint(0, 4, (n,), generator=self.generator)
+        if not square:  # 90/270 degrees would change the shape
+            quarter = quarter // 2 * 2
+        angle = (self._rand(n) * 2 - 1) * self.max_angle
+        return {
+            "quarter": torch.where(right, quarter, 0),
+            "angle": torch.where(right, 0.0, angle),
+            "vflip": self._rand(n) < 0.5,
+            "hflip": self._rand(n) < 0.5,
+        }
+
+    @staticmethod
+    def apply(x: torch.Tensor, p: dict[str, torch.Tensor]) -> torch.Tensor:
+        """Transform an (N, C, H, W) batch with parameters from `params`."""
+        x = x.clone()
+        for k in (1, 2, 3):
+            idx = (p["quarter"] == k).nonzero().flatten().to(x.device)
+            if len(idx):
+                x[idx] = torch.rot90(x[idx], k, dims=(2, 3))
+
+        idx = (p["angle"] != 0).nonzero().flatten()
+        if len(idx):
+            x[idx.to(x.device)] = _rotate(x[idx.to(x.device)], p["angle"][idx])
+
+        for key, dim in (("vflip", 2), ("hflip", 3)):
+            idx = p[key].nonzero().flatten().to(x.device)
+            if len(idx):
+                x[idx] = x[idx].flip(dim)
+        return x
+
+    def __call__(self, batch: dict) -> dict:
+        lr = batch["lr"]
+        p = self.params(lr.shape[0], square=lr.shape[2] == lr.shape[3])
+        out = dict(batch)
+        out["lr"] = self.apply(lr, p)
+        for key in HR_KEYS:
+            if key in batch:
+                out[key] = self.apply(batch[key], p)
+        return out
+
+
+def _rotate(x: torch.Tensor, degrees: torch.Tensor) -> torch.Tensor:
+    """
+    Rotate every image counter-clockwise by its angle about the image
+    center, bicubic with black corners (like PIL `rotate`).
+    """
+    n, _, h, w = x.shape
+    rad = degrees.to(x.device, x.dtype) * (math.pi / 180)
+    cos, sin = torch.cos(rad), torch.sin(rad)
+    # Output -> input coordinates; the aspect terms keep the rotation rigid
+    # in pixel space for non-square images.
+    theta = torch.zeros(n, 2, 3, device=x.device, dtype=x.dtype)
+    theta[:, 0, 0] = cos
+    theta[:, 0, 1] = -sin * h / w
+    theta[:, 1, 0] = sin * w / h
+    theta[:, 1, 1] = cos
+    grid = F.affine_grid(theta, list(x.shape), align_corners=False)
+    out = F.grid_sample(
+        x, grid, mode="bicubic", padding_mode="zeros", align_corners=False
+    )
+    return out.clamp(0, 1)
@@ -0,0 +1,230 @@
+"""
+Autotune CPU settings for NinaSR and save them as this machine's profile.
+
+Sweeps torch intra-op threads, inter-op threads, tile batch size and chop
+size for inference, and thread counts for a training step, on
+representative schematic tiles. torch can size its inter-op pool only once
+per process, so every thread configuration is measured in a fresh worker
+subprocess; the tile settings are swept inside it.
+
+Usage: python autotune.py [-m checkpoint] [--quick]
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+import argparse
+import json
+import os
+import subprocess
+import time
+
+import torch
+from benchmark import load_or_make_image
+from machine_profile import apply_threads, load_profile, save_profile
+from run_model import load_model
+from tiling import TiledUpscaler
+
+
+def _thread_candidates(n_cpu: int, quick: bool) -> list[int]:
+    """Powers of two up to the core count, plus the core count itself."""
+    values = {n_cpu, max(1, n_cpu // 2)}
+    t = 1
+    while t < n_cpu:
+        values.add(t)
+        t *= 2
+    values = sorted(values)
+    return values[-3:] if quick else values
+
+
+def _interop_candidates(n_cpu: int) -> list[int]:
+    return [1, 2, 4] if n_cpu >= 16 else [1, 2]
+
+
+def tiled_chop_sizes(chop_sizes: list[int], height: int, width: int) -> list[int]:
+    """
+    The chop sizes that actually tile an image of this size. A chop at
+    least as large as the image runs as one untiled forward without any
+    halo overhead, so it would always win the sweep whatever the tiling
+    tradeoff on real pages is.
+    """
+    sizes = [c for c in chop_sizes if c < min(height, width)]
+    if not sizes:
+        raise ValueError(
+            f"No chop size in {chop_sizes} is smaller than the {width}x{height} "
+            "sweep image; use a larger --image-size or image"
+        )
+    return sizes
+
+
+@torch.no_grad()
+def _measure_inference(args) -> list[dict]:
+    """Seconds per input megapixel for every (chop size, tile batch) pair."""
+    model = load_model(args.model_path, scale=2, device="cpu").eval()
+    img = load_or_make_image(args.image, args.image_size)
+    mpx = img.shape[0] * img.shape[1] / 1e6
+
+    results = []
+    for chop_size in tiled_chop_sizes(args.chop_sizes, *img.shape[:2]):
+        overlap = min(args.chop_overlap, chop_size // 2)
+        for tile_batch in args.tile_batches:
+            upscaler = TiledUpscaler(
+                model, 2, chop_size, overlap, tile_batch=tile_batch
+            )
+            upscaler.upscale(img, preprocess=False)  # warmup
+            start = time.perf_counter()
+            for _ in range(args.repeats):
+                upscaler.upscale(img, preprocess=False)
+            elapsed = (time.perf_counter() - start) / args.repeats
+            results.append(
+                {
+                    "chop_size": chop_size,
+                    "tile_batch": tile_batch,
+                    "s_per_mpx": elapsed / mpx,
+                }
+            )
+    return results
+
+
+def _measure_training(args) -> list[dict]:
+    """Seconds per fine-tune step (forward + backward + Adam) at batch 4."""
+    model = load_model(args.model_path, scale=2, device="cpu").train()
+    optim = torch.optim.Adam(model.parameters(), lr=1e-4)
+    lr = torch.rand(4, 3, 128, 128)
+    hr = torch.rand(4, 3, 256, 256)
+
+    def step():
+        optim.zero_grad()
+        loss = torch.nn.functional.l1_loss(model(lr), hr)
+        loss.backward()
+        optim.step()
+
+    step()  # warmup
+    start = time.perf_counter()
+    for _ in range(args.repeats):
+        step()
+    return [{"s_per_step": (time.perf_counter() - start) / args.repeats}]
+
+
+def worker(args):
+    """Runs inside the subprocess: one thread configuration, prints JSON."""
+    apply_threads(args.threads, args.interop_threads)
+    measure = _measure_inference if args.mode == "inference" else _measure_training
+    print(json.dumps(measure(args)))
+
+
+def _run_worker(args, mode: str, threads: int, interop: int) -> list[dict]:
+    cmd = [
+        sys.executable,
+        __file__,
+        "--worker",
+        "--mode",
+        mode,
+        "--threads",
+        str(threads),
+        "--interop-threads",
+        str(interop),
+        "--image-size",
+        str(args.image_size),
+        "--repeats",
+        str(args.repeats),
+        "--chop-overlap",
+        str(args.chop_overlap),
+        "--chop-sizes",
+        *map(str, args.chop_sizes),
+        "--tile-batches",
+        *map(str, args.tile_batches),
+    ]
+    if args.model_path:
+        cmd += ["--model-path", args.model_path]
+    if args.image:
+        cmd += ["--image", args.image]
+    out = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    # The last stdout line is the JSON result, anything before is logging.
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def autotune(args) -> dict:
+    n_cpu = os.cpu_count() or 1
+    thread_opts = _thread_candidates(n_cpu, args.quick)
+    interop_opts = _interop_candidates(n_cpu)
+
+    best_inf = None
+    best_train = None
+    for threads in thread_opts:
+        for interop in interop_opts:
+            for r in _run_worker(args, "inference", threads, interop):
+                r.update(num_threads=threads, interop_threads=interop)
+                print(
+                    f"inference threads={threads:<3} interop={interop} "
+                    f"chop={r['chop_size']:<4} batch={r['tile_batch']:<2} "
+                    f"{r['s_per_mpx']:.2f} s/MPx"
+                )
+                if best_inf is None or r["s_per_mpx"] < best_inf["s_per_mpx"]:
+                    best_inf = r
+
+            r = _run_worker(args, "training", threads, interop)[0]
+            r.update(num_threads=threads, interop_threads=interop)
+            print(
+                f"training  threads={threads:<3} interop={interop} "
+                f"{r['s_per_step']:.3f} s/step"
+            )
+            if best_train is None or r["s_per_step"] < best_train["s_per_step"]:
+                best_train = r
+
+    return {"inference": best_inf, "training": best_train}
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    p.add_argument("-m", "--model-path", default="", help="Checkpoint to time")
+    p.add_argument("-i", "--image", default=None, help="Representative image")
+    p.add_argument(
+        "--image-size",
+        type=int,
+        default=1024,
+        help="Synthetic page size; chop sizes not below it are skipped",
+    )
+    p.add_argument("--repeats", type=int, default=2)
+    p.add_argument("--chop-overlap", type=int, default=32)
+    p.add_argument(
+        "--chop-sizes", type=int, nargs="+", default=[128, 192, 256, 384, 512]
+    )
+    p.add_argument("--tile-batches", type=int, nargs="+", default=[1, 2, 4, 8])
+    p.add_argument(
+        "--quick", action="store_true", help="Only try the 3 largest thread counts"
+    )
+    p.add_argument("-o", "--profile", default=None, help="Profile file to write")
+    # Internal: subprocess entry point.
+    p.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    p.add_argument("--mode", default="inference", help=argparse.SUPPRESS)
+    p.add_argument("--threads", type=int, default=None, help=argparse.SUPPRESS)
+    p.add_argument("--interop-threads", type=int, default=None, help=argparse.SUPPRESS)
+    args = p.parse_args()
+
+    if args.worker:
+        worker(args)
+        return
+
+    best = autotune(args)
+    profile = load_profile(args.profile)
+    profile["inference"] = {
+        "num_threads": best["inference"]["num_threads"],
+        "interop_threads": best["inference"]["interop_threads"],
+        "tile_batch": best["inference"]["tile_batch"],
+        "chop_size": best["inference"]["chop_size"],
+    }
+    profile["training"] = {
+        "num_threads": best["training"]["num_threads"],
+        "interop_threads": best["training"]["interop_threads"],
+    }
+    path = save_profile(profile, args.profile)
+    print(f"Best inference: {profile['inference']}")
+    print(f"Best training: {profile['training']}")
+    print(f"Saved profile to {path}")
+
+
+if __name__ == "__main__":
+    main()
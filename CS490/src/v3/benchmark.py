@@ -0,0 +1,462 @@
+"""
+Micro-benchmarks for the inference and training pipeline stages.
+
+Usage: python benchmark.py <benchmark> [options], see --help for the list.
+Every benchmark prints a small table of median wall-clock timings so the
+numbers of different machines/commits can be compared side by side.
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from collections.abc import Callable
+from functools import partial
+
+import cv2
+import numpy as np
+import torch
+import torchvision.transforms.functional as TF
+from augment import BatchAugment
+from data_gen_synthetic import (
+    _find_fonts,
+    _render_lines_image,
+    _render_number_image,
+)
+from dataset import HRLRDataset
+from glyph_atlas import GlyphAtlas, render_numbers
+from image_utils import bilateral_smooth_array
+from line_raster import render_lines
+from losses import PerceptualLoss
+from ninasr import BLOCK_TYPES, build_ninasr, fuse_repconv_state_dict, ninasr_b0
+from output_modes import OUTPUT_FORMATS, OUTPUT_MODES, make_output_mode
+from PIL import Image
+from run_model import load_model
+from tiling import TiledUpscaler, bilateral_stage
+
+
+def time_call(fn: Callable[[], object], repeats: int = 3, warmup: int = 1) -> float:
+    """
+    Median wall-clock time of `fn()` in seconds.
+
+    The median is used instead of the mean so that a single hiccup (page
+    cache, frequency scaling) does not skew short CPU benchmarks.
+    """
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def count_flops(model: torch.nn.Module, shape: tuple[int, ...]) -> int:
+    """
+    Multiply-accumulate FLOPs (2 per MAC) of the convolutions in one forward
+    of a zero tensor of `shape`. Convolutions dominate NinaSR's cost; the
+    elementwise ops and the attention pooling are ignored.
+    """
+    total = 0
+
+    def hook(module, _inputs, out):
+        nonlocal total
+        k = module.kernel_size[0] * module.kernel_size[1]
+        total += 2 * out.numel() * (module.in_channels // module.groups) * k
+
+    handles = [
+        m.register_forward_hook(hook)
+        for m in model.modules()
+        if isinstance(m, torch.nn.Conv2d)
+    ]
+    try:
+        with torch.no_grad():
+            model(torch.zeros(shape, device=next(model.parameters()).device))
+    finally:
+        for h in handles:
+            h.remove()
+    return total
+
+
+def load_or_make_image(path: str | None, size: int, seed: int = 0) -> np.ndarray:
+    """
+    Load an RGB uint8 image, or draw a schematic-like test page of
+    `size`x`size` (dark lines and boxes on noisy white paper) if no path is given.
+    """
+    if path:
+        with Image.open(path) as im:
+            return np.asarray(im.convert("RGB"))
+
+    rng = np.random.default_rng(seed)
+    img = np.full((size, size, 3), 245, dtype=np.uint8)
+    for _ in range(size // 8):
+        p1 = tuple(int(v) for v in rng.integers(0, size, 2))
+        p2 = tuple(int(v) for v in rng.integers(0, size, 2))
+        color = tuple(int(v) for v in rng.integers(0, 80, 3))
+        if rng.random() < 0.7:
+            cv2.line(img, p1, p2, color, int(rng.integers(1, 5)), cv2.LINE_AA)
+        else:
+            cv2.rectangle(img, p1, p2, color, int(rng.integers(1, 4)))
+    noise = rng.normal(0, 4, img.shape)
+    return np.clip(img + noise, 0, 255).astype(np.uint8)
+
+
+def print_table(rows: list[tuple[str, float]], baseline: str | None = None):
+    base = dict(rows).get(baseline) if baseline else None
+    for name, seconds in rows:
+        speedup = f"  x{base / seconds:.2f}" if base else ""
+        print(f"{name:<40} {seconds * 1000:10.1f} ms{speedup}")
+
+
+def bench_preprocess(args):
+    """
+    Full-image bilateral filter followed by tiled inference (the old
+    `predict()` path) against the per-tile stage fused into the engine.
+    """
+    torch.set_grad_enabled(False)
+    img = load_or_make_image(args.image, args.size)
+    model = load_model(args.model_path, scale=2, device="cpu").eval()
+
+    full = TiledUpscaler(model, 2, args.chop_size, args.chop_overlap)
+    fused = TiledUpscaler(
+        model, 2, args.chop_size, args.chop_overlap, preprocess=bilateral_stage()
+    )
+
+    def run_full():
+        return full.upscale(bilateral_smooth_array(img))
+
+    def run_fused():
+        return fused.upscale(img)
+
+    diff = np.abs(run_full().astype(np.int16) - run_fused()).max()
+    print(f"image {img.shape[1]}x{img.shape[0]}, max |full - fused| = {diff}")
+    print_table(
+        [
+            (
+                "bilateral only (full image)",
+                time_call(lambda: bilateral_smooth_array(img), args.repeats),
+            ),
+            ("full-image bilateral + tiled model", time_call(run_full, args.repeats)),
+            ("fused per-tile bilateral + model", time_call(run_fused, args.repeats)),
+        ],
+        baseline="full-image bilateral + tiled model",
+    )
+
+
+def bench_output(args):
+    """
+    Encode time and file size of the SR result per output mode (RGB PNG
+    against 1-bit and palettized PNG/TIFF).
+    """
+    torch.set_grad_enabled(False)
+    img = load_or_make_image(args.image, args.size)
+    model = load_model(args.model_path, scale=2, device="cpu").eval()
+    upscaler = TiledUpscaler(
+        model, 2, args.chop_size, args.chop_overlap, preprocess=bilateral_stage()
+    )
+
+    rows = []
+    sizes = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode_name in OUTPUT_MODES:
+            mode = make_output_mode(mode_name)
+            canvas = upscaler.upscale(img, output=mode)
+            for fmt, ext in OUTPUT_FORMATS.items():
+                path = os.path.join(tmp, f"out_{mode_name}{ext}")
+
+                def encode(mode=mode, canvas=canvas, path=path):
+                    mode.save(mode.finish(canvas), path)
+
+                name = f"{mode_name} {fmt}"
+                rows.append((name, time_call(encode, args.repeats)))
+                sizes[name] = os.path.getsize(path)
+
+    print_table(rows, baseline="rgb png")
+    for name, size in sizes.items():
+        print(f"{name:<40} {size / 1024:10.1f} KiB")
+
+
+def bench_blocks(args):
+    """
+    Latency, FLOPs and parameters of b0 with each ResBlock type (stock,
+    repconv as trained and reparameterized, depthwise-separable).
+    """
+    torch.set_grad_enabled(False)
+    img = load_or_make_image(args.image, args.size)
+    mpx = img.shape[0] * img.shape[1] / 1e6
+    base = load_model(args.model_path, scale=2, device="cpu")
+
+    variants = {}
+    for block_type in BLOCK_TYPES:
+        model = ninasr_b0(2, block_type=block_type)
+        # Initialize from the checkpoint where shapes allow, as fine-tuning does.
+        target = model.state_dict()
+        target.update(
+            {
+                k: v
+                for k, v in base.state_dict().items()
+                if k in target and v.shape == target[k].shape
+            }
+        )
+        model.load_state_dict(target)
+        variants[block_type] = model
+    fused_state, fused_config = fuse_repconv_state_dict(
+        variants["repconv"].state_dict(), variants["repconv"].config
+    )
+    variants["repconv (fused)"] = build_ninasr(2, fused_config)
+    variants["repconv (fused)"].load_state_dict(fused_state)
+
+    rows = []
+    for name, model in variants.items():
+        model.eval()
+        upscaler = TiledUpscaler(model, 2, args.chop_size, args.chop_overlap)
+        rows.append((name, time_call(partial(upscaler.upscale, img, preprocess=False))))
+        print(
+            f"{name:<20} {sum(p.numel() for p in model.parameters()):>8} params "
+            f"{count_flops(model, (1, 3, 256, 256)) / 1e9 / (256 * 256 / 1e6):8.2f} GFLOP/MPx"
+        )
+    print_table(rows, baseline="standard")
+    for name, seconds in rows:
+        print(f"{name:<40} {seconds / mpx:10.3f} s/MPx")
+
+    if args.variant_paths:
+        # Imported here: run_fine_tune itself imports this module.
+        from run_fine_tune import model_stats, print_model_stats
+        from torch.utils.data import DataLoader
+
+        loader = DataLoader(
+            HRLRDataset(args.dataset_root, split="val", augment=False), batch_size=4
+        )
+        stats = {"stock": model_stats(base, loader, "cpu")}
+        for path in args.variant_paths:
+            model = load_model(path, scale=2, device="cpu")
+            stats[os.path.splitext(os.path.basename(path))[0]] = model_stats(
+                model, loader, "cpu"
+            )
+        print_model_stats(stats)
+
+
+def bench_augment(args):
+    """
+    Per-sample PIL augmentation (HRLRDataset) against BatchAugment on the
+    collated batch, for one batch of HR crops of --size/4 pixels.
+    """
+    hr_size = args.size // 4
+    page = load_or_make_image(args.image, args.size)
+    crops = [
+        Image.fromarray(page[r : r + hr_size, c : c + hr_size])
+        for r in range(0, args.size, hr_size)
+        for c in range(0, args.size, hr_size)
+    ][: args.batch_size]
+    pairs = [(hr, hr.resize((hr_size // 2, hr_size // 2))) for hr in crops]
+
+    def pil():
+        # Same operations as HRLRDataset.__getitem__ with augment=True.
+        out = []
+        for hr, lr in pairs:
+            angle = random.choice([0, 90, 180, 270])
+            if random.random() < 0.5:
+                angle = random.uniform(-30, 30)
+            hr = hr.rotate(angle, resample=Image.Resampling.BICUBIC)
+            lr = lr.rotate(angle, resample=Image.Resampling.BICUBIC)
+            if random.random() < 0.5:
+                hr, lr = HRLRDataset._vflip(hr), HRLRDataset._vflip(lr)
+            if random.random() < 0.5:
+                hr, lr = HRLRDataset._hflip(hr), HRLRDataset._hflip(lr)
+            out.append((TF.to_tensor(hr), TF.to_tensor(lr)))
+        return torch.stack([h for h, _ in out]), torch.stack([lr for _, lr in out])
+
+    batch = {
+        "hr": torch.stack([TF.to_tensor(hr) for hr, _ in pairs]),
+        "lr": torch.stack([TF.to_tensor(lr) for _, lr in pairs]),
+    }
+    augment = BatchAugment()
+    print(f"batch of {len(pairs)} HR crops of {hr_size}px")
+    print_table(
+        [
+            ("PIL per sample", time_call(pil, args.repeats)),
+            ("BatchAugment", time_call(lambda: augment(batch), args.repeats)),
+        ],
+        baseline="PIL per sample",
+    )
+
+
+def bench_synthetic(args):
+    """
+    PIL supersample-and-shrink renderers of the synthetic data against the
+    glyph atlas (numbers) and the vectorized SDF rasterizer (lines), for
+    one batch of --size/4 pixel pages.
+    """
+    hr_size = args.size // 4
+    n = args.batch_size
+    atlas = GlyphAtlas(_find_fonts())
+    rng = np.random.default_rng(0)
+    random.seed(0)
+    print(f"batch of {n} pages of {hr_size}px")
+    print_table(
+        [
+            (
+                "numbers: PIL",
+                time_call(
+                    lambda: [
+                        _render_number_image(hr_size, atlas.fonts, 2) for _ in range(n)
+                    ],
+                    args.repeats,
+                ),
+            ),
+            (
+                "numbers: glyph atlas",
+                time_call(
+                    lambda: [render_numbers(hr_size, atlas, 2) for _ in range(n)],
+                    args.repeats,
+                ),
+            ),
+        ],
+        baseline="numbers: PIL",
+    )
+    print_table(
+        [
+            (
+                "lines: PIL",
+                time_call(
+                    lambda: [_render_lines_image(hr_size) for _ in range(n)],
+                    args.repeats,
+                ),
+            ),
+            (
+                "lines: SDF one page at a time",
+                time_call(
+                    lambda: [render_lines(1, hr_size, rng) for _ in range(n)],
+                    args.repeats,
+                ),
+            ),
+            (
+                "lines: SDF batch",
+                time_call(lambda: render_lines(n, hr_size, rng), args.repeats),
+            ),
+        ],
+        baseline="lines: PIL",
+    )
+
+
+def bench_perceptual(args):
+    """
+    Perceptual loss options against the full-resolution relu3_3 fp32 term:
+    forward+backward time per step on one batch of --size/4 pixel crops,
+    and the cosine similarity of the output gradient to the full term's
+    (1.0: the same training signal). The cosine is only a proxy: relu2_2
+    and crops have not been validated by fine-tuning, and run_fine_tune
+    marks them experimental.
+    """
+    hr_size = args.size // 4
+    page = load_or_make_image(args.image, args.size)
+    hr = torch.stack(
+        [
+            TF.to_tensor(page[r : r + hr_size, c : c + hr_size])
+            for r in range(0, args.size, hr_size)
+            for c in range(0, args.size, hr_size)
+        ][: args.batch_size]
+    )
+    # Stand-in for a model output: the target blurred and slightly noisy.
+    out = TF.gaussian_blur(hr, 5) + 0.02 * torch.randn(hr.shape)
+    names = [str(i) for i in range(len(hr))]
+    pretrained = not args.random_vgg
+    options = {
+        "relu3_3 fp32": {},
+        "relu2_2": {"layer": "relu2_2"},
+        "bf16 channels_last": {"bf16": True},
+        f"crop {hr_size // 2}": {"crop": hr_size // 2},
+        "cached targets": {"cache": True},
+        "every 4 steps": {"every": 4},
+    }
+
+    def grad(loss_fn, steps=1):
+        """Gradient w.r.t. the output of the last of `steps` training steps."""
+        for _ in range(steps):
+            x = out.clone().requires_grad_()
+            loss = loss_fn(x, hr, names)
+            if loss is not None:
+                loss.backward()
+        return x.grad
+
+    rows, cosines = [], {}
+    base = None
+    for name, opts in options.items():
+        # Same random weights (and crop) for every option.
+        torch.manual_seed(0)
+        loss_fn = PerceptualLoss(1.0, pretrained=pretrained, **opts)
+        g = grad(loss_fn)
+        if base is None:
+            base = g
+        if "every" not in opts:
+            cosines[name] = float(
+                torch.nn.functional.cosine_similarity(g.flatten(), base.flatten(), 0)
+            )
+        steps = opts.get("every", 1)
+        seconds = time_call(partial(grad, loss_fn, steps), args.repeats)
+        rows.append((name, seconds / steps))
+    print(f"batch of {len(hr)} HR crops of {hr_size}px")
+    print_table(rows, baseline="relu3_3 fp32")
+    for name, cos in cosines.items():
+        print(f"{name:<40} gradient cosine {cos:.4f}")
+
+
+def _add_common_args(p: argparse.ArgumentParser):
+    p.add_argument(
+        "-m", "--model-path", default="", help="Checkpoint (default: random init)"
+    )
+    p.add_argument(
+        "-i", "--image", default=None, help="Image file (default: synthetic page)"
+    )
+    p.add_argument("--size", type=int, default=1024, help="Synthetic image size")
+    p.add_argument("--repeats", type=int, default=3)
+    p.add_argument("--chop-size", type=int, default=256)
+    p.add_argument("--chop-overlap", type=int, default=32)
+
+
+BENCHMARKS = {
+    "preprocess": bench_preprocess,
+    "output": bench_output,
+    "blocks": bench_blocks,
+    "augment": bench_augment,
+    "synthetic": bench_synthetic,
+    "perceptual": bench_perceptual,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pipeline micro-benchmarks")
+    sub = parser.add_subparsers(dest="benchmark", required=True)
+    parsers = {}
+    for name, fn in BENCHMARKS.items():
+        parsers[name] = sub.add_parser(name, help=fn.__doc__.strip().splitlines()[0])
+        _add_common_args(parsers[name])
+    parsers["blocks"].add_argument(
+        "--variant-paths",
+        nargs="*",
+        default=[],
+        help="Fine-tuned block variants to compare on val quality against -m",
+    )
+    parsers["blocks"].add_argument("--dataset-root", default="dataset")
+    parsers["augment"].add_argument("--batch-size", type=int, default=16)
+    parsers["synthetic"].add_argument("--batch-size", type=int, default=32)
+    parsers["perceptual"].add_argument("--batch-size", type=int, default=16)
+    parsers["perceptual"].add_argument(
+        "--random-vgg",
+        action="store_true",
+        help="Random VGG weights instead of downloading ImageNet ones (timing only)",
+    )
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+Side-by-side comparison of several checkpoints.
+
+Every image is decoded and preprocessed once and each tile batch is fed to
+all models in turn (`TiledUpscaler.upscale_many`), so comparing K
+checkpoints costs K forwards instead of K full `run_model.py` runs. Writes
+one strip per image (input, then one column per checkpoint) and, when HR
+references are given, a metrics CSV with PSNR/SSIM per image and model.
+
+Usage:
+    python compare_checkpoints.py -s data/val_lr -o compare \\
+        -m checkpoints/v00_ninasr_b0.pt checkpoints/v30_ninasr_b0.pt \\
+        --hr-dir data/val_hr
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+import argparse
+import csv
+import os
+from collections import defaultdict
+
+import numpy as np
+import torch
+from image_utils import rgb_to_luma
+from losses import ssim
+from machine_profile import apply_threads, load_profile, resolve_settings
+from ninasr import SelfEnsembleModel
+from PIL import Image, ImageDraw
+from run_model import list_images, load_model
+from tiling import PREPROCESS_STAGES, TiledUpscaler
+from tqdm import tqdm
+
+LABEL_HEIGHT = 20
+
+
+def psnr(out: np.ndarray, ref: np.ndarray) -> float:
+    mse = np.mean((out.astype(np.float64) - ref.astype(np.float64)) ** 2)
+    return float("inf") if mse == 0 else 10 * np.log10(255.0**2 / mse)
+
+
+def ssim_uint8(out: np.ndarray, ref: np.ndarray) -> float:
+    """SSIM of two (H, W, C) uint8 images, same window as the training loss."""
+
+    def to_t(a):
+        return torch.tensor(a).permute(2, 0, 1).unsqueeze(0).float() / 255.0
+
+    with torch.no_grad():
+        return float(ssim(to_t(out), to_t(ref)))
+
+
+def checkpoint_labels(paths: list[str]) -> list[str]:
+    """
+    Column labels and output file suffixes: the checkpoint file names, with
+    the parent folder prepended when names repeat (a/model.pt, b/model.pt),
+    and the position on the command line when even those collide.
+    """
+    stems = [os.path.splitext(os.path.basename(p))[0] for p in paths]
+    if len(set(stems)) == len(stems):
+        return stems
+    parents = [os.path.basename(os.path.dirname(os.path.abspath(p))) for p in paths]
+    labels = [f"{parent}_{stem}" for parent, stem in zip(parents, stems, strict=True)]
+    if len(set(labels)) == len(labels):
+        return labels
+    return [f"{i}_{stem}" for i, stem in enumerate(stems)]
+
+
+def side_by_side(
+    img: np.ndarray, outputs: list[np.ndarray], labels: list[str]
+) -> Image.Image:
+    """
+    Input (nearest-neighbour upscaled to the output size) followed by every
+    model output, each column labelled with its checkpoint name.
+    """
+    h, w = outputs[0].shape[:2]
+    columns = [
+        np.asarray(Image.fromarray(img).resize((w, h), Image.Resampling.NEAREST))
+    ]
+    columns += [np.repeat(o, 3, axis=2) if o.shape[2] == 1 else o for o in outputs]
+    strip = Image.new("RGB", (w * len(columns), h + LABEL_HEIGHT), (255, 255, 255))
+    draw = ImageDraw.Draw(strip)
+    for i, (col, label) in enumerate(zip(columns, ["input", *labels], strict=True)):
+        strip.paste(Image.fromarray(col), (i * w, LABEL_HEIGHT))
+        draw.text((i * w + 4, 4), label, fill=(0, 0, 0))
+    return strip
+
+
+def compare(
+    image_paths: list[str],
+    output_dir: str,
+    upscaler: TiledUpscaler,
+    models: list[torch.nn.Module],
+    labels: list[str],
+    hr_dir: str | None = None,
+    save_individual: bool = False,
+    luma: bool = False,
+) -> dict[str, dict[str, float]]:
+    """
+    Run all models over the images; returns mean metrics per checkpoint.
+    `luma` feeds the models one luminance channel (n_colors=1 checkpoints).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    rows = []
+    for path in tqdm(image_paths, desc=f"Comparing {len(models)} checkpoints"):
+        name = os.path.splitext(os.path.basename(path))[0]
+        try:
+            with Image.open(path) as im:
+                img = np.asarray(im.convert("RGB"))
+        except (OSError, Image.DecompressionBombError) as e:
+            # Unreadable or truncated files (UnidentifiedImageError is an OSError).
+            print(f"Cannot read {path}: {e}")
+            continue
+        outputs = upscaler.upscale_many(models, rgb_to_luma(img) if luma else img)
+
+        side_by_side(img, outputs, labels).save(
+            os.path.join(output_dir, f"{name}_compare.png")
+        )
+        if save_individual:
+            for out, label in zip(outputs, labels, strict=True):
+                Image.fromarray(out.squeeze(2) if out.shape[2] == 1 else out).save(
+                    os.path.join(output_dir, f"{name}_{label}.png")
+                )
+
+        ref_path = os.path.join(hr_dir, os.path.basename(path)) if hr_dir else None
+        if ref_path is None or not os.path.exists(ref_path):
+            continue
+        with Image.open(ref_path) as im:
+            ref = np.asarray(im.convert("RGB"))
+        if ref.shape[:2] != outputs[0].shape[:2]:
+            print(f"Skipping metrics for {name}: HR size {ref.shape[:2]} differs")
+            continue
+        for out, label in zip(outputs, labels, strict=True):
+            out = np.repeat(out, 3, axis=2) if out.shape[2] == 1 else out
+            rows.append(
+                {
+                    "image": name,
+                    "checkpoint": label,
+                    "psnr": psnr(out, ref),
+                    "ssim": ssim_uint8(out, ref),
+                }
+            )
+
+    if not rows:
+        return {}
+
+    with open(os.path.join(output_dir, "metrics.csv"), "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["image", "checkpoint", "psnr", "ssim"])
+        writer.writeheader()
+        writer.writerows(rows)
+
+    sums: dict[str, dict[str, float]] = defaultdict(lambda: defaultdict(float))
+    counts: dict[str, int] = defaultdict(int)
+    for r in rows:
+        counts[r["checkpoint"]] += 1
+        sums[r["checkpoint"]]["psnr"] += r["psnr"]
+        sums[r["checkpoint"]]["ssim"] += r["ssim"]
+    means = {
+        label: {k: v / counts[label] for k, v in sums[label].items()}
+        for label in labels
+        if counts[label]
+    }
+    for label, m in means.items():
+        print(f"{label:<24} PSNR={m['psnr']:.3f} dB SSIM={m['ssim']:.4f}")
+    return means
+
+
+def main():
+    p = argparse.ArgumentParser(description="Compare several NinaSR checkpoints")
+    p.add_argument("-s", "--source-dir", required=True, help="Input images")
+    p.add_argument("-o", "--output-dir", default="compare")
+    p.add_argument(
+        "-m", "--model-paths", nargs="+", required=True, help="Checkpoints to compare"
+    )
+    p.add_argument(
+        "--hr-dir",
+        default=None,
+        help="HR references with the same file names, enables metrics.csv",
+    )
+    p.add_argument("--ensemble", action="store_true")
+    p.add_argument("--chop", action="store_true")
+    p.add_argument("--chop-size", type=int, default=None)
+    p.add_argument("--chop-overlap", type=int, default=32)
+    p.add_argument("--tile-batch", type=int, default=None)
+    p.add_argument(
+        "--preprocess", choices=sorted(PREPROCESS_STAGES), default="bilateral"
+    )
+    p.add_argument(
+        "--save-individual",
+        action="store_true",
+        help="Also save every model output as its own file",
+    )
+    p.add_argument("--no-profile", action="store_true")
+    args = p.parse_args()
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+
+    profile = {} if args.no_profile else load_profile()
+    section = profile.get("inference", {})
+    resolve_settings(args, section, ["chop_size", "tile_batch"])
+    apply_threads(section.get("num_threads"), section.get("interop_threads"))
+
+    models = [load_model(path, scale=2, device=device) for path in args.model_paths]
+    n_colors = {m.config["n_colors"] for m in models}
+    if len(n_colors) > 1:
+        raise SystemExit("All compared checkpoints must have the same n_colors")
+    if args.ensemble:
+        models = [SelfEnsembleModel(m).to(device) for m in models]
+    for m in models:
+        m.eval()
+
+    labels = checkpoint_labels(args.model_paths)
+    upscaler = TiledUpscaler(
+        models[0],
+        scale=2,
+        chop_size=(args.chop_size or 256) if args.chop else None,
+        chop_overlap=args.chop_overlap,
+        preprocess=PREPROCESS_STAGES[args.preprocess](),
+        device=device,
+        tile_batch=args.tile_batch or 1,
+    )
+    image_paths = [
+        os.path.join(args.source_dir, f) for f in sorted(list_images(args.source_dir))
+    ]
+    compare(
+        image_paths,
+        args.output_dir,
+        upscaler,
+        models,
+        labels,
+        hr_dir=args.hr_dir,
+        save_individual=args.save_individual,
+        luma=n_colors == {1},
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Checkpoint conversion utilities.
+
+Checkpoints are written in the fine-tune format ({"state_dict", "args", ...})
+plus a "model_config" entry with the NinaSR constructor arguments, so that
+`run_model.load_model` can rebuild non-default architectures.
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+import argparse
+import os
+
+import torch
+from ninasr import build_ninasr, fuse_repconv_state_dict, rgb_to_luma_state_dict
+
+
+def read_checkpoint(path: str) -> tuple[dict, dict | None]:
+    """Return (state_dict, model_config) of a checkpoint in any of our formats."""
+    ck = torch.load(path, map_location="cpu")
+    if isinstance(ck, dict) and "state_dict" in ck:
+        return ck["state_dict"], ck.get("model_config")
+    return ck, None
+
+
+def write_checkpoint(path: str, state_dict: dict, model_config: dict, **extra):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    torch.save({"state_dict": state_dict, "model_config": model_config, **extra}, path)
+
+
+def convert_luma(args):
+    state_dict, config = read_checkpoint(args.input)
+    model = build_ninasr(args.scale, config)
+    if model.config["n_colors"] != 3:
+        raise ValueError(f"{args.input} is not an RGB checkpoint")
+
+    luma_state = rgb_to_luma_state_dict(state_dict, args.scale, reduce=args.reduce)
+    luma_config = {**model.config, "n_colors": 1}
+    # Validate shapes by loading into the target architecture.
+    build_ninasr(args.scale, luma_config).load_state_dict(luma_state)
+
+    write_checkpoint(args.output, luma_state, luma_config, source=args.input)
+    print(f"Saved 1-channel checkpoint to {args.output}")
+
+
+def convert_reparameterize(args):
+    state_dict, config = read_checkpoint(args.input)
+    model = build_ninasr(args.scale, config)
+    fused_state, fused_config = fuse_repconv_state_dict(state_dict, model.config)
+    build_ninasr(args.scale, fused_config).load_state_dict(fused_state)
+
+    write_checkpoint(args.output, fused_state, fused_config, source=args.input)
+    print(f"Saved reparameterized checkpoint to {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert NinaSR checkpoints")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    luma = sub.add_parser(
+        "luma", help="Build a luminance-only (n_colors=1) model from RGB weights"
+    )
+    luma.add_argument("-i", "--input", required=True, help="RGB checkpoint")
+    luma.add_argument("-o", "--output", required=True, help="Output checkpoint")
+    luma.add_argument("--scale", type=int, default=2)
+    luma.add_argument(
+        "--reduce",
+        choices=["sum", "mean"],
+        default="sum",
+        help="How input filters are merged (sum is exact for gray inputs)",
+    )
+    luma.set_defaults(func=convert_luma)
+
+    rep = sub.add_parser(
+        "reparameterize",
+        help="Fold the training branches of a repconv model into plain convs",
+    )
+    rep.add_argument("-i", "--input", required=True, help="repconv checkpoint")
+    rep.add_argument("-o", "--output", required=True, help="Output checkpoint")
+    rep.add_argument("--scale", type=int, default=2)
+    rep.set_defaults(func=convert_reparameterize)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,183 @@
+import json
 import os
 import random
+import zlib
+from functools import partial
 
 import image_utils as image_utils
+import numpy as np
+from dedup import HashIndex, find_duplicates, image_hashes, phash
+from manifest import Manifest
 from PIL import Image
-from tqdm import tqdm
+from shards import COMPRESSIONS, ShardWriter
+from worker_pool import default_workers, map_tasks
+
+
+def _source_samples(
+    filename: str,
+    source_dir: str,
+    samples_per_image: int,
+    hr_size: int,
+    scale: int,
+    seed: int,
+    png_dir: str | None,
+    dedup_threshold: int | None = None,
+    content_floor: float | None = None,
+) -> tuple[list[tuple[str, np.ndarray | None, np.ndarray | None]], int] | None:
+    """
+    Cut all samples of one source image, decoded once. Each sample draws from
+    its own generator seeded by (seed, file name, sample index), so the
+    output does not depend on which worker runs it. With `png_dir` the pairs
+    are written to {png_dir}/{hr,lr} right here and only the names returned.
+    With `dedup_threshold`, HR crops within that many pHash bits of an
+    earlier crop of the same source are skipped. With `content_floor`, crop
+    positions follow the ink coverage of the page (image_utils.ContentCrops).
+
+    Returns (samples, number of crops skipped as duplicates), or None if the
+    source cannot be read.
+    """
+    try:
+        with Image.open(os.path.join(source_dir, filename)) as img:
+            src = np.asarray(img.convert("RGB"))
+    except (OSError, Image.DecompressionBombError) as e:
+        print(f"Error processing {filename}: {e}")
+        return None
+    if min(src.shape[:2]) < hr_size:
+        return [], 0
+
+    content = None
+    if content_floor is not None:
+        content = image_utils.ContentCrops(src, hr_size, content_floor)
+    samples = []
+    skipped = 0
+    crops = HashIndex()
+    file_key = zlib.crc32(filename.encode())
+    for i in range(samples_per_image):
+        name = f"{os.path.splitext(filename)[0]}_sample_{i}"
+        rng = np.random.default_rng([seed, file_key, i])
+        hr = image_utils.crop_and_rotate_array(src, hr_size, rng, content)
+        if dedup_threshold is not None:
+            h = phash(hr)
+            if crops.query(h, dedup_threshold):
+                skipped += 1
+                continue
+            crops.add(name, [h])
+        lr = image_utils.degrade_array(hr, scale, rng)
+        if png_dir is None:
+            samples.append((name, hr, lr))
+            continue
+        Image.fromarray(hr).save(os.path.join(png_dir, "hr", name + ".png"))
+        Image.fromarray(lr).save(os.path.join(png_dir, "lr", name + ".png"))
+        samples.append((name, None, None))
+    return samples, skipped
+
+
+def _assign_splits(
+    new_files: list[str],
+    manifest: Manifest,
+    seed: int,
+    groups: list[list[str]] | None = None,
+    removed: list[str] | None = None,
+) -> dict:
+    """
+    Randomly split the sources not in the manifest so that the total moves
+    towards 80/20 train/val; recorded sources keep their split. Sources of
+    one near-duplicate group always share a split. `removed` sources are
+    still in the manifest but no longer count towards the split sizes.
+    """
+    removed = set(removed or [])
+    kept = {f: e["split"] for f, e in manifest.sources.items() if f not in removed}
+    group_of = {f: tuple(g) for g in groups or [] for f in g}
+    units = {}
+    for f in sorted(new_files):
+        units.setdefault(group_of.get(f, (f,)), []).append(f)
+
+    splits = {}
+    free = []
+    for members, files in units.items():
+        recorded = [m for m in members if m in kept]
+        if recorded:
+            splits.update(dict.fromkeys(files, kept[recorded[0]]))
+        else:
+            free.append(files)
+    random.Random(seed).shuffle(free)
+
+    n_train = sum(split == "train" for split in kept.values())
+    n_train += sum(split == "train" for split in splits.values())
+    target = int((len(kept) + len(new_files)) * 0.8)
+    for files in free:
+        split = "train" if n_train < target else "val"
+        splits.update(dict.fromkeys(files, split))
+        n_train += len(files) if split == "train" else 0
+    return splits
+
+
+def _dedup_sources(
+    source_dir: str,
+    image_files: list[str],
+    stale: list[str],
+    manifest: Manifest,
+    threshold: int,
+    tile_size: int | None,
+    workers: int,
+) -> tuple[dict, list[list[str]], dict]:
+    """
+    pHash every source (recorded hashes are reused) and find near-duplicate
+    groups and redundant sources (see dedup.find_duplicates); sources that
+    are already generated are never dropped.
+
+    Returns (hashes, groups, {dropped source: source it duplicates}).
+    """
+    current = [f for f in image_files if f not in stale]
+    hashes = {f: manifest.sources[f]["hashes"] for f in current}
+    paths = [os.path.join(source_dir, f) for f in stale]
+    for f, h in zip(
+        stale,
+        map_tasks(
+            partial(_source_hashes, tile_size=tile_size), paths, workers, "Hashing"
+        ),
+        strict=True,
+    ):
+        if h is not None:
+            hashes[f] = h
+    groups, dropped = find_duplicates(hashes, threshold, keep=current)
+    return hashes, groups, dropped
+
+
+def _source_hashes(path: str, tile_size: int | None) -> dict | None:
+    try:
+        return image_hashes(path, tile_size)
+    except (OSError, Image.DecompressionBombError) as e:
+        print(f"Error hashing {path}: {e}")
+        return None
+
+
+def _delete_samples(output_dir: str, entry: dict, shard_writer):
+    """Remove the samples a manifest entry produced, in its own format."""
+    params = entry["params"]
+    if params["output_format"] == "shards":
+        shard_writer(entry["split"], params["compression"]).remove(entry["samples"])
+        return
+    for name in entry["samples"]:
+        for kind in ("hr", "lr"):
+            path = os.path.join(output_dir, entry["split"], kind, name + ".png")
+            if os.path.exists(path):
+                os.remove(path)
 
 
 def generate_dataset(
-    source_dir, output_dir, samples_per_image=20, hr_size=256, scale=2
+    source_dir,
+    output_dir,
+    samples_per_image=20,
+    hr_size=256,
+    scale=2,
+    output_format="png",
+    compression="raw",
+    seed=0,
+    workers=None,
+    dedup_threshold=None,
+    dedup_tile_size=None,
+    content_floor=None,
 ):
     """
     source_dir: Folder containing high-quality raw images (scans/vectors)
@@ -15,61 +185,189 @@ def generate_dataset(
     samples_per_image: How many random crops to take from each high-res image
     hr_size: Size of the high-res crop (pixels)
     scale: The ratio of HR/LR (e.g., 2 means LR is half the size)
+    output_format: "png" for {split}/{hr,lr} files, "shards" for packed
+        shards (see shards.py) with the given compression
+    seed: Seeds the train/val split and every sample; the output is
+        identical for any number of workers
+    workers: Generator processes (default: one per CPU)
+    dedup_threshold: pHash distance (bits) below which sources and the crops
+        of one source count as near-duplicates (dedup.py): redundant ones
+        are skipped, groups share a split and a report is written to
+        {output_dir}/dedup_report.json. None disables it. Crops are only
+        compared with the other crops of their own source (each source is
+        cut independently on the pool); near-identical crops of different
+        sources are caught only through their sources' hashes.
+    dedup_tile_size: Also group sources sharing a tile of this size
+    content_floor: Sample crops proportionally to ink coverage, a blank crop
+        weighing this much relative to the densest one; None for uniform
+
+    Runs are incremental: the provenance manifest (manifest.py) in
+    output_dir limits the work to sources that were added or changed since
+    the last run, or whose generator parameters differ, and the samples of
+    removed sources are deleted. Existing sources keep their split.
     """
 
     # Create final directory structure
-    for split in ["train", "val"]:
-        os.makedirs(os.path.join(output_dir, split, "hr"), exist_ok=True)
-        os.makedirs(os.path.join(output_dir, split, "lr"), exist_ok=True)
+    if output_format == "png":
+        for split in ["train", "val"]:
+            os.makedirs(os.path.join(output_dir, split, "hr"), exist_ok=True)
+            os.makedirs(os.path.join(output_dir, split, "lr"), exist_ok=True)
 
-    image_files = [
+    image_files = sorted(
         f
         for f in os.listdir(source_dir)
         if f.lower().endswith((".png", ".jpg", ".jpeg", ".webp"))
-    ]
+    )
 
     if not image_files:
         print(f"No images found in {source_dir}. Please place clean images there.")
         return
 
-    # Randomly shuffle and split source images into train/val
-    random.shuffle(image_files)
-    split_idx = int(len(image_files) * 0.8)
-    train_files = image_files[:split_idx]
-    val_files = image_files[split_idx:]
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = Manifest(output_dir)
+    params = {
+        "samples_per_image": samples_per_image,
+        "hr_size": hr_size,
+        "scale": scale,
+        "seed": seed,
+        "output_format": output_format,
+        "compression": compression,
+        "dedup_threshold": dedup_threshold,
+        "dedup_tile_size": dedup_tile_size,
+        "content_floor": content_floor,
+    }
+    workers = workers or default_workers()
+    removed = sorted(set(manifest.sources) - set(image_files))
+    stale = [
+        f
+        for f in image_files
+        if not manifest.is_current(f, os.path.join(source_dir, f), params)
+        # A skipped duplicate of a removed source is needed again.
+        or manifest.sources[f].get("duplicate_of") in removed
+    ]
+    added = [f for f in stale if f not in manifest.sources]
+    hashes, groups, dropped = {}, None, {}
+    if dedup_threshold is not None:
+        hashes, groups, dropped = _dedup_sources(
+            source_dir,
+            image_files,
+            stale,
+            manifest,
+            dedup_threshold,
+            dedup_tile_size,
+            workers,
+        )
+    splits = _assign_splits(added, manifest, seed, groups, removed)
+    print(
+        f"{len(image_files)} source images: {len(added)} added, "
+        f"{len(stale) - len(added)} changed, {len(removed)} removed"
+    )
 
-    files_mapping = {"train": train_files, "val": val_files}
+    writers = {}
 
-    print(f"Processing {len(image_files)} source images...")
+    def shard_writer(split: str, compression: str) -> ShardWriter:
+        if (split, compression) not in writers:
+            writers[split, compression] = ShardWriter(output_dir, split, compression)
+        return writers[split, compression]
 
-    for split, files in files_mapping.items():
-        count = 0
-        for filename in tqdm(files, desc=f"Generating {split} set"):
-            img_path = os.path.join(source_dir, filename)
-            try:
-                with Image.open(img_path) as img:
-                    img = img.convert("RGB")
-                    w, h = img.size
-
-                    if w < hr_size or h < hr_size:
-                        continue
-
-                    for i in range(samples_per_image):
-                        base_name = f"{os.path.splitext(filename)[0]}_sample_{i}.png"
-
-                        hr_crop = image_utils.crop_and_rotate(img, hr_size, scale)
-                        hr_crop.save(os.path.join(output_dir, split, "hr", base_name))
-
-                        lr_crop = image_utils.degrade(
-                            image_utils.downscale(hr_crop, hr_size, scale)
-                        )
-                        lr_crop.save(os.path.join(output_dir, split, "lr", base_name))
-                        count += 1
-            except Exception as e:
-                print(f"Error processing {filename}: {e}")
+    for f in removed + stale:
+        if f in manifest.sources:
+            entry = manifest.sources.pop(f)
+            splits[f] = entry["split"]
+            _delete_samples(output_dir, entry, shard_writer)
 
+    for f in dropped:
+        manifest.record(
+            f,
+            os.path.join(source_dir, f),
+            splits[f],
+            params,
+            [],
+            hashes=hashes[f],
+            duplicate_of=dropped[f],
+        )
+    skipped_crops = 0
+    for split in ("train", "val"):
+        files = [f for f in stale if splits[f] == split and f not in dropped]
+        writer = shard_writer(split, compression) if output_format == "shards" else None
+        cut = partial(
+            _source_samples,
+            source_dir=source_dir,
+            samples_per_image=samples_per_image,
+            hr_size=hr_size,
+            scale=scale,
+            seed=seed,
+            png_dir=None if writer else os.path.join(output_dir, split),
+            dedup_threshold=dedup_threshold,
+            content_floor=content_floor,
+        )
+        count = 0
+        for filename, result in zip(
+            files,
+            map_tasks(cut, files, workers, f"Generating {split} set"),
+            strict=True,
+        ):
+            if result is None:
+                continue  # unreadable, retried next run
+            samples, skipped = result
+            for name, hr, lr in samples:
+                if writer is not None:
+                    writer.add(name, hr, lr)
+            manifest.record(
+                filename,
+                os.path.join(source_dir, filename),
+                split,
+                params,
+                [name for name, _, _ in samples],
+                hashes=hashes.get(filename),
+            )
+            skipped_crops += skipped
+            count += len(samples)
         print(f"Generated {count} samples for {split}.")
 
+    for writer in writers.values():
+        writer.close()
+    manifest.save()
+    if dedup_threshold is not None:
+        _write_dedup_report(
+            output_dir, manifest, groups, skipped_crops, samples_per_image
+        )
+
+
+def _write_dedup_report(
+    output_dir: str,
+    manifest: Manifest,
+    groups: list[list[str]],
+    skipped_crops: int,
+    samples_per_image: int,
+):
+    """Summarize what dedup dropped and any group spanning both splits."""
+    sources = manifest.sources
+    dropped = {f: e["duplicate_of"] for f, e in sources.items() if "duplicate_of" in e}
+    groups = [g for g in groups if len(g) > 1]
+    report = {
+        "sources": len(sources),
+        "duplicate_groups": groups,
+        "dropped_sources": dropped,
+        "dropped_source_samples": len(dropped) * samples_per_image,
+        # Crops skipped as near-identical to another crop of their source,
+        # in this run (changed and added sources only).
+        "dropped_crops": skipped_crops,
+        "split_leaks": [
+            g
+            for g in groups
+            if len({sources[f]["split"] for f in g if f in sources}) > 1
+        ],
+    }
+    with open(os.path.join(output_dir, "dedup_report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+    print(
+        f"Dedup: {len(dropped)} of {len(sources)} sources redundant "
+        f"({report['dropped_source_samples']} samples), "
+        f"{report['dropped_crops']} near-identical crops skipped, "
+        f"{len(report['split_leaks'])} groups across splits"
+    )
+
 
 if __name__ == "__main__":
     import argparse
@@ -106,6 +404,53 @@ if __name__ == "__main__":
         default=2,
         help="Scaling factor between HR and LR (default: 2)",
     )
+    parser.add_argument(
+        "--format",
+        choices=["png", "shards"],
+        default="png",
+        help="Write PNG pairs or packed shards (default: png)",
+    )
+    parser.add_argument(
+        "--compression",
+        choices=COMPRESSIONS,
+        default="raw",
+        help="Shard compression (default: raw)",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Seed of the split and the samples (default: 0)",
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=None,
+        help="Generator processes (default: one per CPU)",
+    )
+    parser.add_argument(
+        "--dedup-threshold",
+        type=int,
+        default=None,
+        help="Skip near-duplicate sources and crops within this many pHash "
+        "bits, keeping duplicates in one split (e.g. 6; default: off). Crop "
+        "dedup is per source: crops are compared with the other crops of "
+        "their own source only",
+    )
+    parser.add_argument(
+        "--dedup-tile-size",
+        type=int,
+        default=None,
+        help="Also keep sources sharing a tile of this size in one split",
+    )
+    parser.add_argument(
+        "--content-floor",
+        type=float,
+        default=None,
+        help="Place crops proportionally to ink coverage; weight of a blank "
+        "crop relative to the densest one, e.g. 0.1 (default: uniform)",
+    )
 
     args = parser.parse_args()
 
@@ -121,4 +466,11 @@ if __name__ == "__main__":
             samples_per_image=args.samples_per_image,
             hr_size=args.hr_size,
             scale=args.scale_factor,
+            output_format=args.format,
+            compression=args.compression,
+            seed=args.seed,
+            workers=args.workers,
+            dedup_threshold=args.dedup_threshold,
+            dedup_tile_size=args.dedup_tile_size,
+            content_floor=args.content_floor,
         )
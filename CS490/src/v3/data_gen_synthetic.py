@@ -1,10 +1,20 @@
 import argparse
 import os
 import random
+from functools import lru_cache, partial
 
-from image_utils import degrade, downscale
+import numpy as np
+import torchvision.transforms.functional as TF
+from glyph_atlas import GlyphAtlas, render_numbers
+from image_utils import degrade_array
+from line_raster import render_lines
 from PIL import Image, ImageDraw, ImageFont
-from tqdm import tqdm
+from shards import COMPRESSIONS, ShardWriter
+from torch.utils.data import IterableDataset, get_worker_info
+from worker_pool import default_workers, map_tasks
+
+# Line pages rasterized per vectorized call when writing a dataset.
+LINES_BATCH = 32
 
 FONT_PATHS = [
     "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
@@ -129,6 +139,164 @@ def _render_lines_image(hr_size: int) -> Image.Image:
     return im
 
 
+def _synthetic_pages(mode: str, count: int, hr_size: int, atlas: GlyphAtlas):
+    """Yield `count` HR pages; lines are rasterized LINES_BATCH at a time."""
+    if mode == "numbers":
+        for _ in range(count):
+            yield render_numbers(hr_size, atlas, max_digits=2)
+        return
+    for start in range(0, count, LINES_BATCH):
+        rng = np.random.default_rng(random.getrandbits(64))
+        yield from render_lines(min(LINES_BATCH, count - start), hr_size, rng)
+
+
+@lru_cache(maxsize=1)
+def _worker_atlas() -> GlyphAtlas:
+    """One atlas per generator process, so glyphs are rasterized once."""
+    return GlyphAtlas(_find_fonts())
+
+
+def _synthetic_chunk(
+    task: tuple[str, int, int],
+    hr_size: int,
+    scale: int,
+    split_ratio: float,
+    seed: int,
+    png_dir: str | None,
+) -> list[tuple[str, str, np.ndarray | None, np.ndarray | None]]:
+    """
+    Render samples [start, start + count) of `mode`, with `random` seeded
+    from (seed, mode, start) only, so chunks come out the same on any
+    worker. With `png_dir` the pairs are written to {png_dir}/{split}/{hr,lr}
+    right here and only (split, name) returned.
+    """
+    mode, start, count = task
+    random.seed(f"{seed}-{mode}-{start}")
+    samples = []
+    for i, hr in enumerate(
+        _synthetic_pages(mode, count, hr_size, _worker_atlas()), start
+    ):
+        split = "train" if random.random() < split_ratio else "val"
+        name = f"synthetic_{mode}_{i:05d}"
+        lr = degrade_array(hr, scale, np.random.default_rng(random.getrandbits(64)))
+        if png_dir is None:
+            samples.append((split, name, hr, lr))
+            continue
+        Image.fromarray(hr).save(os.path.join(png_dir, split, "hr", name + ".png"))
+        Image.fromarray(lr).save(os.path.join(png_dir, split, "lr", name + ".png"))
+        samples.append((split, name, None, None))
+    return samples
+
+
+class SyntheticStream(IterableDataset):
+    """
+    Endless source of synthetic numbers/lines HR/LR pairs rendered inside the
+    DataLoader workers, optionally interleaved with a map-style real dataset.
+
+    One "epoch" yields every real sample once (shuffled) plus
+    `synthetic_ratio / (1 - synthetic_ratio)` times as many synthetic ones,
+    or `epoch_size` synthetic samples when there is no real dataset. Each
+    worker renders its own share with `random` seeded from (seed, epoch,
+    worker id), so a run is reproducible for a given worker count. Lines
+    pages are rasterized LINES_BATCH at a time into a per-worker buffer. Call
+    `set_epoch` before each epoch; the workers receive the new epoch because
+    loaders over this dataset are not persistent (see run_fine_tune).
+
+    Args:
+        hr_size: HR image size (default: that of the real samples, else 256)
+        scale: HR/LR ratio
+        real: map-style dataset returning {"hr", "lr", "name"} dicts
+        synthetic_ratio: fraction of synthetic samples in the stream, (0, 1]
+        epoch_size: synthetic samples per epoch when `real` is None
+        seed: base seed
+    """
+
+    def __init__(
+        self,
+        hr_size: int | None = None,
+        scale: int = 2,
+        real=None,
+        synthetic_ratio: float = 1.0,
+        epoch_size: int = 2000,
+        seed: int = 0,
+    ):
+        super().__init__()
+        if not 0 < synthetic_ratio <= 1:
+            raise ValueError(
+                f"synthetic_ratio must be in (0, 1], got {synthetic_ratio}"
+            )
+        if real is not None and synthetic_ratio == 1:
+            raise ValueError("A ratio of 1 leaves no room for the real dataset")
+        if hr_size is None:
+            hr_size = real[0]["hr"].shape[-1] if real is not None else 256
+        self.hr_size = hr_size
+        self.scale = scale
+        self.real = real
+        self.seed = seed
+        self.epoch = 0
+        if real is None:
+            self.n_real, self.n_synthetic = 0, epoch_size
+        else:
+            self.n_real = len(real)
+            self.n_synthetic = round(
+                self.n_real * synthetic_ratio / (1 - synthetic_ratio)
+            )
+        self.atlas = GlyphAtlas(_find_fonts())
+        self._lines = []
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_lines"] = []
+        return state
+
+    def set_epoch(self, epoch: int):
+        self.epoch = epoch
+
+    def __len__(self):
+        return self.n_real + self.n_synthetic
+
+    def _lines_page(self) -> np.ndarray:
+        if not self._lines:
+            rng = np.random.default_rng(random.getrandbits(64))
+            self._lines = list(render_lines(LINES_BATCH, self.hr_size, rng))
+        return self._lines.pop()
+
+    def _synthetic_sample(self, i: int) -> dict:
+        mode = random.choice(["numbers", "lines"])
+        if mode == "numbers":
+            hr = render_numbers(self.hr_size, self.atlas, max_digits=2)
+        else:
+            hr = self._lines_page()
+        rng = np.random.default_rng(random.getrandbits(64))
+        lr = degrade_array(hr, self.scale, rng)
+        return {
+            "hr": TF.to_tensor(hr),
+            "lr": TF.to_tensor(lr),
+            "name": f"stream_{mode}_{self.epoch}_{i}",
+        }
+
+    def __iter__(self):
+        info = get_worker_info()
+        worker, n_workers = (info.id, info.num_workers) if info else (0, 1)
+        random.seed(f"{self.seed}-{self.epoch}-{worker}")
+        self._lines = []
+
+        # Every worker gets a disjoint slice of the epoch's real permutation.
+        order = list(range(self.n_real))
+        random.Random(f"{self.seed}-{self.epoch}").shuffle(order)
+        real_left = order[worker::n_workers]
+        synth_left = len(range(worker, self.n_synthetic, n_workers))
+        synth_done = 0
+        while real_left or synth_left:
+            total = len(real_left) + synth_left
+            if random.random() < synth_left / total:
+                yield self._synthetic_sample(synth_done * n_workers + worker)
+                synth_left -= 1
+                synth_done += 1
+            else:
+                yield self.real[real_left.pop()]
+
+
 def _ensure_dirs(output_dir: str):
     for split in ("train", "val"):
         os.makedirs(os.path.join(output_dir, split, "hr"), exist_ok=True)
@@ -141,36 +309,50 @@ def generate_synthetic_combined(
     scale: int,
     samples_per_mode: int = 1000,
     split_ratio: float = 0.8,
+    output_format: str = "png",
+    compression: str = "raw",
+    seed: int = 0,
+    workers: int | None = None,
 ) -> None:
-    _ensure_dirs(output_dir)
-    font_objs = _find_fonts()
+    """
+    Samples are rendered in chunks of LINES_BATCH on `workers` processes
+    (default: one per CPU); the output depends on `seed` only, not on the
+    number of workers.
+    """
+    writers = {}
+    if output_format == "shards":
+        writers = {
+            split: ShardWriter(output_dir, split, compression)
+            for split in ("train", "val")
+        }
+    else:
+        _ensure_dirs(output_dir)
 
     modes = ["numbers", "lines"]
     total_counts = {m: 0 for m in modes}
-
-    sample_id = 0
+    render = partial(
+        _synthetic_chunk,
+        hr_size=hr_size,
+        scale=scale,
+        split_ratio=split_ratio,
+        seed=seed,
+        png_dir=None if writers else output_dir,
+    )
     for mode in modes:
-        for i in tqdm(range(samples_per_mode), desc=f"Generating synthetic {mode}"):
-            sample_id += 1
-            is_train = random.random() < split_ratio
-            split = "train" if is_train else "val"
-
-            if mode == "numbers":
-                hr_im = _render_number_image(hr_size, font_objs, max_digits=2)
-            else:
-                hr_im = _render_lines_image(hr_size)
-
-            base_name = f"synthetic_{mode}_{i:05d}.png"
-            hr_path = os.path.join(output_dir, split, "hr", base_name)
-            lr_path = os.path.join(output_dir, split, "lr", base_name)
-
-            hr_im.save(hr_path)
-
-            lr_im = degrade(downscale(hr_im, hr_size, scale))
-            lr_im.save(lr_path)
-
-            total_counts[mode] += 1
-
+        tasks = [
+            (mode, start, min(LINES_BATCH, samples_per_mode - start))
+            for start in range(0, samples_per_mode, LINES_BATCH)
+        ]
+        for samples in map_tasks(
+            render, tasks, workers or default_workers(), f"Generating synthetic {mode}"
+        ):
+            for split, name, hr, lr in samples:
+                if writers:
+                    writers[split].add(name, hr, lr)
+                total_counts[mode] += 1
+
+    for writer in writers.values():
+        writer.close()
     print(f"Generated synthetic samples: {total_counts}")
 
 
@@ -203,6 +385,31 @@ def _parse_args():
         default=2,
         help="Scaling factor between HR and LR (default: 2)",
     )
+    p.add_argument(
+        "--format",
+        choices=["png", "shards"],
+        default="png",
+        help="Write PNG pairs or packed shards (default: png)",
+    )
+    p.add_argument(
+        "--compression",
+        choices=COMPRESSIONS,
+        default="raw",
+        help="Shard compression (default: raw)",
+    )
+    p.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Seed of the samples and their split (default: 0)",
+    )
+    p.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=None,
+        help="Generator processes (default: one per CPU)",
+    )
     return p.parse_args()
 
 
@@ -213,6 +420,10 @@ def main():
         samples_per_mode=args.samples_per_mode,
         hr_size=args.hr_size,
         scale=args.scale_factor,
+        output_format=args.format,
+        compression=args.compression,
+        seed=args.seed,
+        workers=args.workers,
     )
 
 
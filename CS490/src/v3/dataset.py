@@ -3,8 +3,11 @@ import os
 import random
 from typing import List, Tuple
 
+import torch
 import torchvision.transforms.functional as TF
 from PIL import Image
+from sample_cache import open_sample_cache
+from shards import ShardReader, has_shards
 from torch.utils.data import Dataset
 
 logger = logging.getLogger(__name__)
@@ -25,12 +28,32 @@ def _refresh_file_lists_for(
     return hr_files, lr_files, basenames
 
 
+def seed_worker(worker_id: int):
+    """
+    DataLoader `worker_init_fn`: augmentation draws from `random`, which
+    worker processes would otherwise inherit in the same state. torch gives
+    every worker a distinct seed derived from the loader's generator, so
+    seeding from it keeps runs with the same --seed reproducible.
+    """
+    random.seed(torch.initial_seed() % 2**32)
+
+
 class HRLRDataset(Dataset):
     """Pairs HR/LR PNG images by basename under dataset/{split}/{hr,lr}.
 
+    If the split was packed into shards (dataset/{split}/shards, see
+    shards.py) HR/LR are read from the shards instead of the PNG folders.
+
     Args:
         root: dataset root containing train/val folders.
         split: 'train' or 'val'
+        teacher_dir: optional folder with cached teacher outputs
+            ({teacher_dir}/{split}/{basename}.png, see run_fine_tune); they
+            are returned as "teacher" and augmented together with HR.
+        cache_dir: optional folder for a decoded sample cache (see
+            sample_cache.py); all images are then read from one shared
+            memory map instead of decoding PNGs every epoch. Only used for
+            PNG folders, shards are memory-mapped already.
     """
 
     def __init__(
@@ -42,15 +65,19 @@ class HRLRDataset(Dataset):
         samples_per_image=20,
         hr_size=256,
         scale=2,
+        teacher_dir=None,
+        cache_dir=None,
     ):
         super().__init__()
         self.root = root
         self.split = split
         self.hr_dir = os.path.join(root, split, "hr")
         self.lr_dir = os.path.join(root, split, "lr")
-        # Ensure directories exist
-        os.makedirs(self.hr_dir, exist_ok=True)
-        os.makedirs(self.lr_dir, exist_ok=True)
+        self.shards = ShardReader(root, split) if has_shards(root, split) else None
+        if self.shards is None:
+            # Ensure directories exist
+            os.makedirs(self.hr_dir, exist_ok=True)
+            os.makedirs(self.lr_dir, exist_ok=True)
 
         # Optionally generate missing data using data_gen.generate_dataset
         self.augment = augment
@@ -58,43 +85,73 @@ class HRLRDataset(Dataset):
         self.samples_per_image = samples_per_image
         self.hr_size = hr_size
         self.scale = scale
-
-        self.hr_files, self.lr_files, self.basenames = _refresh_file_lists_for(
-            self.root, self.split
-        )
+        self.teacher_dir = os.path.join(teacher_dir, split) if teacher_dir else None
+
+        if self.shards is not None:
+            self.hr_files, self.lr_files = [], []
+            self.basenames = self.shards.names
+        else:
+            self.hr_files, self.lr_files, self.basenames = _refresh_file_lists_for(
+                self.root, self.split
+            )
+
+        self.cache = None
+        if cache_dir and self.shards is None:
+            files = {}
+            for base in self.basenames:
+                for kind, folder in self._sources():
+                    files[f"{kind}/{base}"] = os.path.join(folder, base + ".png")
+            self.cache = open_sample_cache(cache_dir, split, files)
+
+    def _sources(self):
+        """(kind, folder) of every image loaded per sample."""
+        sources = [("hr", self.hr_dir), ("lr", self.lr_dir)]
+        if self.teacher_dir:
+            sources.append(("teacher", self.teacher_dir))
+        return sources
 
     def __len__(self):
         return len(self.basenames)
 
-    def _load(self, path):
-        with Image.open(path) as im:
+    def _load(self, kind, base, folder):
+        if self.shards is not None and kind in ("hr", "lr"):
+            return Image.fromarray(self.shards.get(base, kind))
+        if self.cache is not None:
+            return Image.fromarray(self.cache.get(kind, base))
+        with Image.open(os.path.join(folder, base + ".png")) as im:
             return im.convert("RGB")
 
     def __getitem__(self, idx):
         base = self.basenames[idx]
-        hr_path = os.path.join(self.hr_dir, base + ".png")
-        lr_path = os.path.join(self.lr_dir, base + ".png")
-        hr = self._load(hr_path)
-        lr = self._load(lr_path)
+        images = {
+            kind: self._load(kind, base, folder) for kind, folder in self._sources()
+        }
+        lr = images.pop("lr")
+        # HR-resolution images (hr, teacher) that get exactly the same augmentation.
+        hr_like = images
 
         if self.augment:
             if random.random() < 0.5:
                 angle = random.choice([0, 90, 180, 270])
             else:
                 angle = random.uniform(-30, 30)
-            hr = hr.rotate(angle, resample=Image.Resampling.BICUBIC)
+            hr_like = {
+                k: im.rotate(angle, resample=Image.Resampling.BICUBIC)
+                for k, im in hr_like.items()
+            }
             lr = lr.rotate(angle, resample=Image.Resampling.BICUBIC)
 
             if random.random() < 0.5:
-                hr = HRLRDataset._vflip(hr)
+                hr_like = {k: HRLRDataset._vflip(im) for k, im in hr_like.items()}
                 lr = HRLRDataset._vflip(lr)
             if random.random() < 0.5:
-                hr = HRLRDataset._hflip(hr)
+                hr_like = {k: HRLRDataset._hflip(im) for k, im in hr_like.items()}
                 lr = HRLRDataset._hflip(lr)
 
-        hr_t = TF.to_tensor(hr)
-        lr_t = TF.to_tensor(lr)
-        return {"lr": lr_t, "hr": hr_t, "name": base}
+        sample = {k: TF.to_tensor(im) for k, im in hr_like.items()}
+        sample["lr"] = TF.to_tensor(lr)
+        sample["name"] = base
+        return sample
 
     @staticmethod
     def _hflip(im):
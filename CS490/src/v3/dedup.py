@@ -0,0 +1,212 @@
+"""
+Perceptual-hash index for near-duplicate source images and crops.
+
+Every image gets a 64-bit DCT hash (pHash): the sign pattern of the lowest
+8x8 DCT frequencies of a 32x32 grayscale thumbnail relative to their median.
+Re-scans and re-exports of the same page land within a few bits of each
+other. Optional tile hashes (the same hash over a grid of fixed-size tiles,
+blank tiles skipped) also catch sources that only share part of a page,
+e.g. overlapping crops from the same journal page.
+
+Lookups are a vectorized XOR + popcount over all stored hashes, so an index
+of a few hundred thousand hashes answers in milliseconds.
+
+Report near-duplicates of a source folder:
+    python dedup.py -s raw_source [--threshold 6] [--tile-size 256]
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+import argparse
+import os
+
+import cv2
+import numpy as np
+from PIL import Image
+
+HASH_SIZE = 8
+# Tiles whose grayscale std is below this are blank paper and not hashed.
+BLANK_STD = 4.0
+# Memory bound of one `HashIndex.pairs` step (64 MiB, e.g. about 80 rows
+# against 100k hashes).
+PAIRS_STEP_BYTES = 64 * 2**20
+
+
+def phash(img: np.ndarray) -> int:
+    """64-bit perceptual hash of an (H, W[, C]) uint8 image."""
+    gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY) if img.ndim == 3 else img
+    thumb = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA)
+    low = cv2.dct(thumb.astype(np.float32))[:HASH_SIZE, :HASH_SIZE].ravel()
+    # The DC term only encodes overall brightness.
+    bits = low > np.median(low[1:])
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def tile_hashes(img: np.ndarray, tile_size: int) -> list[int]:
+    """pHashes of the non-blank tiles of a tile_size grid over `img`."""
+    gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY) if img.ndim == 3 else img
+    h, w = gray.shape
+    hashes = []
+    for y in range(0, h - tile_size + 1, tile_size):
+        for x in range(0, w - tile_size + 1, tile_size):
+            tile = gray[y : y + tile_size, x : x + tile_size]
+            if tile.std() >= BLANK_STD:
+                hashes.append(phash(tile))
+    return hashes
+
+
+def hamming(a: np.ndarray, b: int | np.ndarray) -> np.ndarray:
+    return np.bitwise_count(np.bitwise_xor(a, np.asarray(b, dtype=np.uint64)))
+
+
+class HashIndex:
+    """
+    Hashes with an owner key each (one key may own several, e.g. tiles).
+    """
+
+    def __init__(self):
+        self._hashes = []
+        self._owners = []
+        self._array = None
+
+    def add(self, key: str, hashes: list[int]):
+        self._hashes.extend(hashes)
+        self._owners.extend([key] * len(hashes))
+        self._array = None
+
+    def _arrays(self) -> tuple[np.ndarray, np.ndarray]:
+        if self._array is None:
+            self._array = np.array(self._hashes, dtype=np.uint64)
+            self._owner_array = np.array(self._owners, dtype=object)
+        return self._array, self._owner_array
+
+    def query(self, h: int, threshold: int) -> set[str]:
+        """Keys owning a hash within `threshold` bits of `h`."""
+        hashes, owners = self._arrays()
+        if not len(hashes):
+            return set()
+        return set(owners[hamming(hashes, h) <= threshold])
+
+    def pairs(
+        self, threshold: int, step_bytes: int = PAIRS_STEP_BYTES
+    ) -> set[tuple[str, str]]:
+        """
+        All pairs of distinct keys with a hash within `threshold` bits. Each
+        step compares a block of hashes with all later ones; the block is
+        sized so the step's uint64 XOR matrix stays within `step_bytes`.
+        """
+        hashes, owners = self._arrays()
+        found = set()
+        start = 0
+        while start < len(hashes):
+            rows = max(1, step_bytes // (8 * (len(hashes) - start)))
+            block = hashes[start : start + rows, None]
+            # Upper triangle only: compare against this and later hashes.
+            i, j = np.nonzero(hamming(block, hashes[None, start:]) <= threshold)
+            for a, b in zip(owners[start + i], owners[start + j], strict=True):
+                if a != b:
+                    found.add((min(a, b), max(a, b)))
+            start += rows
+        return found
+
+
+def group_duplicates(keys: list[str], pairs: set[tuple[str, str]]) -> list[list[str]]:
+    """Connected components of `pairs` over `keys`, each sorted."""
+    parent = {k: k for k in keys}
+
+    def find(k):
+        while parent[k] != k:
+            parent[k] = parent[parent[k]]
+            k = parent[k]
+        return k
+
+    for a, b in pairs:
+        parent[find(a)] = find(b)
+    groups = {}
+    for k in keys:
+        groups.setdefault(find(k), []).append(k)
+    return [sorted(g) for g in groups.values()]
+
+
+def image_hashes(path: str, tile_size: int | None) -> dict:
+    """{"phash": int, "tiles": [int, ...]} of the image file at `path`."""
+    with Image.open(path) as im:
+        img = np.asarray(im.convert("RGB"))
+    return {
+        "phash": phash(img),
+        "tiles": tile_hashes(img, tile_size) if tile_size else [],
+    }
+
+
+def find_duplicates(
+    hashes: dict[str, dict], threshold: int, keep: list[str] | None = None
+) -> tuple[list[list[str]], dict[str, str]]:
+    """
+    Group images by near-duplicate whole-image or tile hashes and pick the
+    images to drop: those within `threshold` bits of a kept image as a
+    whole. Keys in `keep` (then sorted order) are kept first.
+
+    Returns (groups, {dropped key: key it duplicates}).
+    """
+    whole, tiles = HashIndex(), HashIndex()
+    for key, h in hashes.items():
+        whole.add(key, [h["phash"]])
+        tiles.add(key, h["tiles"])
+    groups = group_duplicates(
+        list(hashes), whole.pairs(threshold) | tiles.pairs(threshold)
+    )
+
+    keep = keep or []
+    dropped = {}
+    for group in groups:
+        kept = []
+        for key in sorted(group, key=lambda k: (k not in keep, k)):
+            h = hashes[key]["phash"]
+            match = next(
+                (k for k in kept if hamming(hashes[k]["phash"], h) <= threshold),
+                None,
+            )
+            if match is None or key in keep:
+                kept.append(key)
+            else:
+                dropped[key] = match
+    return groups, dropped
+
+
+def main():
+    p = argparse.ArgumentParser(description="Report near-duplicate source images")
+    p.add_argument("-s", "--source-dir", required=True)
+    p.add_argument("--threshold", type=int, default=6, help="Max differing bits")
+    p.add_argument(
+        "--tile-size",
+        type=int,
+        default=None,
+        help="Also match shared tiles of this size (partial overlaps)",
+    )
+    args = p.parse_args()
+
+    files = sorted(
+        f
+        for f in os.listdir(args.source_dir)
+        if f.lower().endswith((".png", ".jpg", ".jpeg", ".webp"))
+    )
+    hashes = {
+        f: image_hashes(os.path.join(args.source_dir, f), args.tile_size) for f in files
+    }
+    groups, dropped = find_duplicates(hashes, args.threshold)
+    for group in groups:
+        if len(group) > 1:
+            print("Group:", ", ".join(group))
+    for key, match in dropped.items():
+        print(f"Duplicate: {key} ~ {match}")
+    print(
+        f"{len(files)} images, {sum(len(g) > 1 for g in groups)} duplicate groups, "
+        f"{len(dropped)} redundant"
+    )
+
+
+if __name__ == "__main__":
+    main()
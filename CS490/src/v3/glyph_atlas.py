@@ -0,0 +1,131 @@
+"""
+Glyph-atlas renderer for the synthetic numbers data.
+
+The PIL renderer (`data_gen_synthetic._render_number_image`) loads a
+TrueType font, draws, rotates and alpha-pastes an RGBA image per number on a
+2x supersampled canvas. Here every digit is rasterized once per (font, size
+bucket) into an anti-aliased coverage mask; a number is the max of its digit
+masks side by side, rotated with one `cv2.warpAffine` and blended straight
+into a uint8 canvas at the target resolution.
+"""
+
+import math
+import random
+
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+DIGITS = "0123456789"
+# Font sizes are snapped to ~4% steps; the difference is below what the
+# random size range can show, and it bounds the number of atlas entries.
+SIZE_STEP = 1.04
+
+
+class GlyphAtlas:
+    """
+    Digit coverage masks per (font path, size bucket), built on first use.
+    Caches are dropped when pickled, so DataLoader workers build their own
+    instead of receiving copies.
+
+    Args:
+        fonts: TrueType font paths; PIL's default font when empty
+    """
+
+    def __init__(self, fonts: list[str]):
+        self.fonts = fonts
+        self._glyphs = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_glyphs"] = {}
+        return state
+
+    @staticmethod
+    def bucket(size: float) -> int:
+        return max(1, round(SIZE_STEP ** round(math.log(max(size, 1), SIZE_STEP))))
+
+    def _load_font(self, font_path: str | None, size: int):
+        try:
+            if font_path:
+                return ImageFont.truetype(font_path, size)
+            return ImageFont.load_default(size)
+        except OSError:  # unreadable or unsupported font file
+            return ImageFont.load_default()
+
+    def glyphs(self, font_path: str | None, size: int) -> dict[str, np.ndarray]:
+        """Masks of all digits, drawn on a common baseline."""
+        key = (font_path, size)
+        if key not in self._glyphs:
+            font = self._load_font(font_path, size)
+            ascent, descent = font.getmetrics()
+            masks = {}
+            for d in DIGITS:
+                im = Image.new("L", (math.ceil(font.getlength(d)), ascent + descent))
+                ImageDraw.Draw(im).text((0, 0), d, font=font, fill=255)
+                masks[d] = np.asarray(im)
+            self._glyphs[key] = masks
+        return self._glyphs[key]
+
+    def text_mask(self, text: str, font_path: str | None, size: int) -> np.ndarray:
+        """(H, W) uint8 coverage of `text` set without kerning."""
+        glyphs = [self.glyphs(font_path, size)[d] for d in text]
+        mask = np.zeros(
+            (glyphs[0].shape[0], sum(g.shape[1] for g in glyphs)), dtype=np.uint8
+        )
+        x = 0
+        for g in glyphs:
+            region = mask[:, x : x + g.shape[1]]
+            np.maximum(region, g, out=region)
+            x += g.shape[1]
+        return mask
+
+
+def _rotate_mask(mask: np.ndarray, angle: float) -> np.ndarray:
+    """Rotate counter-clockwise, expanding the bounds (like PIL expand=True)."""
+    if angle % 90 == 0:
+        return np.rot90(mask, int(angle) // 90)
+    h, w = mask.shape
+    rad = math.radians(angle)
+    cos, sin = abs(math.cos(rad)), abs(math.sin(rad))
+    nw, nh = math.ceil(w * cos + h * sin), math.ceil(w * sin + h * cos)
+    m = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+    m[0, 2] += nw / 2 - w / 2
+    m[1, 2] += nh / 2 - h / 2
+    return cv2.warpAffine(mask, m, (nw, nh), flags=cv2.INTER_CUBIC, borderValue=0)
+
+
+def _blend(canvas: np.ndarray, mask: np.ndarray, x: int, y: int, color):
+    """Alpha-blend `color` into `canvas` with coverage `mask` at (x, y)."""
+    mask = mask[: canvas.shape[0] - y, : canvas.shape[1] - x]
+    h, w = mask.shape
+    region = canvas[y : y + h, x : x + w]
+    alpha = mask[..., None].astype(np.float32) / 255
+    region[:] = region + (np.asarray(color, np.float32) - region) * alpha
+
+
+def render_numbers(hr_size: int, atlas: GlyphAtlas, max_digits: int = 5) -> np.ndarray:
+    """
+    (hr_size, hr_size, 3) uint8 page of 1-40 small, dark, rotated numbers on
+    white; same random distribution as `_render_number_image`.
+    """
+    canvas = np.full((hr_size, hr_size, 3), 255, dtype=np.float32)
+    n_numbers = random.randint(1, 40)
+    for _ in range(n_numbers):
+        n_digits = random.randint(1, min(2, max_digits))
+        txt = "".join(str(random.randint(0, 9)) for _ in range(n_digits))
+
+        font_path = random.choice(atlas.fonts) if atlas.fonts else None
+        size = atlas.bucket(hr_size * random.uniform(0.06, 0.3 / n_numbers**0.5))
+        color = tuple(random.randint(0, 80) for _ in range(3))
+
+        if random.random() < 0.5:
+            angle = random.choice([0, 90, 180, 270])
+        else:
+            angle = random.uniform(-30, 30)
+        mask = _rotate_mask(atlas.text_mask(txt, font_path, size), angle)
+
+        x = random.randint(0, max(0, hr_size - mask.shape[1]))
+        y = random.randint(0, max(0, hr_size - mask.shape[0]))
+        _blend(canvas, mask, x, y, color)
+    return canvas.round().astype(np.uint8)
@@ -32,16 +32,19 @@ def add_gaussian_noise(image, std):
     return Image.fromarray(noisy_img)
 
 
+# Filters `downscale` and `degrade_array` draw the LR resize from.
+RESAMPLE_METHODS = [
+    Image.Resampling.BICUBIC,
+    Image.Resampling.LANCZOS,
+    Image.Resampling.BILINEAR,
+    Image.Resampling.BOX,
+]
+
+
 def downscale(img: Image.Image, min_size: int, scale=2):
     lr_size = min_size // scale
 
-    resample_methods = [
-        Image.Resampling.BICUBIC,
-        Image.Resampling.LANCZOS,
-        Image.Resampling.BILINEAR,
-        Image.Resampling.BOX,
-    ]
-    method = random.choice(resample_methods)
+    method = random.choice(RESAMPLE_METHODS)
 
     if random.random() < 0.3:
         img = img.filter(ImageFilter.GaussianBlur(radius=random.uniform(0.2, 0.7)))
@@ -62,13 +65,201 @@ def degrade(img: Image.Image):
     return img
 
 
-def bileteral_smooth(img: Image.Image):
-    d_val = 7
-    sigma_color = 75
-    sigma_space = 75
+# Gray level below which a pixel counts as ink, and the grid (in pixels) of
+# the content map used for crop sampling.
+INK_LEVEL = 200
+CONTENT_CELL = 8
+
+
+class ContentCrops:
+    """
+    Samples crop positions proportionally to ink coverage, so that crops of
+    mostly blank schematic pages land on drawn content. The page is reduced
+    once to per-cell ink fractions; the coverage of every crop window on
+    that grid comes from an integral image. A crop starts anywhere within
+    its first grid cell, so a window counts only the cells it contains at
+    every such offset (all but its last row and column of cells); with
+    floor 0 a crop therefore always contains ink.
+
+    Args:
+        np_img: (H, W[, C]) uint8 source page
+        crop_size: crop side in pixels
+        floor: weight of a blank crop relative to the densest one; 1 gives
+            uniform sampling, 0 never picks blank crops
+    """
+
+    def __init__(self, np_img: np.ndarray, crop_size: int, floor: float = 0.1):
+        gray = cv2.cvtColor(np_img, cv2.COLOR_RGB2GRAY) if np_img.ndim == 3 else np_img
+        self.h, self.w = gray.shape
+        self.crop_size = crop_size
+        ink = (gray < INK_LEVEL).astype(np.float32)
+        rows, cols = self.h // CONTENT_CELL, self.w // CONTENT_CELL
+        density = cv2.resize(ink, (cols, rows), interpolation=cv2.INTER_AREA)
+        k = crop_size // CONTENT_CELL
+        self.cdf = None
+        if k < 2 or rows < k or cols < k:
+            return  # cells coarser than the crop: sample uniformly
+        # Window (r, c) spans cells r..r+k-1; cells r+1..r+k-1 are covered
+        # by the crop at any offset within cell r.
+        s = cv2.integral(density)[1:, 1:]
+        coverage = (
+            s[k - 1 :, k - 1 :]
+            - s[: 1 - k, k - 1 :]
+            - s[k - 1 :, : 1 - k]
+            + s[: 1 - k, : 1 - k]
+        )
+        if coverage.max() <= 0:
+            return  # blank page
+        weights = floor + (1 - floor) * coverage / coverage.max()
+        self.cols = weights.shape[1]
+        self.cdf = np.cumsum(weights.ravel())
+
+    def position(self, rng: np.random.Generator) -> tuple[int, int]:
+        """(top, left) of a crop; uniform within the drawn grid cell."""
+        if self.cdf is None:
+            return (
+                int(rng.integers(0, self.h - self.crop_size + 1)),
+                int(rng.integers(0, self.w - self.crop_size + 1)),
+            )
+        i = int(np.searchsorted(self.cdf, rng.random() * self.cdf[-1], side="right"))
+        row, col = divmod(min(i, len(self.cdf) - 1), self.cols)
+        top = row * CONTENT_CELL + int(rng.integers(CONTENT_CELL))
+        left = col * CONTENT_CELL + int(rng.integers(CONTENT_CELL))
+        return min(top, self.h - self.crop_size), min(left, self.w - self.crop_size)
+
+
+def crop_and_rotate_array(
+    np_img: np.ndarray,
+    min_size: int,
+    rng: np.random.Generator,
+    content: ContentCrops | None = None,
+) -> np.ndarray:
+    """
+    `crop_and_rotate` on a uint8 array, drawing from `rng`; crop positions
+    follow `content` when given, else they are uniform.
+    """
+    h, w = np_img.shape[:2]
+    if content is not None:
+        top, left = content.position(rng)
+    else:
+        top = int(rng.integers(0, h - min_size + 1))
+        left = int(rng.integers(0, w - min_size + 1))
+    crop = np.ascontiguousarray(np_img[top : top + min_size, left : left + min_size])
+
+    if rng.random() < 0.5:
+        k = int(rng.integers(0, 4))
+        return np.ascontiguousarray(np.rot90(crop, k)) if k else crop
+    angle = rng.uniform(-30, 30)
+    center = ((min_size - 1) / 2, (min_size - 1) / 2)
+    m = cv2.getRotationMatrix2D(center, angle, 1.0)
+    return cv2.warpAffine(
+        crop, m, (min_size, min_size), flags=cv2.INTER_CUBIC, borderValue=0
+    )
+
+
+def _box_blur_array(np_img: np.ndarray, radius: float) -> np.ndarray:
+    """PIL's BoxBlur: a 2r+1 box where a fractional radius weights the ends."""
+    n = int(radius)
+    frac = radius - n
+    kernel = np.array([frac] + [1.0] * (2 * n + 1) + [frac], dtype=np.float32)
+    kernel /= kernel.sum()
+    return cv2.sepFilter2D(np_img, -1, kernel, kernel)
+
+
+def _resize_array(np_img: np.ndarray, size: tuple[int, int], method) -> np.ndarray:
+    """
+    PIL resize of a uint8 (H, W[, C]) array to `size` (w, h); one channel
+    comes back as (h, w). Unlike cv2, whose cubic, Lanczos and linear
+    kernels keep their fixed support, PIL widens the filter by the shrink
+    factor, so thin lines are averaged instead of aliased.
+    """
+    if np_img.ndim == 3 and np_img.shape[2] == 1:
+        np_img = np_img[:, :, 0]
+    return np.array(Image.fromarray(np_img).resize(size, resample=method))
+
+
+def degrade_array(hr: np.ndarray, scale: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    `degrade(downscale(hr))` on a uint8 (H, W, C) array: optional pre-blur,
+    resize with a random filter, optional gaussian or box blur, then
+    gaussian noise, with the same probabilities and ranges as the PIL
+    versions. The resize itself goes through PIL for its antialiasing; the
+    rest runs on whole arrays in cv2/NumPy, cheap enough to synthesize a
+    fresh LR for every access inside the loader workers.
+    """
+    img = hr
+    if rng.random() < 0.3:
+        img = cv2.GaussianBlur(img, (0, 0), rng.uniform(0.2, 0.7))
+    lr_size = (hr.shape[1] // scale, hr.shape[0] // scale)
+    method = RESAMPLE_METHODS[int(rng.integers(len(RESAMPLE_METHODS)))]
+    img = _resize_array(img, lr_size, method)
+
+    blur_type = rng.choice(["none", "gaussian", "box"])
+    if blur_type == "gaussian":
+        img = cv2.GaussianBlur(img, (0, 0), rng.uniform(0.5, 1.5))
+    elif blur_type == "box":
+        img = _box_blur_array(img, rng.uniform(0.5, 1.2))
+
+    if rng.random() > 0.3:
+        noise = rng.normal(0, rng.uniform(2, 8), img.shape).astype(np.float32)
+        img = np.clip(img + noise, 0, 255).astype(np.uint8)
+    return img.reshape(img.shape[0], img.shape[1], hr.shape[2])
+
+
+# Bilateral filter parameters shared by the full-image and the per-tile path.
+BILATERAL_D = 7
+BILATERAL_SIGMA_COLOR = 75
+BILATERAL_SIGMA_SPACE = 75
+# Neighbourhood radius of the filter: a tile needs this many extra pixels on
+# each side to be filtered exactly like the corresponding region of the image.
+BILATERAL_HALO = BILATERAL_D // 2
+
+
+def bilateral_smooth_array(np_img: np.ndarray) -> np.ndarray:
+    """
+    Edge-preserving smoothing of a uint8 array, RGB (H, W, 3) or luma (H, W, 1).
+
+    Works directly on arrays so the tiling engine can filter tiles without
+    round-tripping through PIL.
+    """
+    if np_img.shape[2] == 1:
+        # OpenCV measures color distance as the L1 sum over channels, so a
+        # gray image replicated to RGB sees 3x the single-channel distance.
+        filtered = cv2.bilateralFilter(
+            np_img[:, :, 0],
+            BILATERAL_D,
+            BILATERAL_SIGMA_COLOR / 3,
+            BILATERAL_SIGMA_SPACE,
+        )
+        return filtered[:, :, None]
 
-    np_img = np.array(img)
     bgr = cv2.cvtColor(np_img, cv2.COLOR_RGB2BGR)
-    filtered = cv2.bilateralFilter(bgr, d_val, sigma_color, sigma_space)
-    filtered_rgb = cv2.cvtColor(filtered, cv2.COLOR_BGR2RGB)
-    return Image.fromarray(filtered_rgb)
+    filtered = cv2.bilateralFilter(
+        bgr, BILATERAL_D, BILATERAL_SIGMA_COLOR, BILATERAL_SIGMA_SPACE
+    )
+    return cv2.cvtColor(filtered, cv2.COLOR_BGR2RGB)
+
+
+def is_grayscale(
+    np_img: np.ndarray, tol: int = 12, max_color_fraction: float = 0.001
+) -> bool:
+    """
+    Whether an RGB uint8 image is effectively gray.
+
+    Scans and JPEGs carry some chroma noise, so a pixel only counts as colored
+    when its channels differ by more than `tol`, and the image is gray while
+    such pixels are rarer than `max_color_fraction`. A strided subsample keeps
+    the check cheap on full pages.
+    """
+    sample = np_img[::2, ::2].astype(np.int16)
+    spread = sample.max(axis=2) - sample.min(axis=2)
+    return bool(np.count_nonzero(spread > tol) <= max_color_fraction * spread.size)
+
+
+def rgb_to_luma(np_img: np.ndarray) -> np.ndarray:
+    """RGB uint8 (H, W, 3) -> luma uint8 (H, W, 1)."""
+    return cv2.cvtColor(np_img, cv2.COLOR_RGB2GRAY)[:, :, None]
+
+
+def bileteral_smooth(img: Image.Image):
+    return Image.fromarray(bilateral_smooth_array(np.array(img)))
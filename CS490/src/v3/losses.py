@@ -0,0 +1,272 @@
+"""
+Fine-tuning losses, evaluated together by `FusedLoss`.
+
+The terms used to be independent callables that each redid their setup per
+step: the Sobel kernel and the SSIM window were rebuilt (and copied to the
+device) on every call, and the grayscale conversion ran once per term for
+both images. `FusedLoss` keeps the kernels as buffers, converts each image
+to gray once, computes everything that only depends on the HR target
+(Sobel magnitude, soft binarization, SSIM mean/variance) under `no_grad`,
+and blurs all SSIM moments of one image in a single grouped convolution
+with the separable Gaussian window.
+"""
+
+import torch
+import torch.nn.functional as F
+from torch import nn
+from torchvision.models import VGG16_Weights, vgg16
+
+# Luminance weights, the same as `output_modes` uses for gray output.
+GRAY_WEIGHTS = (0.2989, 0.5870, 0.1140)
+SOBEL_X = (
+    (-1, -2, 0, 2, 1),
+    (-2, -3, 0, 3, 2),
+    (-3, -5, 0, 5, 3),
+    (-2, -3, 0, 3, 2),
+    (-1, -2, 0, 2, 1),
+)
+# End (exclusive) of each usable feature layer in vgg16().features.
+VGG_LAYERS = {"relu2_2": 9, "relu3_3": 16}
+SSIM_C1 = 0.01**2
+SSIM_C2 = 0.03**2
+
+
+def _rgb_to_gray(x: torch.Tensor) -> torch.Tensor:
+    if x.size(1) == 1:
+        return x
+
+    r, g, b = x[:, 0:1, :, :], x[:, 1:2, :, :], x[:, 2:3, :, :]
+    return GRAY_WEIGHTS[0] * r + GRAY_WEIGHTS[1] * g + GRAY_WEIGHTS[2] * b
+
+
+def _soft_bin(x: torch.Tensor, k: float = 50.0, thresh: float = 0.1) -> torch.Tensor:
+    return torch.sigmoid(k * (x - thresh))
+
+
+def gaussian_window(window_size, sigma):
+    gauss = torch.exp(
+        -((torch.arange(window_size).float() - window_size // 2) ** 2) / (2 * sigma**2)
+    )
+    return gauss / gauss.sum()
+
+
+def _blur(x: torch.Tensor, window: torch.Tensor) -> torch.Tensor:
+    """
+    Per-channel Gaussian blur with the 1D `window`, zero padded. Two 1D
+    passes equal the 2D outer-product window at 2k instead of k*k MACs.
+    """
+    c, k = x.size(1), window.numel()
+    x = F.conv2d(
+        x, window.view(1, 1, k, 1).expand(c, 1, k, 1), padding=(k // 2, 0), groups=c
+    )
+    return F.conv2d(
+        x, window.view(1, 1, 1, k).expand(c, 1, 1, k), padding=(0, k // 2), groups=c
+    )
+
+
+def _ssim_map(mu1, mu2, sigma1_sq, sigma2_sq, sigma12) -> torch.Tensor:
+    mu1_mu2 = mu1 * mu2
+    return ((2 * mu1_mu2 + SSIM_C1) * (2 * sigma12 + SSIM_C2)) / (
+        (mu1 * mu1 + mu2 * mu2 + SSIM_C1) * (sigma1_sq + sigma2_sq + SSIM_C2)
+    )
+
+
+def ssim(img1, img2, window_size=11, size_average=True):
+    channel = img1.size(1)
+    window = gaussian_window(window_size, 1.5).to(img1.device, img1.dtype)
+    mu1, mu2, e11, e22, e12 = _blur(
+        torch.cat([img1, img2, img1 * img1, img2 * img2, img1 * img2], 1), window
+    ).split(channel, 1)
+    ssim_map = _ssim_map(mu1, mu2, e11 - mu1 * mu1, e22 - mu2 * mu2, e12 - mu1 * mu2)
+
+    if size_average:
+        return ssim_map.mean()
+    else:
+        return ssim_map.mean(1).mean(1).mean(1)
+
+
+class PerceptualLoss(nn.Module):
+    """
+    L1 between VGG16 features of the output and the target. Target features
+    are computed without autograd. The options trade exactness for speed:
+
+    Args:
+        lambda_vgg: loss weight
+        layer: feature layer; relu2_2 costs about half of relu3_3 per pixel
+        every: apply on every n-th training step only, weighted by n so the
+            expected gradient (and the logged average) stays the same
+        crop: during training, compare one random crop of this size per
+            batch instead of the whole images
+        cache: keep the target features per sample name (float16, on the
+            CPU); only valid when a sample's HR is the same every epoch
+        bf16: run the extractor under bfloat16 autocast, channels_last
+        pretrained: ImageNet weights; random ones only for timing
+    """
+
+    def __init__(
+        self,
+        lambda_vgg=0.1,
+        layer: str = "relu3_3",
+        every: int = 1,
+        crop: int | None = None,
+        cache: bool = False,
+        bf16: bool = False,
+        pretrained: bool = True,
+    ):
+        super().__init__()
+        self.lambda_vgg = lambda_vgg
+        self.every = max(1, every)
+        self.crop = crop
+        self.cache = {} if cache else None
+        self.bf16 = bf16
+        self._step = 0
+
+        weights = VGG16_Weights.IMAGENET1K_V1 if pretrained else None
+        vgg = vgg16(weights=weights).features[: VGG_LAYERS[layer]].eval()
+        for p in vgg.parameters():
+            p.requires_grad = False
+        if bf16:
+            vgg = vgg.to(memory_format=torch.channels_last)
+
+        self.vgg = vgg
+        self.register_buffer(
+            "mean", torch.tensor([0.485, 0.456, 0.406]).view(1, 3, 1, 1)
+        )
+        self.register_buffer(
+            "std", torch.tensor([0.229, 0.224, 0.225]).view(1, 3, 1, 1)
+        )
+
+    def _features(self, x: torch.Tensor) -> torch.Tensor:
+        x = (x - self.mean) / self.std
+        if not self.bf16:
+            return self.vgg(x)
+        x = x.contiguous(memory_format=torch.channels_last)
+        with torch.autocast(x.device.type, dtype=torch.bfloat16):
+            return self.vgg(x).float()
+
+    @torch.no_grad()
+    def _target_features(self, y: torch.Tensor, names) -> torch.Tensor:
+        if self.cache is None or names is None:
+            return self._features(y)
+        missing = [i for i, name in enumerate(names) if name not in self.cache]
+        if missing:
+            feats = self._features(y[missing]).to("cpu", torch.float16)
+            for i, f in zip(missing, feats, strict=True):
+                self.cache[names[i]] = f
+        feats = torch.stack([self.cache[name] for name in names])
+        return feats.to(y.device, non_blocking=True).float()
+
+    def _random_crop(self, x: torch.Tensor, y: torch.Tensor):
+        h, w = x.shape[-2:]
+        top = int(torch.randint(h - self.crop + 1, ()))
+        left = int(torch.randint(w - self.crop + 1, ()))
+        window = (..., slice(top, top + self.crop), slice(left, left + self.crop))
+        return x[window], y[window]
+
+    def forward(self, x, y, names=None):
+        if self.lambda_vgg <= 0:
+            return None
+        weight = self.lambda_vgg
+        # Validation runs without autograd and always sees the full term.
+        if torch.is_grad_enabled():
+            self._step += 1
+            if (self._step - 1) % self.every:
+                return None
+            weight *= self.every
+            if self.crop and self.crop < min(x.shape[-2:]):
+                x, y = self._random_crop(x, y)
+                names = None
+        loss = F.l1_loss(self._features(x), self._target_features(y, names))
+        return loss * weight
+
+
+class FusedLoss(nn.Module):
+    """
+    All HR reconstruction terms of a fine-tuning step in one pass. Returns
+    {name: weighted loss} for the enabled (positive weight) terms, in the
+    order l1, edge, bin, vgg, ssim; the step loss is their sum.
+
+    Args:
+        lambda_l1: weight of the pixel L1 loss
+        lambda_edge: weight of the L1 between Sobel gradient magnitudes
+        lambda_bin: weight of the L1 between soft-binarized gray images
+        bin_k, bin_thresh: sigmoid sharpness and threshold of the binarization
+        lambda_ssim: weight of 1 - SSIM
+        window_size: SSIM Gaussian window size
+        perceptual: optional `PerceptualLoss`, given the sample names
+    """
+
+    def __init__(
+        self,
+        lambda_l1: float = 1.0,
+        lambda_edge: float = 0.0,
+        lambda_bin: float = 0.0,
+        bin_k: float = 20.0,
+        bin_thresh: float = 0.1,
+        lambda_ssim: float = 0.0,
+        window_size: int = 11,
+        perceptual: PerceptualLoss | None = None,
+    ):
+        super().__init__()
+        self.lambda_l1 = float(lambda_l1)
+        self.lambda_edge = float(lambda_edge)
+        self.lambda_bin = float(lambda_bin)
+        self.bin_k = float(bin_k)
+        self.bin_thresh = float(bin_thresh)
+        self.lambda_ssim = float(lambda_ssim)
+        self.perceptual = perceptual
+
+        sobel_x = torch.tensor(SOBEL_X, dtype=torch.float32)
+        self.register_buffer("sobel", torch.stack([sobel_x, sobel_x.t()])[:, None])
+        self.register_buffer("window", gaussian_window(window_size, 1.5))
+
+    def _sobel_mag(self, gray: torch.Tensor) -> torch.Tensor:
+        grad = F.conv2d(gray, self.sobel.to(gray.dtype), padding=2)
+        return torch.sqrt((grad * grad).sum(1, keepdim=True) + 1e-12)
+
+    def _targets(self, hr: torch.Tensor) -> dict[str, torch.Tensor]:
+        """Everything the enabled terms need from `hr` alone."""
+        targets = {}
+        if self.lambda_edge > 0 or self.lambda_bin > 0:
+            gray = _rgb_to_gray(hr)
+            if self.lambda_edge > 0:
+                targets["edge"] = self._sobel_mag(gray)
+            if self.lambda_bin > 0:
+                targets["bin"] = _soft_bin(gray, self.bin_k, self.bin_thresh)
+        if self.lambda_ssim > 0:
+            window = self.window.to(hr.dtype)
+            mu, e2 = _blur(torch.cat([hr, hr * hr], 1), window).chunk(2, 1)
+            targets["ssim_mu"], targets["ssim_var"] = mu, e2 - mu * mu
+        return targets
+
+    def _ssim(self, out, hr, targets) -> torch.Tensor:
+        mu2, sigma2_sq = targets["ssim_mu"], targets["ssim_var"]
+        mu1, e11, e12 = _blur(
+            torch.cat([out, out * out, out * hr], 1), self.window.to(out.dtype)
+        ).chunk(3, 1)
+        return _ssim_map(mu1, mu2, e11 - mu1 * mu1, sigma2_sq, e12 - mu1 * mu2).mean()
+
+    def forward(
+        self, out: torch.Tensor, hr: torch.Tensor, names: list[str] | None = None
+    ) -> dict[str, torch.Tensor]:
+        with torch.no_grad():
+            targets = self._targets(hr)
+
+        terms = {}
+        if self.lambda_l1 > 0:
+            terms["l1"] = F.l1_loss(out, hr) * self.lambda_l1
+        if self.lambda_edge > 0 or self.lambda_bin > 0:
+            gray = _rgb_to_gray(out)
+            if self.lambda_edge > 0:
+                edge = F.l1_loss(self._sobel_mag(gray), targets["edge"])
+                terms["edge"] = edge * self.lambda_edge
+            if self.lambda_bin > 0:
+                soft = _soft_bin(gray, self.bin_k, self.bin_thresh)
+                terms["bin"] = F.l1_loss(soft, targets["bin"]) * self.lambda_bin
+        if self.perceptual is not None:
+            vgg = self.perceptual(out, hr, names)
+            if vgg is not None:
+                terms["vgg"] = vgg
+        if self.lambda_ssim > 0:
+            terms["ssim"] = (1 - self._ssim(out, hr, targets)) * self.lambda_ssim
+        return terms
@@ -0,0 +1,87 @@
+"""
+Per-machine performance profiles.
+
+`autotune.py` measures the best torch thread counts, tile batch and chop size
+for the current machine and stores them here; `run_model.py` and
+`run_fine_tune.py` read the profile at startup and use its values for every
+setting that was not given explicitly on the command line.
+"""
+
+import json
+import os
+import platform
+import socket
+
+import torch
+
+# Overrides the profile location, e.g. to share one profile between
+# identical cluster nodes.
+PROFILE_ENV = "NINASR_PROFILE"
+
+
+def profile_path() -> str:
+    if os.environ.get(PROFILE_ENV):
+        return os.environ[PROFILE_ENV]
+    cache = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+    return os.path.join(cache, "cs490-ninasr", f"{socket.gethostname()}.json")
+
+
+def machine_info() -> dict:
+    """Identifies the hardware a profile was measured on."""
+    return {
+        "hostname": socket.gethostname(),
+        "cpu_count": os.cpu_count(),
+        "processor": platform.processor() or platform.machine(),
+        "torch": torch.__version__,
+    }
+
+
+def load_profile(path: str | None = None) -> dict:
+    """
+    Return the saved profile, or {} when there is none or it was measured on
+    a machine with a different CPU count (e.g. a copied home directory).
+    """
+    path = path or profile_path()
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        profile = json.load(f)
+    if profile.get("machine", {}).get("cpu_count") != os.cpu_count():
+        print(f"Ignoring profile {path}: measured on a different machine")
+        return {}
+    return profile
+
+
+def save_profile(profile: dict, path: str | None = None) -> str:
+    path = path or profile_path()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({**profile, "machine": machine_info()}, f, indent=2)
+    return path
+
+
+def apply_threads(num_threads: int | None, interop_threads: int | None):
+    """
+    Configure torch's intra-op and inter-op pools. Must run before the first
+    parallel torch operation, since the inter-op pool can only be sized once.
+    """
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    if interop_threads:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError as e:
+            print(f"Could not set inter-op threads: {e}")
+
+
+def resolve_settings(args, section: dict, keys: list[str]):
+    """
+    Fill every `args.<key>` that is None from the profile section.
+
+    Command-line values always win; keys missing from both stay None so the
+    caller's own defaults apply.
+    """
+    opts = vars(args)  # the namespace's own dict, so updates stick
+    for key in keys:
+        if opts[key] is None and key in section:
+            opts[key] = section[key]
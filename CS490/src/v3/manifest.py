@@ -0,0 +1,77 @@
+"""
+Provenance manifest of a generated dataset.
+
+{output_dir}/manifest.json records, per source file, what was generated
+from it:
+
+    {"sources": {filename: {"sha256": ..., "size": ..., "mtime_ns": ...,
+                            "split": "train" | "val",
+                            "params": {generator parameters},
+                            "samples": [sample names]}}}
+
+`generate_dataset` uses it to regenerate only added or changed sources,
+delete the samples of removed ones and keep every source in its split.
+A source counts as changed when its content hash or the generator
+parameters differ; size and mtime only skip rehashing untouched files.
+"""
+
+import hashlib
+import json
+import os
+
+MANIFEST_NAME = "manifest.json"
+
+
+def _sha256(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+class Manifest:
+    def __init__(self, output_dir: str):
+        self.path = os.path.join(output_dir, MANIFEST_NAME)
+        self.sources = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.sources = json.load(f)["sources"]
+
+    def is_current(self, filename: str, path: str, params: dict) -> bool:
+        """Whether `filename`'s samples were generated from this content and params."""
+        entry = self.sources.get(filename)
+        if entry is None or entry["params"] != params:
+            return False
+        st = os.stat(path)
+        if [entry["size"], entry["mtime_ns"]] == [st.st_size, st.st_mtime_ns]:
+            return True
+        if entry["sha256"] != _sha256(path):
+            return False
+        # Touched but identical: remember the new mtime to skip the hash.
+        entry["size"], entry["mtime_ns"] = st.st_size, st.st_mtime_ns
+        return True
+
+    def record(
+        self,
+        filename: str,
+        path: str,
+        split: str,
+        params: dict,
+        samples: list[str],
+        **extra,
+    ):
+        """Store an entry; `extra` fields (e.g. dedup hashes) are kept as is."""
+        st = os.stat(path)
+        self.sources[filename] = {
+            "sha256": _sha256(path),
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "split": split,
+            "params": params,
+            "samples": samples,
+            **extra,
+        }
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"sources": self.sources}, f, indent=1)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,50 @@
+"""
+Sample-weighted metric averages that do not synchronize with the device.
+
+Reading a CUDA tensor back (`.item()`, `float()`) blocks until every queued
+kernel has run, so doing it for each loss term of each step keeps the host
+from queueing the next step ahead. `MetricSums` only adds batch values
+into device tensors; `means()` copies all sums back in one transfer when
+the caller actually logs.
+"""
+
+import torch
+
+
+class MetricSums:
+    """
+    Running sums of batch-mean metrics weighted by batch size, plus the
+    number of samples added. A metric missing from some batches (e.g. a
+    loss term that only runs every few steps) still averages over all
+    samples.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._sums = {}
+
+    def add(self, values: dict[str, torch.Tensor | float], n: int):
+        """Add batch means (tensors stay on their device) of `n` samples."""
+        for name, value in values.items():
+            if isinstance(value, torch.Tensor):
+                value = value.detach()
+            total = value * n
+            self._sums[name] = (
+                total if name not in self._sums else self._sums[name] + total
+            )
+        self.count += n
+
+    def sums(self) -> dict[str, float]:
+        tensors = {k: v for k, v in self._sums.items() if isinstance(v, torch.Tensor)}
+        sums = {k: float(v) for k, v in self._sums.items() if k not in tensors}
+        if tensors:
+            values = torch.stack([v.float() for v in tensors.values()]).tolist()
+            sums.update(zip(tensors, values, strict=True))
+        return {k: sums[k] for k in self._sums}
+
+    def means(self) -> dict[str, float]:
+        return {k: v / max(self.count, 1) for k, v in self.sums().items()}
+
+
+def format_metrics(means: dict[str, float]) -> str:
+    return " ".join(f"{k.upper()}={means[k]:.6f}" for k in sorted(means))
@@ -144,8 +144,9 @@ class AttentionBlock(nn.Module):
     Squeeze-Excite attention block, with local pooling.
     """
 
-    def __init__(self, n_feats, reduction=4, stride=16):
+    def __init__(self, n_feats, reduction=4, stride=16, hidden_feats=None):
         super(AttentionBlock, self).__init__()
+        hidden_feats = hidden_feats or n_feats // reduction
         self.body = nn.Sequential(
             nn.AvgPool2d(
                 2 * stride - 1,
@@ -153,9 +154,9 @@ class AttentionBlock(nn.Module):
                 padding=stride - 1,
                 count_include_pad=False,
             ),
-            nn.Conv2d(n_feats, n_feats // reduction, 1, bias=True),
+            nn.Conv2d(n_feats, hidden_feats, 1, bias=True),
             nn.ReLU(True),
-            nn.Conv2d(n_feats // reduction, n_feats, 1, bias=True),
+            nn.Conv2d(hidden_feats, n_feats, 1, bias=True),
             nn.Sigmoid(),
             nn.Upsample(scale_factor=stride, mode="nearest"),
         )
@@ -167,25 +168,87 @@ class AttentionBlock(nn.Module):
         return res * x
 
 
+class RepConv(nn.Conv2d):
+    """
+    3x3 conv trained with an extra parallel 1x1 branch (and an identity
+    branch when input and output widths match), RepVGG style. All branches
+    are linear, so `fuse_repconv_state_dict` folds them into the 3x3 kernel
+    and the deployed model is a plain conv. The 3x3 weights keep the
+    `nn.Conv2d` parameter names, so stock checkpoints load into it directly;
+    the 1x1 branch starts at zero and the block starts as the stock conv.
+    """
+
+    def __init__(self, in_channels, out_channels, bias=True):
+        super(RepConv, self).__init__(
+            in_channels, out_channels, 3, padding=1, bias=bias
+        )
+        self.branch_1x1 = nn.Conv2d(in_channels, out_channels, 1, bias=False)
+        nn.init.zeros_(self.branch_1x1.weight)
+        self.identity = in_channels == out_channels
+
+    def forward(self, x):
+        out = super(RepConv, self).forward(x) + self.branch_1x1(x)
+        return out + x if self.identity else out
+
+
+def separable_conv(in_channels, out_channels, bias=True) -> nn.Sequential:
+    """Depthwise 3x3 followed by a pointwise 1x1 conv."""
+    depthwise = nn.Conv2d(
+        in_channels, in_channels, 3, padding=1, groups=in_channels, bias=False
+    )
+    pointwise = nn.Conv2d(in_channels, out_channels, 1, bias=bias)
+    nn.init.kaiming_normal_(pointwise.weight)
+    if bias:
+        nn.init.zeros_(pointwise.bias)
+    return nn.Sequential(depthwise, pointwise)
+
+
+BLOCK_TYPES = ["standard", "repconv", "dwsep"]
+
+
+def _block_conv(block_type, in_channels, out_channels, bias) -> nn.Module:
+    if block_type == "dwsep":
+        return separable_conv(in_channels, out_channels, bias=bias)
+    if block_type == "repconv":
+        conv = RepConv(in_channels, out_channels, bias=bias)
+    elif block_type == "standard":
+        conv = nn.Conv2d(in_channels, out_channels, 3, padding=1, bias=bias)
+    else:
+        raise ValueError(f"Unknown block type '{block_type}', expected {BLOCK_TYPES}")
+    nn.init.kaiming_normal_(conv.weight)
+    if bias:
+        nn.init.zeros_(conv.bias)  # type: ignore
+    return conv
+
+
 class ResBlock(nn.Module):
-    def __init__(self, n_feats, mid_feats, in_scale, out_scale):
+    def __init__(
+        self,
+        n_feats,
+        mid_feats,
+        in_scale,
+        out_scale,
+        attn_feats=None,
+        reduction=4,
+        stride=16,
+        block_type="standard",
+    ):
         super(ResBlock, self).__init__()
 
         self.in_scale = in_scale
         self.out_scale = out_scale
 
         m = []
-        conv1 = nn.Conv2d(n_feats, mid_feats, 3, padding=1, bias=True)
-        nn.init.kaiming_normal_(conv1.weight)
-        nn.init.zeros_(conv1.bias)  # type: ignore
-        m.append(conv1)
+        m.append(_block_conv(block_type, n_feats, mid_feats, bias=True))
 
         m.append(nn.ReLU(True))
-        m.append(AttentionBlock(mid_feats))
+        m.append(
+            AttentionBlock(
+                mid_feats, reduction=reduction, stride=stride, hidden_feats=attn_feats
+            )
+        )
 
-        conv2 = nn.Conv2d(mid_feats, n_feats, 3, padding=1, bias=False)
-        nn.init.kaiming_normal_(conv2.weight)
-        m.append(conv2)
+        m.append(_block_conv(block_type, mid_feats, n_feats, bias=False))
 
         self.body = nn.Sequential(*m)
 
@@ -195,11 +258,16 @@ class ResBlock(nn.Module):
         return res
 
 
+RGB_MEAN = (0.4488, 0.4371, 0.4040)
+
+
 class Rescale(nn.Module):
-    def __init__(self, sign):
+    def __init__(self, sign, n_colors=3):
         super(Rescale, self).__init__()
-        rgb_mean = (0.4488, 0.4371, 0.4040)
-        bias = sign * torch.Tensor(rgb_mean).reshape(1, 3, 1, 1)
+        # Single-channel (luminance) models use the average of the RGB means,
+        # which is what converted RGB checkpoints end up with as well.
+        mean = RGB_MEAN if n_colors == 3 else (sum(RGB_MEAN) / 3,) * n_colors
+        bias = sign * torch.Tensor(mean).reshape(1, n_colors, 1, 1)
         self.bias = nn.Parameter(bias, requires_grad=False)
 
     def forward(self, x):
@@ -213,13 +281,38 @@ class NinaSR(nn.Module):
         n_feats,
         scale,
         expansion=2.0,
+        n_colors=3,
+        blocks=None,
+        attn_reduction=4,
+        attn_stride=16,
+        block_type="standard",
     ):
         super(NinaSR, self).__init__()
         self.scale = scale
+        # Constructor arguments (except scale), stored in checkpoints so that
+        # non-default variants can be rebuilt by `build_ninasr`.
+        self.config = {
+            "n_resblocks": n_resblocks,
+            "n_feats": n_feats,
+            "expansion": expansion,
+            "n_colors": n_colors,
+            "attn_reduction": attn_reduction,
+            "attn_stride": attn_stride,
+            "block_type": block_type,
+        }
+        if blocks is not None:
+            self.config["blocks"] = blocks
 
-        n_colors = 3
         self.head = NinaSR.make_head(n_colors, n_feats)
-        self.body = NinaSR.make_body(n_resblocks, n_feats, expansion)
+        self.body = NinaSR.make_body(
+            n_resblocks,
+            n_feats,
+            expansion,
+            blocks,
+            attn_reduction,
+            attn_stride,
+            block_type,
+        )
         self.tail = NinaSR.make_tail(n_colors, n_feats, scale)
 
         self.refinement, self.ref_alpha = NinaSR.make_refinement(n_colors, n_feats)
@@ -227,21 +320,56 @@ class NinaSR(nn.Module):
     @staticmethod
     def make_head(n_colors, n_feats) -> nn.Sequential:
         m_head = [
-            Rescale(-1),
+            Rescale(-1, n_colors),
             nn.Conv2d(n_colors, n_feats, 3, padding=1, bias=False),
         ]
         return nn.Sequential(*m_head)
 
     @staticmethod
-    def make_body(n_resblocks, n_feats, expansion) -> nn.Sequential:
+    def make_body(
+        n_resblocks,
+        n_feats,
+        expansion,
+        blocks=None,
+        attn_reduction=4,
+        attn_stride=16,
+        block_type="standard",
+    ) -> nn.Sequential:
+        """
+        `blocks` describes a pruned body: one {"src", "mid_feats",
+        "attn_feats"} dict per kept block, where "src" is the block's index in
+        the original `n_resblocks` body. Kept blocks retain the residual
+        scales of their original position, so pruning does not rescale them.
+
+        `block_type` selects the ResBlock convs: "standard" dense 3x3,
+        "repconv" (`RepConv`, train-time 3x3 + 1x1 + identity branches) or
+        "dwsep" (depthwise-separable, `separable_conv`).
+        """
         mid_feats = int(n_feats * expansion)
         out_scale = 4 / n_resblocks
         expected_variance = 1.0
-        m_body = []
+        scales = []
         for _ in range(n_resblocks):
-            in_scale = 1.0 / math.sqrt(expected_variance)
-            m_body.append(ResBlock(n_feats, mid_feats, in_scale, out_scale))
+            scales.append((1.0 / math.sqrt(expected_variance), out_scale))
             expected_variance += out_scale**2
+        if blocks is None:
+            blocks = [{"src": i, "mid_feats": mid_feats} for i in range(n_resblocks)]
+
+        m_body = []
+        for b in blocks:
+            in_scale, out_scale = scales[b["src"]]
+            m_body.append(
+                ResBlock(
+                    n_feats,
+                    b["mid_feats"],
+                    in_scale,
+                    out_scale,
+                    attn_feats=b.get("attn_feats"),
+                    reduction=attn_reduction,
+                    stride=attn_stride,
+                    block_type=block_type,
+                )
+            )
         return nn.Sequential(*m_body)
 
     @staticmethod
@@ -252,7 +380,7 @@ class NinaSR(nn.Module):
             # Shuffle RGB values for smoother image
             nn.PixelShuffle(scale),
             # Reintroduce color bias
-            Rescale(1),
+            Rescale(1, n_colors),
         ]
         return nn.Sequential(*m_tail)
 
@@ -283,5 +411,89 @@ class NinaSR(nn.Module):
         return x
 
 
-def ninasr_b0(scale):
-    return NinaSR(10, 16, scale, expansion=2.0)
+def ninasr_b0(scale, n_colors=3, block_type="standard"):
+    return NinaSR(
+        10, 16, scale, expansion=2.0, n_colors=n_colors, block_type=block_type
+    )
+
+
+def build_ninasr(scale, config: dict | None = None) -> NinaSR:
+    """Rebuild a model from a checkpoint's `model_config`, b0 if missing."""
+    if not config:
+        return ninasr_b0(scale)
+    return NinaSR(scale=scale, **config)
+
+
+def _reduce_in_channels(w: torch.Tensor, reduce: str) -> torch.Tensor:
+    """Collapse the RGB input axis (dim 1) of a conv weight to one channel."""
+    w = w.sum(dim=1, keepdim=True)
+    return w / 3 if reduce == "mean" else w
+
+
+def _reduce_out_channels(w: torch.Tensor, groups: int) -> torch.Tensor:
+    """
+    Average the RGB outputs of a conv weight/bias whose output channels are
+    laid out as `groups` consecutive blocks per color (PixelShuffle order).
+    """
+    w = w.reshape(3, groups, *w.shape[1:])
+    return w.mean(dim=0)
+
+
+def rgb_to_luma_state_dict(state_dict: dict, scale: int, reduce: str = "sum") -> dict:
+    """
+    Convert an RGB NinaSR state dict into one for `n_colors=1`.
+
+    Input-side filters (head, first refinement conv) are summed over the RGB
+    inputs, which is exact when the RGB model is fed a gray image replicated to
+    three channels (`reduce="mean"` averages them instead, a softer start for
+    fine-tuning). Output-side filters (tail, second refinement conv) are
+    averaged, so the luma model predicts the mean of the RGB model's outputs.
+    The only approximation is the per-color mean subtracted by the head
+    `Rescale`, which has to become a single value: it is fitted by least
+    squares so that the head's constant response matches the RGB one.
+    """
+    if reduce not in ("sum", "mean"):
+        raise ValueError(f"Unknown reduce mode '{reduce}', expected sum or mean")
+
+    out = {}
+    for k, v in state_dict.items():
+        if k == "head.0.bias":
+            w = state_dict["head.1.weight"]
+            target = (w * v).sum(dim=1)  # RGB response to the mean offset
+            w_sum = w.sum(dim=1)
+            v = ((w_sum * target).sum() / (w_sum * w_sum).sum()).reshape(1, 1, 1, 1)
+            if reduce == "mean":
+                v = v * 3  # the averaged head filter is 3x weaker
+        elif k == "tail.2.bias":
+            v = v.mean(dim=1, keepdim=True)
+        elif k in ("head.1.weight", "refinement.0.weight"):
+            v = _reduce_in_channels(v, reduce)
+        elif k in ("tail.0.weight", "tail.0.bias"):
+            v = _reduce_out_channels(v, scale**2)
+        elif k in ("refinement.2.weight", "refinement.2.bias"):
+            v = _reduce_out_channels(v, 1)
+        out[k] = v
+    return out
+
+
+def fuse_repconv_state_dict(state_dict: dict, config: dict) -> tuple[dict, dict]:
+    """
+    Fold the 1x1 and identity branches of every `RepConv` into its 3x3
+    kernel. Returns the state dict and model config of the equivalent
+    "standard" model, which runs one conv per layer at inference.
+    """
+    if config.get("block_type", "standard") != "repconv":
+        raise ValueError("Only repconv models can be reparameterized")
+
+    out = {}
+    for k, v in state_dict.items():
+        if k.endswith(".branch_1x1.weight"):
+            continue
+        branch = k[: -len("weight")] + "branch_1x1.weight"
+        if k.endswith(".weight") and branch in state_dict:
+            v = v.clone()
+            v[:, :, 1:2, 1:2] += state_dict[branch]
+            if v.shape[0] == v.shape[1]:  # identity branch, see RepConv
+                v[:, :, 1, 1] += torch.eye(v.shape[0], dtype=v.dtype)
+        out[k] = v
+    return out, {**config, "block_type": "standard"}
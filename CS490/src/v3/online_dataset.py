@@ -0,0 +1,160 @@
+"""
+Online-degradation dataset: LR images are synthesized inside the loader.
+
+Instead of reading LR files written by the generators, every access draws a
+fresh degradation (resample filter, blur, noise; see
+`image_utils.degrade_array`) of an HR crop, so each epoch sees different LR
+inputs and only HR data has to be stored. Two sources are supported:
+
+- HR crops of an existing dataset root ({split}/hr PNGs or shards)
+- the raw source images themselves: random crop and rotation are drawn per
+  access too, so no dataset generation step is needed at all. Sources are
+  decoded once into a shared memory-mapped cache (sample_cache.py), from
+  which only the crop region is read.
+"""
+
+import os
+import random
+import zlib
+
+import numpy as np
+import torchvision.transforms.functional as TF
+from image_utils import ContentCrops, crop_and_rotate_array, degrade_array
+from PIL import Image
+from sample_cache import open_sample_cache
+from shards import ShardReader, has_shards
+from torch.utils.data import Dataset
+
+SOURCE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+
+
+def _source_split(name: str, val_fraction: float = 0.2) -> str:
+    """Stable train/val assignment of a source image by its file name."""
+    return "val" if zlib.crc32(name.encode()) % 100 < val_fraction * 100 else "train"
+
+
+class OnlineDegradationDataset(Dataset):
+    """
+    Args:
+        root: dataset root with HR crops, used when `source_dir` is None
+        split: 'train' or 'val'
+        source_dir: folder of raw source images to crop from instead
+        hr_size: HR crop size (source mode)
+        scale: HR/LR ratio
+        samples_per_image: crops per source image and epoch (source mode)
+        cache_dir: decoded cache folder; required for sources (default
+            {source_dir}/.decoded), optional for HR PNG folders
+        deterministic: derive every sample's randomness from its index, so
+            validation sees the same pairs each epoch
+        content_floor: source mode; sample crops proportionally to ink
+            coverage (image_utils.ContentCrops) with this weight for blank
+            crops, None for uniform positions
+    """
+
+    def __init__(
+        self,
+        root=None,
+        split="train",
+        source_dir=None,
+        hr_size=256,
+        scale=2,
+        samples_per_image=20,
+        cache_dir=None,
+        deterministic=False,
+        content_floor=None,
+    ):
+        super().__init__()
+        self.split = split
+        self.hr_size = hr_size
+        self.scale = scale
+        self.samples_per_image = samples_per_image
+        self.deterministic = deterministic
+        self.content_floor = content_floor
+        self._content = {}
+        self.shards = None
+        self.cache = None
+
+        if source_dir:
+            names = sorted(
+                f
+                for f in os.listdir(source_dir)
+                if f.lower().endswith(SOURCE_EXTENSIONS) and _source_split(f) == split
+            )
+            files = {f"source/{n}": os.path.join(source_dir, n) for n in names}
+            self.cache = open_sample_cache(
+                cache_dir or os.path.join(source_dir, ".decoded"),
+                f"source_{split}",
+                files,
+            )
+            # Sources smaller than a crop cannot be sampled.
+            self.names = [
+                n
+                for n in names
+                if min(self.cache.get("source", n).shape[:2]) >= hr_size
+            ]
+            self.kind = "source"
+        elif has_shards(root, split):
+            self.shards = ShardReader(root, split)
+            self.names = self.shards.names
+            self.kind = "hr"
+        else:
+            hr_dir = os.path.join(root, split, "hr")
+            self.names = sorted(
+                os.path.splitext(f)[0]
+                for f in os.listdir(hr_dir)
+                if f.lower().endswith(".png")
+            )
+            self.hr_dir = hr_dir
+            self.kind = "hr"
+            if cache_dir:
+                files = {
+                    f"hr/{n}": os.path.join(hr_dir, n + ".png") for n in self.names
+                }
+                self.cache = open_sample_cache(cache_dir, f"hr_{split}", files)
+
+    def __getstate__(self):
+        # Content maps are built per process on first use of a source.
+        state = self.__dict__.copy()
+        state["_content"] = {}
+        return state
+
+    def _content_crops(self, name: str, src: np.ndarray) -> ContentCrops | None:
+        if self.content_floor is None:
+            return None
+        if name not in self._content:
+            self._content[name] = ContentCrops(src, self.hr_size, self.content_floor)
+        return self._content[name]
+
+    def __len__(self):
+        if self.kind == "source":
+            return len(self.names) * self.samples_per_image
+        return len(self.names)
+
+    def _rng(self, idx) -> np.random.Generator:
+        if self.deterministic:
+            return np.random.default_rng(idx)
+        # `random` is seeded per worker (dataset.seed_worker).
+        return np.random.default_rng(random.getrandbits(64))
+
+    def _load_hr(self, name: str) -> np.ndarray:
+        if self.shards is not None:
+            return self.shards.get(name, "hr")
+        if self.cache is not None:
+            return self.cache.get("hr", name)
+        with Image.open(os.path.join(self.hr_dir, name + ".png")) as im:
+            return np.asarray(im.convert("RGB"))
+
+    def __getitem__(self, idx):
+        rng = self._rng(idx)
+        if self.kind == "source":
+            name = self.names[idx // self.samples_per_image]
+            src = self.cache.get("source", name)
+            hr = crop_and_rotate_array(
+                src, self.hr_size, rng, self._content_crops(name, src)
+            )
+            name = f"{os.path.splitext(name)[0]}_sample_{idx % self.samples_per_image}"
+        else:
+            name = self.names[idx]
+            hr = self._load_hr(name)
+        lr = degrade_array(hr, self.scale, rng)
+        return {"hr": TF.to_tensor(hr), "lr": TF.to_tensor(lr), "name": name}
@@ -0,0 +1,194 @@
+"""
+Output representations for upscaled images.
+
+The tiling engine hands every finished output tile to an `OutputMode`, which
+reduces it to the uint8 canvas stored in memory. `finish` then turns the
+canvas into the image that is written to disk. Line-art results are almost
+binary, so storing and encoding them as 1-bit or small-palette indexed
+images is far cheaper than 24-bit RGB.
+"""
+
+import math
+
+import numpy as np
+import torch
+from PIL import Image
+
+# Luminance weights, same as `_rgb_to_gray` in the fine-tune losses.
+LUMA_WEIGHTS = (0.2989, 0.5870, 0.1140)
+
+OUTPUT_FORMATS = {"png": ".png", "tiff": ".tiff"}
+
+
+def _to_uint8(t: torch.Tensor) -> torch.Tensor:
+    # Truncates like torchvision's to_pil_image, so the RGB output is
+    # bit-identical to the previous float pipeline.
+    return t.mul(255).byte()
+
+
+class OutputMode:
+    """
+    Base class: keeps the model output channels as they are; subclasses
+    decide how the canvas becomes an image.
+    """
+
+    def channels(self, in_channels: int) -> int:
+        return in_channels
+
+    def start(self):
+        """Called before the first tile of every image."""
+
+    def tile(self, out: torch.Tensor) -> np.ndarray:
+        """Convert a clamped (C, h, w) float tile into an (h, w, C') uint8 array."""
+        return _to_uint8(out).permute(1, 2, 0).numpy()
+
+    def finish(self, canvas: np.ndarray) -> Image.Image:
+        raise NotImplementedError
+
+    def save(self, img: Image.Image, path: str):
+        img.save(path)
+
+
+class RGBOutput(OutputMode):
+    """24-bit RGB output, luma model results are replicated to RGB."""
+
+    def finish(self, canvas: np.ndarray) -> Image.Image:
+        if canvas.shape[2] == 1:
+            canvas = np.repeat(canvas, 3, axis=2)
+        return Image.fromarray(canvas)
+
+
+class _GrayOutput(OutputMode):
+    """
+    Reduces tiles to one gray channel and accumulates the gray histogram
+    while tiles are produced, so that thresholds/palettes can be derived at
+    the end without another pass over the full-size canvas.
+    """
+
+    def __init__(self):
+        self.hist = np.zeros(256, dtype=np.int64)
+
+    def channels(self, in_channels: int) -> int:
+        return 1
+
+    def start(self):
+        self.hist[:] = 0
+
+    def tile(self, out: torch.Tensor) -> np.ndarray:
+        if out.shape[0] == 3:
+            w = torch.tensor(LUMA_WEIGHTS).view(3, 1, 1)
+            out = (out * w).sum(dim=0, keepdim=True)
+        gray = _to_uint8(out).permute(1, 2, 0).numpy()
+        self.hist += np.bincount(gray.ravel(), minlength=256)
+        return gray
+
+
+def otsu_threshold(hist: np.ndarray) -> int:
+    """
+    Otsu's threshold on a 256-bin histogram: maximizes the between-class
+    variance, computed for all candidate thresholds at once via cumulative
+    sums. Pixels `<= threshold` are ink.
+    """
+    levels = np.arange(256, dtype=np.float64)
+    total = hist.sum()
+    w0 = np.cumsum(hist).astype(np.float64)
+    w1 = total - w0
+    m0 = np.cumsum(hist * levels)
+    mean_total = m0[-1] / max(total, 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        between = (mean_total * w0 - m0) ** 2 / (w0 * w1)
+    between[~np.isfinite(between)] = 0
+    return int(np.argmax(between))
+
+
+class BinaryOutput(_GrayOutput):
+    """
+    1-bit black/white output.
+
+    Args:
+        threshold: gray level in [0, 1] separating ink from paper, None to
+            pick it per image with Otsu's method
+    """
+
+    def __init__(self, threshold: float | None = None):
+        super().__init__()
+        self.threshold = threshold
+
+    def finish(self, canvas: np.ndarray) -> Image.Image:
+        if self.threshold is None:
+            thr = otsu_threshold(self.hist)
+        else:
+            thr = int(self.threshold * 255)
+        return Image.fromarray(canvas[:, :, 0] > thr)
+
+    def save(self, img: Image.Image, path: str):
+        if path.endswith(".tiff"):
+            img.save(path, compression="group4")
+        else:
+            img.save(path, optimize=True)
+
+
+def palette_levels(hist: np.ndarray, n_levels: int, iters: int = 20) -> np.ndarray:
+    """
+    1D k-means over the gray histogram: returns `n_levels` sorted gray
+    levels. Working on the 256 histogram bins instead of the pixels makes it
+    independent of image size.
+    """
+    levels = np.arange(256, dtype=np.float64)
+    cdf = np.cumsum(hist) / max(hist.sum(), 1)
+    # Quantile initialization spreads the centers over populated levels.
+    quantiles = (np.arange(n_levels) + 0.5) / n_levels
+    centers = np.searchsorted(cdf, quantiles).astype(np.float64)
+    for _ in range(iters):
+        assign = np.abs(levels[:, None] - centers[None, :]).argmin(axis=1)
+        weights = np.bincount(assign, weights=hist, minlength=n_levels)
+        sums = np.bincount(assign, weights=hist * levels, minlength=n_levels)
+        filled = weights > 0
+        centers[filled] = sums[filled] / weights[filled]
+    return np.unique(np.round(centers)).astype(np.uint8)
+
+
+class PaletteOutput(_GrayOutput):
+    """
+    Indexed output with a small gray palette fitted per image; keeps some
+    anti-aliasing that a 1-bit output would lose.
+    """
+
+    def __init__(self, n_levels: int = 4):
+        super().__init__()
+        if not 2 <= n_levels <= 256:
+            raise ValueError(f"Palette size must be in [2, 256], got {n_levels}")
+        self.n_levels = n_levels
+
+    def finish(self, canvas: np.ndarray) -> Image.Image:
+        centers = palette_levels(self.hist, self.n_levels)
+        lut = np.abs(
+            np.arange(256)[:, None] - centers[None, :].astype(np.int16)
+        ).argmin(axis=1)
+        img = Image.fromarray(lut.astype(np.uint8)[canvas[:, :, 0]])
+        # putpalette turns the "L" index image into a "P" image.
+        img.putpalette(np.repeat(centers, 3).tolist())
+        return img
+
+    def save(self, img: Image.Image, path: str):
+        if path.endswith(".tiff"):
+            img.save(path, compression="tiff_adobe_deflate")
+        else:
+            # Pack indices into as few bits as the palette needs.
+            bits = 1 << math.ceil(math.log2(math.ceil(math.log2(self.n_levels))))
+            img.save(path, bits=min(bits, 8), optimize=True)
+
+
+def make_output_mode(
+    name: str, threshold: float | None = None, palette_size: int = 4
+) -> OutputMode:
+    if name == "rgb":
+        return RGBOutput()
+    if name == "binary":
+        return BinaryOutput(threshold)
+    if name == "palette":
+        return PaletteOutput(palette_size)
+    raise ValueError(f"Unknown output mode '{name}'")
+
+
+OUTPUT_MODES = ["rgb", "binary", "palette"]
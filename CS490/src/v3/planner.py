@@ -0,0 +1,316 @@
+"""
+Resource planner for inference runs.
+
+Predicts runtime, peak memory and output disk usage of `run_model.py` from
+image headers only (no pixel decoding) and a short per-machine calibration,
+so a run over thousands of scans can be sized before it is launched.
+"""
+
+import os
+import resource
+import tempfile
+import time
+from functools import partial
+
+import numpy as np
+import torch
+from output_modes import OUTPUT_FORMATS, OutputMode
+from PIL import Image
+from tiling import TiledUpscaler, TileStage, make_tiles
+
+ENSEMBLE_FORWARDS = 8
+# Tile sizes tried, largest first, when an image does not fit the budget.
+CANDIDATE_CHOP_SIZES = [1024, 768, 512, 384, 256, 192, 128, 96, 64]
+
+
+class Calibration:
+    """
+    Per-machine cost coefficients measured by `calibrate`.
+
+    Attributes:
+        forward_s_per_px: model forward time per input tile pixel
+        preprocess_s_per_px: preprocessing time per input pixel
+        encode_s_per_px: output encoding time per output pixel
+        disk_bytes_per_px: encoded output size per output pixel
+        base_rss: resident memory of the process with the model loaded
+    """
+
+    def __init__(
+        self,
+        forward_s_per_px: float,
+        preprocess_s_per_px: float,
+        encode_s_per_px: float,
+        disk_bytes_per_px: float,
+        base_rss: int,
+    ):
+        self.forward_s_per_px = forward_s_per_px
+        self.preprocess_s_per_px = preprocess_s_per_px
+        self.encode_s_per_px = encode_s_per_px
+        self.disk_bytes_per_px = disk_bytes_per_px
+        self.base_rss = base_rss
+
+
+def _current_rss() -> int:
+    """Resident set size of this process in bytes (peak if /proc is missing)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # ru_maxrss is in KiB on Linux and bytes on macOS; KiB is the
+        # conservative reading on both.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _calibration_image(size: int, channels: int) -> np.ndarray:
+    """Sparse dark strokes on white paper, a stand-in for a schematic crop."""
+    rng = np.random.default_rng(0)
+    img = np.full((size, size, channels), 245, dtype=np.uint8)
+    for _ in range(size // 8):
+        r, c = rng.integers(0, size - 8, 2)
+        if rng.random() < 0.5:
+            img[r : r + 2, c : c + size // 4] = 30
+        else:
+            img[r : r + size // 4, c : c + 2] = 30
+    return img
+
+
+def calibrate(
+    model: torch.nn.Module,
+    scale: int,
+    output: OutputMode,
+    preprocess: TileStage | None,
+    tile_size: int = 256,
+    channels: int = 3,
+    device: str = "cpu",
+    repeats: int = 2,
+    output_format: str = "png",
+) -> Calibration:
+    """
+    Micro-benchmark one tile through every stage of the pipeline. Takes a
+    few seconds; the per-pixel costs are then extrapolated to whole runs.
+    The output is encoded the way the planned run writes it (`output` mode
+    in `output_format`), since encode time and size depend on both.
+    """
+    img = _calibration_image(tile_size, channels)
+    px = tile_size * tile_size
+    upscaler = TiledUpscaler(model, scale, None, 0, preprocess=None, device=device)
+    base_rss = _current_rss()
+
+    def timed(fn) -> float:
+        fn()  # warmup
+        start = time.perf_counter()
+        for _ in range(repeats):
+            fn()
+        return (time.perf_counter() - start) / repeats
+
+    forward = timed(lambda: upscaler.upscale(img, output=output))
+    prep = 0.0
+    if preprocess is not None:
+        rows, cols = slice(0, tile_size), slice(0, tile_size)
+        prep = timed(lambda: preprocess(img, rows, cols))
+
+    canvas = upscaler.upscale(img, output=output)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "calibration" + OUTPUT_FORMATS[output_format])
+        encode = timed(lambda: output.save(output.finish(canvas), path))
+        disk = os.path.getsize(path)
+
+    out_px = px * scale * scale
+    return Calibration(
+        forward_s_per_px=forward / px,
+        preprocess_s_per_px=prep / px,
+        encode_s_per_px=encode / out_px,
+        disk_bytes_per_px=disk / out_px,
+        base_rss=base_rss,
+    )
+
+
+def read_image_size(path: str) -> tuple[int, int]:
+    """(height, width) from the file header; PIL decodes pixels lazily."""
+    with Image.open(path) as im:
+        width, height = im.size
+    return height, width
+
+
+def tile_activation_bytes(
+    tile_px: int, n_feats: int, mid_feats: int, n_colors: int, scale: int
+) -> int:
+    """
+    Peak float32 activation memory of one NinaSR forward over a tile.
+
+    Counts the tensors alive at the widest points of the network: the body
+    residual stream and skip (2 x n_feats), a ResBlock's expanded features
+    plus the attention product (2 x mid_feats), the block output (n_feats),
+    and at the output resolution the tail, pixel shuffle and refinement
+    buffers (2 x n_colors + 2 x refinement width, all times scale^2).
+    """
+    ref_feats = max(16, n_feats)
+    per_px = 3 * n_feats + 2 * mid_feats
+    per_px += (2 * n_colors + 2 * ref_feats) * scale * scale
+    return 4 * per_px * tile_px
+
+
+class ImagePlan:
+    """Predicted cost of one image."""
+
+    def __init__(self, name: str, height: int, width: int):
+        self.name = name
+        self.height = height
+        self.width = width
+        self.n_tiles = 0
+        self.n_forwards = 0
+        self.seconds = 0.0
+        self.peak_bytes = 0
+        self.disk_bytes = 0
+        self.suggestion = ""
+
+
+def plan_image(
+    name: str,
+    height: int,
+    width: int,
+    calib: Calibration,
+    model_config: dict,
+    scale: int,
+    chop_size: int | None,
+    chop_overlap: int,
+    ensemble: bool,
+    passes: int,
+    output_channels: int,
+    preprocess: bool,
+    tile_batch: int = 1,
+) -> ImagePlan:
+    plan = ImagePlan(name, height, width)
+    n_colors = model_config["n_colors"]
+    n_feats = model_config["n_feats"]
+    blocks = model_config.get("blocks")
+    if blocks:  # pruned body, the widest block sets the peak
+        mid_feats = max(b["mid_feats"] for b in blocks)
+    else:
+        mid_feats = int(n_feats * model_config["expansion"])
+    forwards_per_tile = ENSEMBLE_FORWARDS if ensemble else 1
+
+    h, w = height, width
+    for p in range(passes):
+        tiles = make_tiles(h, w, chop_size, chop_overlap)
+        tile_px = [
+            (t.rows.stop - t.rows.start) * (t.cols.stop - t.cols.start) for t in tiles
+        ]
+        plan.n_tiles += len(tiles)
+        plan.n_forwards += len(tiles) * forwards_per_tile
+        plan.seconds += sum(tile_px) * forwards_per_tile * calib.forward_s_per_px
+        if preprocess and p == 0:
+            plan.seconds += h * w * calib.preprocess_s_per_px
+
+        out_px = h * w * scale * scale
+        plan.seconds += out_px * calib.encode_s_per_px
+        plan.disk_bytes += int(out_px * calib.disk_bytes_per_px)
+
+        # Input image + output canvas + one tile batch in flight (two with
+        # the prefetched one) and, with self-ensemble, the 8 stacked outputs.
+        largest = max(tile_px) * min(tile_batch, len(tiles))
+        activations = tile_activation_bytes(
+            largest, n_feats, mid_feats, n_colors, scale
+        )
+        if ensemble:
+            activations += 4 * ENSEMBLE_FORWARDS * n_colors * largest * scale * scale
+        in_bytes = h * w * 3
+        out_bytes = out_px * output_channels
+        peak = in_bytes + out_bytes + activations + 2 * 4 * n_colors * largest
+        plan.peak_bytes = max(plan.peak_bytes, calib.base_rss + peak)
+
+        h, w = h * scale, w * scale
+    return plan
+
+
+def suggest_settings(plan_fn, budget: int, chop_overlap: int, ensemble: bool) -> str:
+    """Largest tile size (then dropping self-ensemble) that fits the budget."""
+    for use_ensemble in [True, False] if ensemble else [False]:
+        for size in CANDIDATE_CHOP_SIZES:
+            overlap = min(chop_overlap, size // 2)
+            if plan_fn(size, overlap, use_ensemble).peak_bytes <= budget:
+                hint = f"--chop --chop-size {size} --chop-overlap {overlap}"
+                return (
+                    hint if use_ensemble == ensemble else hint + " without --ensemble"
+                )
+    return (
+        "does not fit even with small tiles; use a gray --output-mode or fewer passes"
+    )
+
+
+def _fmt_bytes(n: float) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if n < 1024:
+            return f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} TiB"
+
+
+def plan_run(
+    image_paths: list[str],
+    calib: Calibration,
+    model_config: dict,
+    scale: int,
+    chop_size: int | None,
+    chop_overlap: int,
+    ensemble: bool,
+    passes: int,
+    output_channels: int,
+    preprocess: bool,
+    memory_budget: int | None = None,
+    tile_batch: int = 1,
+) -> list[ImagePlan]:
+    """Plan every image and print a per-image table plus run totals."""
+
+    def plan_one(name, height, width, size, overlap, use_ensemble):
+        return plan_image(
+            name,
+            height,
+            width,
+            calib,
+            model_config,
+            scale,
+            chop_size=size,
+            chop_overlap=overlap,
+            ensemble=use_ensemble,
+            passes=passes,
+            output_channels=output_channels,
+            preprocess=preprocess,
+            tile_batch=tile_batch,
+        )
+
+    plans = []
+    for path in image_paths:
+        height, width = read_image_size(path)
+        name = os.path.basename(path)
+        plan = plan_one(name, height, width, chop_size, chop_overlap, ensemble)
+        if memory_budget is not None and plan.peak_bytes > memory_budget:
+            plan.suggestion = suggest_settings(
+                partial(plan_one, name, height, width),
+                memory_budget,
+                chop_overlap,
+                ensemble,
+            )
+        plans.append(plan)
+
+    print(f"{'image':<40} {'size':>11} {'tiles':>6} {'time':>9} {'peak RSS':>11}")
+    for p in plans:
+        flag = " !" if p.suggestion else ""
+        print(
+            f"{p.name[:40]:<40} {f'{p.width}x{p.height}':>11} {p.n_tiles:>6} "
+            f"{p.seconds:>8.1f}s {_fmt_bytes(p.peak_bytes):>11}{flag}"
+        )
+        if p.suggestion:
+            print(f"    exceeds memory budget, try: {p.suggestion}")
+
+    total_s = sum(p.seconds for p in plans)
+    print(
+        f"\n{len(plans)} images, {sum(p.n_forwards for p in plans)} tile forwards, "
+        f"~{total_s / 3600:.2f} h, max peak RSS "
+        f"{_fmt_bytes(max((p.peak_bytes for p in plans), default=0))}, "
+        f"output ~{_fmt_bytes(sum(p.disk_bytes for p in plans))}"
+    )
+    n_over = sum(1 for p in plans if p.suggestion)
+    if n_over:
+        print(f"{n_over} images exceed the memory budget")
+    return plans
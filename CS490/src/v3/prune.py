@@ -0,0 +1,275 @@
+"""
+Structured pruning of NinaSR ResBlocks.
+
+Ranks the expanded (mid) channels of every ResBlock and whole ResBlocks by
+importance on validation data, physically removes the least important ones
+to get a smaller `NinaSR` (its shape is stored in the checkpoint's
+`model_config`, see `NinaSR.make_body`), runs a short recovery fine-tune and
+reports FLOPs, latency and PSNR before and after.
+
+Usage:
+    python prune.py -m checkpoints/v30_ninasr_b0.pt --dataset-root dataset \\
+        --channel-ratio 0.25 --prune-blocks 2 -o checkpoints/v30_pruned.pt
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+import argparse
+import json
+import os
+
+import torch
+from dataset import HRLRDataset
+from losses import FusedLoss
+from machine_profile import apply_threads, load_profile
+from metrics import MetricSums
+from ninasr import NinaSR
+from run_fine_tune import (
+    model_stats,
+    print_model_stats,
+    train,
+    validate,
+)
+from run_model import load_model
+from torch import nn
+from torch.utils.data import DataLoader
+
+
+def _block_src(model: NinaSR, i: int) -> int:
+    blocks = model.config.get("blocks")
+    return blocks[i]["src"] if blocks else i
+
+
+def _batches(loader, max_batches: int):
+    for i, batch in enumerate(loader):
+        if i >= max_batches:
+            break
+        yield batch
+
+
+def channel_scores(model: NinaSR, loader, device, max_batches: int) -> list:
+    """
+    Importance of every mid channel, one tensor per ResBlock: the channel's
+    mean |activation| after the attention gate (what the block's second
+    conv reads) times the norm of its outgoing weights and the block's output
+    scale, i.e. roughly how much it adds to the residual stream. Channels the
+    ReLU keeps at zero score 0 and are removed exactly.
+    """
+    sums = [torch.zeros(b.body[3].in_channels) for b in model.body]
+
+    def make_hook(i):
+        def hook(_module, _inputs, out):
+            sums[i] += out.detach().abs().mean(dim=(0, 2, 3)).cpu()
+
+        return hook
+
+    handles = [
+        b.body[2].register_forward_hook(make_hook(i)) for i, b in enumerate(model.body)
+    ]
+    model.eval()
+    try:
+        with torch.no_grad():
+            for batch in _batches(loader, max_batches):
+                model(batch["lr"].to(device))
+    finally:
+        for h in handles:
+            h.remove()
+
+    scores = []
+    for b, s in zip(model.body, sums, strict=True):
+        w_out = b.body[3].weight.detach().cpu().flatten(2).norm(dim=(0, 2))
+        scores.append(s * w_out * 2 * b.out_scale)
+    return scores
+
+
+def block_scores(model: NinaSR, loader, device, max_batches: int) -> list[float]:
+    """
+    Importance of every ResBlock: increase of the validation L1 when the
+    block is skipped (its residual branch removed).
+    """
+
+    def val_l1() -> float:
+        metrics = MetricSums()
+        with torch.no_grad():
+            for batch in _batches(loader, max_batches):
+                out = model(batch["lr"].to(device))
+                l1 = nn.functional.l1_loss(out, batch["hr"].to(device))
+                metrics.add({"l1": l1}, out.size(0))
+        return metrics.means().get("l1", 0.0)
+
+    model.eval()
+    base = val_l1()
+    scores = []
+    for i in range(len(model.body)):
+        block = model.body[i]
+        model.body[i] = nn.Identity()
+        try:
+            scores.append(val_l1() - base)
+        finally:
+            model.body[i] = block
+    return scores
+
+
+def select_pruning(
+    ch_scores: list,
+    blk_scores: list[float],
+    prune_blocks: int,
+    channel_ratio: float,
+    min_channels: int,
+) -> dict[int, torch.Tensor]:
+    """
+    Drop the `prune_blocks` least important blocks, then the globally lowest
+    scoring `channel_ratio` of the remaining mid channels, keeping at least
+    `min_channels` per block. Returns {block index: sorted kept channels}.
+    """
+    order = sorted(range(len(blk_scores)), key=lambda i: blk_scores[i])
+    kept_blocks = sorted(order[prune_blocks:])
+
+    candidates = []
+    for i in kept_blocks:
+        s = ch_scores[i]
+        # The strongest channels of every block are never candidates.
+        protected = set(s.argsort(descending=True)[:min_channels].tolist())
+        candidates += [(float(s[c]), i, c) for c in range(len(s)) if c not in protected]
+    total = sum(len(ch_scores[i]) for i in kept_blocks)
+    n_remove = min(int(total * channel_ratio), len(candidates))
+    removed = {(i, c) for _, i, c in sorted(candidates)[:n_remove]}
+
+    return {
+        i: torch.tensor(
+            [c for c in range(len(ch_scores[i])) if (i, c) not in removed],
+            dtype=torch.long,
+        )
+        for i in kept_blocks
+    }
+
+
+def prune_ninasr(model: NinaSR, keep: dict[int, torch.Tensor]) -> NinaSR:
+    """
+    Build the smaller NinaSR keeping the blocks/mid channels in `keep` and
+    copy the matching weights. Head, tail and refinement are unchanged.
+    """
+    blocks = [
+        {
+            "src": _block_src(model, i),
+            "mid_feats": len(ch),
+            "attn_feats": model.body[i].body[2].body[1].out_channels,
+        }
+        for i, ch in keep.items()
+    ]
+    config = {**model.config, "blocks": blocks}
+    pruned = NinaSR(scale=model.scale, **config)
+
+    old = model.state_dict()
+    new = {k: v for k, v in old.items() if not k.startswith("body.")}
+    for j, (i, ch) in enumerate(keep.items()):
+        src, dst = f"body.{i}.body.", f"body.{j}.body."
+        new[dst + "0.weight"] = old[src + "0.weight"][ch]
+        new[dst + "0.bias"] = old[src + "0.bias"][ch]
+        new[dst + "2.body.1.weight"] = old[src + "2.body.1.weight"][:, ch]
+        new[dst + "2.body.1.bias"] = old[src + "2.body.1.bias"]
+        new[dst + "2.body.3.weight"] = old[src + "2.body.3.weight"][ch]
+        new[dst + "2.body.3.bias"] = old[src + "2.body.3.bias"][ch]
+        new[dst + "3.weight"] = old[src + "3.weight"][:, ch]
+    pruned.load_state_dict(new)
+    return pruned.to(next(model.parameters()).device)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Prune NinaSR ResBlocks")
+    p.add_argument("-m", "--model-path", required=True)
+    p.add_argument("-o", "--checkpoint-out", required=True)
+    p.add_argument("--dataset-root", required=True)
+    p.add_argument("--scale", type=int, default=2)
+    p.add_argument(
+        "--channel-ratio",
+        type=float,
+        default=0.25,
+        help="Fraction of mid channels to remove",
+    )
+    p.add_argument(
+        "--prune-blocks", type=int, default=0, help="Number of ResBlocks to remove"
+    )
+    p.add_argument(
+        "--min-channels",
+        type=int,
+        default=4,
+        help="Mid channels always kept per block",
+    )
+    p.add_argument(
+        "--calib-batches",
+        type=int,
+        default=16,
+        help="Validation batches used to rank channels and blocks",
+    )
+    p.add_argument("--recovery-epochs", type=int, default=3)
+    p.add_argument("--lr", type=float, default=1e-4)
+    p.add_argument("--batch-size", type=int, default=4)
+    p.add_argument("--lambda-edge", type=float, default=0.25)
+    p.add_argument("--no-profile", action="store_true")
+    args = p.parse_args()
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+
+    profile = {} if args.no_profile else load_profile()
+    section = profile.get("training", {})
+    apply_threads(section.get("num_threads"), section.get("interop_threads"))
+
+    model = load_model(args.model_path, scale=args.scale, device=device)
+    if model.config["block_type"] != "standard":
+        raise SystemExit(
+            "Only standard ResBlocks can be pruned, reparameterize repconv "
+            "checkpoints with convert_checkpoint.py first"
+        )
+    val_loader = DataLoader(
+        HRLRDataset(args.dataset_root, split="val", augment=False),
+        batch_size=args.batch_size,
+    )
+    train_loader = DataLoader(
+        HRLRDataset(args.dataset_root, split="train", augment=True),
+        batch_size=args.batch_size,
+        shuffle=True,
+    )
+
+    report = {"original": model_stats(model, val_loader, device)}
+    ch_scores = channel_scores(model, val_loader, device, args.calib_batches)
+    blk_scores = block_scores(model, val_loader, device, args.calib_batches)
+    for i, (s, c) in enumerate(zip(blk_scores, ch_scores, strict=True)):
+        n_dead = int((c == 0).sum())
+        print(f"block {i}: skip dL1={s:+.5f}, {n_dead}/{len(c)} dead channels")
+
+    keep = select_pruning(
+        ch_scores, blk_scores, args.prune_blocks, args.channel_ratio, args.min_channels
+    )
+    pruned = prune_ninasr(model, keep)
+    print("Kept blocks/channels:", {i: len(ch) for i, ch in keep.items()})
+    report["pruned"] = model_stats(pruned, val_loader, device)
+
+    loss_fns = {"fused": FusedLoss(lambda_edge=args.lambda_edge).to(device)}
+    optim = torch.optim.Adam(pruned.parameters(), lr=args.lr)
+    for epoch in range(1, args.recovery_epochs + 1):
+        train_loss, _ = train(pruned, train_loader, optim, device, loss_fns)
+        val_loss, _ = validate(pruned, val_loader, device, loss_fns)
+        print(f"Recovery epoch {epoch}: train={train_loss:.6f} val={val_loss:.6f}")
+    report["recovered"] = model_stats(pruned, val_loader, device)
+
+    os.makedirs(os.path.dirname(args.checkpoint_out) or ".", exist_ok=True)
+    torch.save(
+        {
+            "state_dict": pruned.state_dict(),
+            "model_config": pruned.config,
+            "args": vars(args),
+        },
+        args.checkpoint_out,
+    )
+    print_model_stats(report)
+    report_path = os.path.splitext(args.checkpoint_out)[0] + "_prune_report.json"
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print("Saved", args.checkpoint_out, "and", report_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,287 +1,394 @@
 import sys
-from collections import defaultdict
+from collections.abc import Callable
 from pathlib import Path
-from typing import Callable
 
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
 import argparse
+import json
 import os
+import random
 import time
 
 import torch
-import torch.nn as nn
 import torch.nn.functional as F
-from dataset import HRLRDataset
-from ninasr import ninasr_b0
-from torch.utils.data import DataLoader
-from torchvision.models import VGG16_Weights, vgg16
+import torchvision.transforms.functional as TF
+from augment import BatchAugment
+from benchmark import count_flops, time_call
+from data_gen_synthetic import SyntheticStream
+from dataset import HRLRDataset, seed_worker
+from losses import VGG_LAYERS, FusedLoss, PerceptualLoss
+from machine_profile import apply_threads, load_profile, resolve_settings
+from metrics import MetricSums, format_metrics
+from ninasr import BLOCK_TYPES, NinaSR, ninasr_b0
+from online_dataset import OnlineDegradationDataset
+from run_model import load_model
+from torch.utils.data import DataLoader, IterableDataset
+from tqdm import tqdm
+
+
+def _batch_losses(
+    loss_fns: dict[str, Callable],
+    distill_fns: dict[str, Callable] | None,
+    out: torch.Tensor,
+    batch: dict,
+    hr: torch.Tensor,
+    device,
+) -> dict[str, torch.Tensor]:
+    """
+    Named loss terms of a batch: HR losses, then teacher-matching losses.
+    Every loss fn is called as fn(out, target, names) and returns its term,
+    None when disabled, or a dict of named terms (`FusedLoss`).
+    """
+    groups = [(loss_fns, hr)]
+    if distill_fns and "teacher" in batch:
+        groups.append((distill_fns, batch["teacher"].to(device)))
+    terms = {}
+    for fns, target in groups:
+        for name, fn in fns.items():
+            val = fn(out, target, batch.get("name"))
+            if isinstance(val, dict):
+                terms.update(val)
+            elif val is not None:
+                terms[name] = val
+    return terms
+
+
+def _timed_batches(loader, timings: dict | None):
+    """
+    Iterate `loader`, adding the time spent waiting for each batch to
+    timings["data"] and the time the caller spends on it to timings["compute"].
+    """
+    if timings is None:
+        yield from loader
+        return
+    it = iter(loader)
+    while True:
+        start = time.perf_counter()
+        try:
+            batch = next(it)
+        except StopIteration:
+            return
+        ready = time.perf_counter()
+        timings["data"] += ready - start
+        yield batch
+        timings["compute"] += time.perf_counter() - ready
+
+
+def _to_device(batch: dict, device, augment: Callable[[dict], dict] | None) -> dict:
+    """Move the batch tensors to `device`, then apply the batch augmentation."""
+    batch = {
+        k: v.to(device, non_blocking=True) if isinstance(v, torch.Tensor) else v
+        for k, v in batch.items()
+    }
+    return augment(batch) if augment is not None else batch
+
+
+def _loss_means(metrics: MetricSums) -> tuple[float, dict[str, float]]:
+    """(mean step loss, {term: mean}) of what `train`/`validate` added."""
+    means = metrics.means()
+    return means.pop("loss", 0.0), means
 
 
-def train(model, loader, optim, device, loss_fns: dict[str, Callable]):
+def train(
+    model,
+    loader,
+    optim,
+    device,
+    loss_fns: dict[str, Callable],
+    distill_fns: dict[str, Callable] | None = None,
+    timings: dict | None = None,
+    augment: Callable[[dict], dict] | None = None,
+    log_every: int = 0,
+):
+    """
+    One epoch; returns the mean loss and per-term means. Loss values stay
+    on the device until the log lines every `log_every` steps and the end.
+    """
     model.train()
-    total_loss = 0.0
-    comps_acc = defaultdict(float)
+    metrics = MetricSums()
 
-    for batch in loader:
-        lr = batch["lr"].to(device)
-        hr = batch["hr"].to(device)
+    for step, batch in enumerate(_timed_batches(loader, timings), 1):
+        batch = _to_device(batch, device, augment)
+        lr = batch["lr"]
+        hr = batch["hr"]
         optim.zero_grad()
         out = model(lr)
 
-        batch_loss = None
-        comps_batch = {}
-
-        for name, fn in loss_fns.items():
-            val = fn(out, hr)
-            if val is None:
-                continue
-
-            batch_loss = val if batch_loss is None else batch_loss + val
-            try:
-                comps_batch[name] = float(val.detach().cpu().item())
-            except Exception:
-                comps_batch[name] = float(val)
-
-        if batch_loss is not None:
-            batch_loss.backward()
-            optim.step()
-
-            bsz = lr.size(0)
-            total_loss += batch_loss.item() * bsz
-            for k, v in comps_batch.items():
-                comps_acc[k] += v * bsz
-
-    n = len(loader.dataset)
-    comps_avg = {k: comps_acc[k] / n for k in comps_acc}
-    return total_loss / n, comps_avg
-
-
-def validate(model, loader, device, loss_fns: dict[str, Callable]):
+        terms = _batch_losses(loss_fns, distill_fns, out, batch, hr, device)
+        if not terms:
+            continue
+        batch_loss = sum(terms.values())
+        batch_loss.backward()
+        optim.step()
+        metrics.add({"loss": batch_loss, **terms}, lr.size(0))
+
+        if log_every and step % log_every == 0:
+            loss, means = _loss_means(metrics)
+            print(f"  step {step}: train={loss:.6f} ({format_metrics(means)})")
+
+    return _loss_means(metrics)
+
+
+def validate(
+    model,
+    loader,
+    device,
+    loss_fns: dict[str, Callable],
+    distill_fns: dict[str, Callable] | None = None,
+    timings: dict | None = None,
+    augment: Callable[[dict], dict] | None = None,
+):
     model.eval()
-    total_loss = 0.0
-    comps_acc = defaultdict(float)
+    metrics = MetricSums()
     with torch.no_grad():
-        for batch in loader:
-            lr = batch["lr"].to(device)
-            hr = batch["hr"].to(device)
+        for batch in _timed_batches(loader, timings):
+            batch = _to_device(batch, device, augment)
+            lr = batch["lr"]
+            hr = batch["hr"]
             out = model(lr)
 
-            batch_loss = None
-            comps_batch = {}
-            for name, fn in loss_fns.items():
-                val = fn(out, hr)
-                if val is None:
-                    continue
-
-                if batch_loss is None:
-                    batch_loss = val
-                else:
-                    batch_loss = batch_loss + val
+            terms = _batch_losses(loss_fns, distill_fns, out, batch, hr, device)
+            if terms:
+                metrics.add({"loss": sum(terms.values()), **terms}, lr.size(0))
 
-                try:
-                    comps_batch[name] = float(val.detach().cpu().item())
-                except Exception:
-                    comps_batch[name] = float(val)
+    return _loss_means(metrics)
 
-            if batch_loss is not None:
-                batch_size = lr.size(0)
-                total_loss += batch_loss.item() * batch_size
-                for k, v in comps_batch.items():
-                    comps_acc[k] += v * batch_size
 
-    n = len(loader.dataset)
-    comps_avg = {k: comps_acc[k] / n for k in comps_acc}
-    return total_loss / n, comps_avg
+def load_state_dict(model, checkpoint_dict):
+    """Load matching keys from checkpoint_dict into model.
 
+    Returns (missing_keys, unexpected_keys)
+    """
+    model_dict = model.state_dict()
+    ckpt_dict = checkpoint_dict
+    if "state_dict" in checkpoint_dict:
+        ckpt_dict = checkpoint_dict["state_dict"]
 
-def make_edge_loss(
-    lambda_edge: float = 0.0,
-):
-    lambda_edge = float(lambda_edge)
+    matched = {}
+    missing = []
+    unexpected = []
+    for k, v in ckpt_dict.items():
+        if k in model_dict and model_dict[k].shape == v.shape:
+            matched[k] = v
+        else:
+            unexpected.append(k)
 
-    def extra_loss(out: torch.Tensor, hr: torch.Tensor):
-        if lambda_edge <= 0:
-            return None
-        edge_out = _sobel_mag(out)
-        edge_hr = _sobel_mag(hr)
-        edge_loss = F.l1_loss(edge_out, edge_hr)
-        return edge_loss * lambda_edge
+    for k in model_dict.keys():
+        if k not in matched:
+            missing.append(k)
 
-    return extra_loss
+    model_dict.update(matched)
+    model.load_state_dict(model_dict)
+    return missing, unexpected
 
 
-def _sobel_mag(x: torch.Tensor) -> torch.Tensor:
-    gray = _rgb_to_gray(x)
-    kernel_x = torch.tensor(
-        [
-            [-1, -2, 0, 2, 1],
-            [-2, -3, 0, 3, 2],
-            [-3, -5, 0, 5, 3],
-            [-2, -3, 0, 3, 2],
-            [-1, -2, 0, 2, 1],
-        ],
-        dtype=torch.float32,
-        device=gray.device,
-    ).view(1, 1, 5, 5)
-
-    kernel_y = kernel_x.transpose(2, 3)
-
-    grad_x = F.conv2d(gray, kernel_x, padding=2)
-    grad_y = F.conv2d(gray, kernel_y, padding=2)
-    mag = torch.sqrt(grad_x * grad_x + grad_y * grad_y + 1e-12)
-    return mag
-
-
-def make_bin_loss(
-    lambda_bin: float = 0.0,
-    bin_k: float = 20.0,
-    bin_thresh: float = 0.1,
-):
-    lambda_bin = float(lambda_bin)
+def make_distill_loss(lambda_distill: float = 1.0):
+    """L1 between the student output and the cached teacher output."""
+    lambda_distill = float(lambda_distill)
 
-    def extra_loss(out: torch.Tensor, hr: torch.Tensor):
-        if lambda_bin <= 0:
+    def extra_loss(
+        out: torch.Tensor, teacher: torch.Tensor, names: list[str] | None = None
+    ):
+        if lambda_distill <= 0:
             return None
-        out_gray = _rgb_to_gray(out)
-        hr_gray = _rgb_to_gray(hr)
-        out_bin = _soft_bin(out_gray, bin_k, bin_thresh)
-        hr_bin = _soft_bin(hr_gray, bin_k, bin_thresh)
-        bin_loss = F.l1_loss(out_bin, hr_bin)
-        return bin_loss * lambda_bin
+        return F.l1_loss(out, teacher) * lambda_distill
 
     return extra_loss
 
 
-class PerceptualLoss(nn.Module):
-    def __init__(self, lambda_vgg=0.1):
-        super().__init__()
-        self.lambda_vgg = lambda_vgg
-
-        vgg = vgg16(weights=VGG16_Weights.IMAGENET1K_V1).features[:16].eval()
-        for p in vgg.parameters():
-            p.requires_grad = False
-
-        self.vgg = vgg
-        self.register_buffer(
-            "mean", torch.tensor([0.485, 0.456, 0.406]).view(1, 3, 1, 1)
-        )
-        self.register_buffer(
-            "std", torch.tensor([0.229, 0.224, 0.225]).view(1, 3, 1, 1)
-        )
-
-    def forward(self, x, y):
-        if self.lambda_vgg <= 0:
-            return None
-        x = (x - self.mean) / self.std
-        y = (y - self.mean) / self.std
-        loss = F.l1_loss(self.vgg(x), self.vgg(y))
-        return loss * self.lambda_vgg
-
-
-def gaussian_window(window_size, sigma):
-    gauss = torch.exp(
-        -((torch.arange(window_size).float() - window_size // 2) ** 2) / (2 * sigma**2)
-    )
-    return gauss / gauss.sum()
-
+def build_teacher_cache(teacher, dataset_root: str, cache_dir: str, device):
+    """
+    Run the teacher once per (un-augmented) LR sample and store its output as
+    {cache_dir}/{split}/{name}.png. Samples already cached are skipped, so
+    the teacher cost is paid once across epochs and runs; HRLRDataset then
+    applies the sample's augmentation to the cached output together with HR.
+    """
+    teacher.eval()
+    for split in ("train", "val"):
+        os.makedirs(os.path.join(cache_dir, split), exist_ok=True)
+        dataset = HRLRDataset(dataset_root, split=split, augment=False)
+        missing = [
+            i
+            for i, b in enumerate(dataset.basenames)
+            if not os.path.exists(os.path.join(cache_dir, split, b + ".png"))
+        ]
+        for i in tqdm(missing, desc=f"Caching teacher outputs ({split})"):
+            sample = dataset[i]
+            with torch.no_grad():
+                out = teacher(sample["lr"].unsqueeze(0).to(device))
+            TF.to_pil_image(out.clamp(0, 1).squeeze(0).cpu()).save(
+                os.path.join(cache_dir, split, sample["name"] + ".png")
+            )
 
-def create_window(window_size, channel):
-    _1D_window = gaussian_window(window_size, 1.5).unsqueeze(1)
-    _2D_window = _1D_window.mm(_1D_window.t()).float().unsqueeze(0).unsqueeze(0)
-    window = _2D_window.expand(channel, 1, window_size, window_size).contiguous()
-    return window
 
+def _count_params(model) -> int:
+    return sum(p.numel() for p in model.parameters())
 
-def ssim(img1, img2, window_size=11, size_average=True):
-    channel = img1.size(1)
-    window = create_window(window_size, channel).to(img1.device)
 
-    mu1 = F.conv2d(img1, window, padding=window_size // 2, groups=channel)
-    mu2 = F.conv2d(img2, window, padding=window_size // 2, groups=channel)
+def model_stats(model, loader, device) -> dict:
+    """
+    Size, cost and quality of a model: parameters, GFLOPs and CPU latency per
+    megapixel on a 256x256 input, and mean L1/PSNR against HR on `loader`.
+    """
+    shape = (1, model.config["n_colors"], 256, 256)
+    x = torch.rand(shape, device=device)
+    model.eval()
+    with torch.no_grad():
+        latency = time_call(lambda: model(x), repeats=5)
+        metrics = MetricSums()
+        for batch in loader:
+            out = model(batch["lr"].to(device)).clamp(0, 1)
+            hr = batch["hr"].to(device)
+            mse = ((out - hr) ** 2).mean(dim=(1, 2, 3))
+            metrics.add(
+                {
+                    "l1": (out - hr).abs().mean(),
+                    "psnr": (-10 * torch.log10(mse.clamp_min(1e-10))).mean(),
+                },
+                hr.size(0),
+            )
+    means = metrics.means()
+    mpx = 256 * 256 / 1e6
+    return {
+        "params": _count_params(model),
+        "gflops_per_mpx": count_flops(model, shape) / 1e9 / mpx,
+        "s_per_mpx": latency / mpx,
+        "val_l1": means.get("l1", 0.0),
+        "val_psnr": means.get("psnr", 0.0),
+    }
 
-    mu1_sq = mu1.pow(2)
-    mu2_sq = mu2.pow(2)
-    mu1_mu2 = mu1 * mu2
 
-    sigma1_sq = (
-        F.conv2d(img1 * img1, window, padding=window_size // 2, groups=channel) - mu1_sq
-    )
-    sigma2_sq = (
-        F.conv2d(img2 * img2, window, padding=window_size // 2, groups=channel) - mu2_sq
-    )
-    sigma12 = (
-        F.conv2d(img1 * img2, window, padding=window_size // 2, groups=channel)
-        - mu1_mu2
+def print_model_stats(stats: dict[str, dict]):
+    """One row per model as returned by `model_stats`."""
+    print(
+        f"{'':<10}{'params':>10}{'GFLOP/MPx':>11}{'s/MPx':>9}{'val L1':>10}{'PSNR':>9}"
     )
+    for name, r in stats.items():
+        print(
+            f"{name:<10}{r['params']:>10}{r['gflops_per_mpx']:>11.2f}"
+            f"{r['s_per_mpx']:>9.3f}{r['val_l1']:>10.5f}{r['val_psnr']:>9.3f}"
+        )
 
-    c1 = 0.01**2
-    c2 = 0.03**2
 
-    ssim_map = ((2 * mu1_mu2 + c1) * (2 * sigma12 + c2)) / (
-        (mu1_sq + mu2_sq + c1) * (sigma1_sq + sigma2_sq + c2)
+def distillation_report(teacher, student, loader, device) -> dict:
+    """Teacher against student, see `model_stats`."""
+    report = {
+        "teacher": model_stats(teacher, loader, device),
+        "student": model_stats(student, loader, device),
+    }
+    t, st = report["teacher"], report["student"]
+    print_model_stats(report)
+    print(
+        f"student: x{t['s_per_mpx'] / st['s_per_mpx']:.2f} faster, "
+        f"{st['val_psnr'] - t['val_psnr']:+.3f} dB PSNR"
     )
+    return report
 
-    if size_average:
-        return ssim_map.mean()
-    else:
-        return ssim_map.mean(1).mean(1).mean(1)
-
-
-def make_ssim_loss(lambda_ssim=0.1):
-    lambda_ssim = float(lambda_ssim)
-
-    def extra_loss(out, hr):
-        if lambda_ssim <= 0:
-            return None
-        return (1 - ssim(out, hr)) * lambda_ssim
-
-    return extra_loss
-
-
-def _rgb_to_gray(x: torch.Tensor) -> torch.Tensor:
-    if x.size(1) == 1:
-        return x
-
-    r, g, b = x[:, 0:1, :, :], x[:, 1:2, :, :], x[:, 2:3, :, :]
-    return 0.2989 * r + 0.5870 * g + 0.1140 * b
-
-
-def _soft_bin(x: torch.Tensor, k: float = 50.0, thresh: float = 0.1) -> torch.Tensor:
-    return torch.sigmoid(k * (x - thresh))
 
+def make_dataset(args, split: str, teacher_cache: str | None):
+    """
+    Stored HR/LR pairs, or LR synthesized online (--online-degradation),
+    mixed with a synthetic numbers/lines stream for training when
+    --synthetic-ratio is set. With only synthetic data, validation uses a
+    fixed synthetic stream.
+    """
+    real = None
+    if args.dataset_root or args.source_dir:
+        real = _make_real_dataset(args, split, teacher_cache)
+    if real is None or (split == "train" and args.synthetic_ratio == 1):
+        # Validation: a fifth of the epoch size, same samples every epoch.
+        return SyntheticStream(
+            scale=args.scale,
+            epoch_size=args.synthetic_epoch_size // (5 if split == "val" else 1),
+            seed=args.seed + (split == "val"),
+        )
+    if split == "train" and args.synthetic_ratio > 0:
+        return SyntheticStream(
+            scale=args.scale,
+            real=real,
+            synthetic_ratio=args.synthetic_ratio,
+            seed=args.seed,
+        )
+    return real
+
+
+def _make_real_dataset(args, split: str, teacher_cache: str | None):
+    if args.online_degradation or args.source_dir:
+        return OnlineDegradationDataset(
+            args.dataset_root,
+            split=split,
+            source_dir=args.source_dir or None,
+            scale=args.scale,
+            cache_dir=args.sample_cache or None,
+            deterministic=split == "val",
+            content_floor=args.content_floor,
+        )
+    return HRLRDataset(
+        args.dataset_root,
+        split=split,
+        augment=args.augment == "pil",
+        teacher_dir=teacher_cache,
+        cache_dir=args.sample_cache or None,
+    )
 
-def load_state_dict(model, checkpoint_dict):
-    """Load matching keys from checkpoint_dict into model.
 
-    Returns (missing_keys, unexpected_keys)
+def make_loader(dataset, args, shuffle: bool, pin_memory: bool) -> DataLoader:
     """
-    model_dict = model.state_dict()
-    ckpt_dict = checkpoint_dict
-    if "state_dict" in checkpoint_dict:
-        ckpt_dict = checkpoint_dict["state_dict"]
+    DataLoader with `args.num_workers` persistent worker processes, so PNG
+    decoding and PIL augmentation overlap with the training step. Shuffling
+    and every worker's `random` state derive from `args.seed`. Streams
+    shuffle themselves and need fresh workers each epoch to see `set_epoch`.
+    """
+    streaming = isinstance(dataset, IterableDataset)
+    worker_opts = {}
+    if args.num_workers > 0:
+        worker_opts = {
+            "persistent_workers": not (args.no_persistent_workers or streaming),
+            "prefetch_factor": args.prefetch_factor,
+            "worker_init_fn": seed_worker,
+        }
+    return DataLoader(
+        dataset,
+        batch_size=args.batch_size,
+        shuffle=shuffle and not streaming,
+        num_workers=args.num_workers,
+        pin_memory=pin_memory,
+        generator=torch.Generator().manual_seed(args.seed),
+        **worker_opts,
+    )
 
-    matched = {}
-    missing = []
-    unexpected = []
-    for k, v in ckpt_dict.items():
-        if k in model_dict and model_dict[k].shape == v.shape:
-            matched[k] = v
-        else:
-            unexpected.append(k)
 
-    for k in model_dict.keys():
-        if k not in matched:
-            missing.append(k)
-
-    model_dict.update(matched)
-    model.load_state_dict(model_dict)
-    return missing, unexpected
+def check_args(p: argparse.ArgumentParser, args):
+    """Reject invalid option combinations through `p.error`."""
+    if not 0 <= args.synthetic_ratio <= 1:
+        p.error("--synthetic-ratio must be in [0, 1]")
+    if not args.dataset_root and not args.source_dir and args.synthetic_ratio < 1:
+        p.error("one of --dataset-root or --source-dir is required")
+    if args.teacher_path and (
+        args.online_degradation or args.source_dir or args.synthetic_ratio
+    ):
+        # Cached teacher outputs are only valid for the stored LR images.
+        p.error("--teacher-path cannot be combined with online or synthetic data")
+    if args.vgg_cache and (
+        args.augment != "none"
+        or args.online_degradation
+        or args.source_dir
+        or args.synthetic_ratio
+        or args.vgg_crop
+    ):
+        # Cached features are only valid while every sample's HR is fixed.
+        p.error(
+            "--vgg-cache needs stored, un-augmented data (--augment none) "
+            "and no --vgg-crop"
+        )
 
 
-def main():
+def make_parser() -> argparse.ArgumentParser:
     p = argparse.ArgumentParser()
-    p.add_argument("--dataset-root", type=str, required=True)
+    p.add_argument(
+        "--dataset-root", type=str, default="", help="Required unless --source-dir"
+    )
     p.add_argument("--batch-size", type=int, default=4)
     p.add_argument("--epochs", type=int, default=100)
     p.add_argument("--lr", type=float, default=1e-3)
@@ -316,6 +423,37 @@ def main():
         default=0.2,
         help="Weight for VGG perceptual loss",
     )
+    p.add_argument(
+        "--vgg-layer",
+        choices=list(VGG_LAYERS),
+        default="relu3_3",
+        help="VGG16 feature layer; relu2_2 is about twice as cheap (experimental: "
+        "not validated on val quality)",
+    )
+    p.add_argument(
+        "--vgg-every",
+        type=int,
+        default=1,
+        help="Apply the perceptual loss every N training steps (weighted by N)",
+    )
+    p.add_argument(
+        "--vgg-crop",
+        type=int,
+        default=None,
+        help="Compare VGG features of one random crop of this size per batch "
+        "(experimental: not validated on val quality)",
+    )
+    p.add_argument(
+        "--vgg-cache",
+        action="store_true",
+        help="Compute the VGG features of every HR sample once and keep them "
+        "(float16, in RAM); needs stored data and --augment none",
+    )
+    p.add_argument(
+        "--vgg-bf16",
+        action="store_true",
+        help="Run the VGG extractor in bfloat16, channels_last",
+    )
     p.add_argument(
         "--lambda-ssim",
         type=float,
@@ -323,21 +461,201 @@ def main():
         help="Weight for SSIM structural loss",
     )
 
+    p.add_argument(
+        "--block-type",
+        choices=BLOCK_TYPES,
+        default="standard",
+        help="ResBlock convs; repconv checkpoints are folded into standard ones "
+        "with convert_checkpoint.py reparameterize",
+    )
+
+    p.add_argument(
+        "--teacher-path",
+        type=str,
+        default="",
+        help="Distillation: train a smaller student to match this checkpoint",
+    )
+    p.add_argument(
+        "--teacher-cache-dir",
+        type=str,
+        default="",
+        help="Where teacher outputs are cached "
+        "(default: <dataset-root>/teacher_<teacher name>)",
+    )
+    p.add_argument(
+        "--lambda-distill",
+        type=float,
+        default=1.0,
+        help="Weight for the L1 loss against the teacher output",
+    )
+    p.add_argument("--student-resblocks", type=int, default=6)
+    p.add_argument("--student-feats", type=int, default=12)
+    p.add_argument("--student-expansion", type=float, default=2.0)
+
+    p.add_argument(
+        "--num-workers",
+        type=int,
+        default=None,
+        help="DataLoader worker processes "
+        "(default: machine profile, else min(4, cpus / 2))",
+    )
+    p.add_argument(
+        "--prefetch-factor",
+        type=int,
+        default=2,
+        help="Batches loaded ahead by each worker",
+    )
+    p.add_argument(
+        "--no-persistent-workers",
+        action="store_true",
+        help="Restart the worker processes every epoch",
+    )
+    p.add_argument(
+        "--augment",
+        choices=["batch", "pil", "none"],
+        default="batch",
+        help="Augment whole batches on the training device (augment.py), "
+        "per sample with PIL in the loader, or not at all",
+    )
+    p.add_argument(
+        "--online-degradation",
+        action="store_true",
+        help="Ignore stored LR files and degrade the HR crops freshly on every "
+        "access (online_dataset.py)",
+    )
+    p.add_argument(
+        "--source-dir",
+        type=str,
+        default="",
+        help="Sample HR crops directly from these source images, with online "
+        "degradation (no generated dataset needed)",
+    )
+    p.add_argument(
+        "--content-floor",
+        type=float,
+        default=None,
+        help="With --source-dir, place crops proportionally to ink coverage; "
+        "weight of a blank crop relative to the densest one (default: uniform)",
+    )
+    p.add_argument(
+        "--synthetic-ratio",
+        type=float,
+        default=0.0,
+        help="Fraction of training samples rendered on the fly as synthetic "
+        "numbers/lines pairs; 1 trains on the synthetic stream alone",
+    )
+    p.add_argument(
+        "--synthetic-epoch-size",
+        type=int,
+        default=2000,
+        help="Samples per epoch when training on synthetic data only",
+    )
+    p.add_argument(
+        "--sample-cache",
+        type=str,
+        default="",
+        help="Decode all samples once into a memory-mapped cache in this folder "
+        "(reused by later runs)",
+    )
+    p.add_argument(
+        "--log-every",
+        type=int,
+        default=0,
+        help="Also print the running training losses every N steps",
+    )
+    p.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Seeds initialization, shuffling and augmentation",
+    )
+
+    p.add_argument(
+        "--threads",
+        dest="num_threads",
+        type=int,
+        default=None,
+        help="torch intra-op threads (default: machine profile, else torch's)",
+    )
+    p.add_argument(
+        "--interop-threads",
+        type=int,
+        default=None,
+        help="torch inter-op threads (default: machine profile, else torch's)",
+    )
+    p.add_argument(
+        "--profile",
+        default=None,
+        help="Machine profile written by autotune.py (default: per-host cache)",
+    )
+    p.add_argument(
+        "--no-profile", action="store_true", help="Ignore the machine profile"
+    )
+    return p
+
+
+def main():
+    p = make_parser()
     args = p.parse_args()
     device = "cuda" if torch.cuda.is_available() else "cpu"
 
-    model = ninasr_b0(scale=args.scale)
+    profile = {} if args.no_profile else load_profile(args.profile)
+    resolve_settings(
+        args,
+        profile.get("training", {}),
+        ["num_threads", "interop_threads", "num_workers"],
+    )
+    apply_threads(args.num_threads, args.interop_threads)
+    if args.num_workers is None:
+        args.num_workers = min(4, (os.cpu_count() or 1) // 2)
+    torch.manual_seed(args.seed)
+    random.seed(args.seed)
+    pin_memory = device == "cuda"
+
+    check_args(p, args)
+
+    teacher = None
+    teacher_cache = None
+    if args.teacher_path:
+        teacher = load_model(args.teacher_path, scale=args.scale, device=device)
+        teacher_cache = args.teacher_cache_dir or os.path.join(
+            args.dataset_root,
+            "teacher_" + os.path.splitext(os.path.basename(args.teacher_path))[0],
+        )
+        build_teacher_cache(teacher, args.dataset_root, teacher_cache, device)
+        model = NinaSR(
+            args.student_resblocks,
+            args.student_feats,
+            args.scale,
+            expansion=args.student_expansion,
+            block_type=args.block_type,
+        )
+    else:
+        model = ninasr_b0(scale=args.scale, block_type=args.block_type)
     model.to(device)
 
     loss_fns = {
-        "l1": nn.L1Loss(),
-        "edge": make_edge_loss(lambda_edge=args.lambda_edge),
-        "bin": make_bin_loss(
-            lambda_bin=args.lambda_bin, bin_k=args.bin_k, bin_thresh=args.bin_thresh
-        ),
-        "vgg": PerceptualLoss(lambda_vgg=args.lambda_vgg).to(device),
-        "ssim": make_ssim_loss(lambda_ssim=args.lambda_ssim),
+        "fused": FusedLoss(
+            lambda_edge=args.lambda_edge,
+            lambda_bin=args.lambda_bin,
+            bin_k=args.bin_k,
+            bin_thresh=args.bin_thresh,
+            lambda_ssim=args.lambda_ssim,
+            perceptual=PerceptualLoss(
+                args.lambda_vgg,
+                layer=args.vgg_layer,
+                every=args.vgg_every,
+                crop=args.vgg_crop,
+                cache=args.vgg_cache,
+                bf16=args.vgg_bf16,
+            )
+            if args.lambda_vgg > 0
+            else None,
+        ).to(device)
     }
+    distill_fns = (
+        {"distill": make_distill_loss(args.lambda_distill)} if teacher else None
+    )
 
     if args.pretrained_path:
         print("Loading pretrained:", args.pretrained_path)
@@ -345,50 +663,95 @@ def main():
         missing, unexpected = load_state_dict(model, ck)
         print("Missing keys:", missing, "Unexpected ckpt keys:", unexpected)
 
-    loader = DataLoader(
-        HRLRDataset(args.dataset_root, split="train", augment=True),
-        batch_size=args.batch_size,
+    loader = make_loader(
+        make_dataset(args, "train", teacher_cache),
+        args,
         shuffle=True,
-        num_workers=0,
+        pin_memory=pin_memory,
     )
 
     trainable = [p for p in model.parameters() if p.requires_grad]
     optim = torch.optim.Adam(trainable, lr=args.lr)
 
     best_val = float("inf")
-    val_loader = DataLoader(
-        HRLRDataset(args.dataset_root, split="val", augment=True),
-        batch_size=args.batch_size,
+    val_loader = make_loader(
+        make_dataset(args, "val", teacher_cache),
+        args,
         shuffle=True,
-        num_workers=0,
+        pin_memory=pin_memory,
     )
 
+    augment = BatchAugment(seed=args.seed) if args.augment == "batch" else None
+
     for epoch in range(1, args.epochs + 1):
         start = time.time()
-        train_loss, train_comps = train(model, loader, optim, device, loss_fns=loss_fns)
-        val_loss, val_comps = validate(model, val_loader, device, loss_fns=loss_fns)
+        # Per phase, so validation does not blur the training loader numbers.
+        timings = {phase: {"data": 0.0, "compute": 0.0} for phase in ("train", "val")}
+        if isinstance(loader.dataset, SyntheticStream):
+            loader.dataset.set_epoch(epoch)
+        train_loss, train_comps = train(
+            model,
+            loader,
+            optim,
+            device,
+            loss_fns=loss_fns,
+            distill_fns=distill_fns,
+            timings=timings["train"],
+            augment=augment,
+            log_every=args.log_every,
+        )
+        # Validation draws from its own generator, restarted every epoch, so
+        # it does not shift the training augmentation stream.
+        val_augment = BatchAugment(seed=args.seed + 1) if augment is not None else None
+        val_loss, val_comps = validate(
+            model,
+            val_loader,
+            device,
+            loss_fns=loss_fns,
+            distill_fns=distill_fns,
+            timings=timings["val"],
+            augment=val_augment,
+        )
         elapsed = time.time() - start
 
-        def fmt_comps(comps: dict) -> str:
-            return " ".join(
-                [f"{k.upper()}={comps.get(k, 0.0):.6f}" for k in sorted(comps.keys())]
-            )
-
-        train_str = fmt_comps(train_comps)
-        val_str = fmt_comps(val_comps)
+        train_str = format_metrics(train_comps)
+        val_str = format_metrics(val_comps)
         print(
             f"Epoch {epoch}: train={train_loss:.6f} ({train_str}) val={val_loss:.6f} ({val_str}) time={elapsed:.1f}s"
+            f" (train data wait={timings['train']['data']:.1f}s"
+            f" compute={timings['train']['compute']:.1f}s,"
+            f" val data wait={timings['val']['data']:.1f}s"
+            f" compute={timings['val']['compute']:.1f}s)"
         )
 
         os.makedirs(os.path.dirname(args.checkpoint_out) or ".", exist_ok=True)
-        state = {"epoch": epoch, "state_dict": model.state_dict(), "args": vars(args)}
+        state = {
+            "epoch": epoch,
+            "state_dict": model.state_dict(),
+            "model_config": model.config,
+            "args": vars(args),
+        }
         torch.save(state, args.checkpoint_out)
         if val_loss < best_val:
             best_val = val_loss
             best_path = os.path.splitext(args.checkpoint_out)[0] + "_best_model.pt"
-            torch.save(model.state_dict(), best_path)
+            torch.save(
+                {"state_dict": model.state_dict(), "model_config": model.config},
+                best_path,
+            )
             print("Saved best model to", best_path)
 
+    if teacher is not None:
+        report_loader = DataLoader(
+            HRLRDataset(args.dataset_root, split="val", augment=False),
+            batch_size=args.batch_size,
+        )
+        report = distillation_report(teacher, model, report_loader, device)
+        report_path = os.path.splitext(args.checkpoint_out)[0] + "_distill_report.json"
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print("Saved distillation report to", report_path)
+
 
 if __name__ == "__main__":
     main()
@@ -5,22 +5,33 @@ sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
 import os
 
+import numpy as np
 import torch
-import torchvision.transforms.functional as TF
-from image_utils import bileteral_smooth
-from ninasr import ChoppedModel, SelfEnsembleModel, ninasr_b0
+from image_utils import is_grayscale, rgb_to_luma
+from machine_profile import apply_threads, load_profile, resolve_settings
+from ninasr import SelfEnsembleModel, build_ninasr, ninasr_b0
+from output_modes import (
+    OUTPUT_FORMATS,
+    OUTPUT_MODES,
+    OutputMode,
+    RGBOutput,
+    make_output_mode,
+)
 from PIL import Image
+from planner import calibrate, plan_run
+from tiling import PREPROCESS_STAGES, TiledUpscaler
 from tqdm import tqdm
 
 
 def load_model(model_path: str, scale: int, device: str):
-    model = ninasr_b0(scale=scale)
-    model.to(device)
     if not model_path:
-        return model
+        return ninasr_b0(scale=scale).to(device)
 
     ck = torch.load(model_path, map_location=device)
     state_dict = ck.get("state_dict", ck) if isinstance(ck, dict) else ck
+    config = ck.get("model_config") if isinstance(ck, dict) else None
+    model = build_ninasr(scale, config)
+    model.to(device)
     model_dict = model.state_dict()
     matched = {
         k: v
@@ -34,8 +45,86 @@ def load_model(model_path: str, scale: int, device: str):
     return model
 
 
-def predict(source_dir, output_dir, model, device, scale=2, include_multiple=False):
-    """Generate SR images from source_dir using model and save to output_dir.
+def list_images(source_dir: str) -> list[str]:
+    return [
+        f
+        for f in os.listdir(source_dir)
+        if f.lower().endswith((".png", ".jpg", ".jpeg", ".webp"))
+    ]
+
+
+def plan(args, model, output: OutputMode, device: str):
+    """Estimate time, memory and disk usage of the run described by args."""
+    image_files = list_images(args.source_dir)
+    if not image_files:
+        print(f"No images found in {args.source_dir}.")
+        return
+
+    preprocess = PREPROCESS_STAGES[args.preprocess]()
+    chop_size = args.chop_size if args.chop else None
+    print("Calibrating on this machine...")
+    calib = calibrate(
+        model,
+        scale=2,
+        output=output,
+        preprocess=preprocess,
+        tile_size=min(chop_size or 256, 256),
+        device=device,
+        output_format=args.output_format,
+    )
+    plan_run(
+        [os.path.join(args.source_dir, f) for f in sorted(image_files)],
+        calib,
+        model.config,
+        scale=2,
+        chop_size=chop_size,
+        chop_overlap=args.chop_overlap,
+        ensemble=args.ensemble,
+        tile_batch=args.tile_batch,
+        passes=2 if args.include_multiple else 1,
+        output_channels=output.channels(3),
+        preprocess=preprocess is not None,
+        memory_budget=args.memory_budget * 2**20 if args.memory_budget else None,
+    )
+
+
+def _run_pass(
+    upscaler: TiledUpscaler,
+    luma: bool,
+    arr: np.ndarray,
+    preprocess: bool,
+    output: OutputMode,
+) -> np.ndarray:
+    """One upscaling pass; gray output modes keep a single channel between passes."""
+    if luma and arr.shape[2] == 3:
+        arr = rgb_to_luma(arr)
+    elif not luma and arr.shape[2] == 1:
+        arr = np.repeat(arr, 3, axis=2)
+    return upscaler.upscale(arr, preprocess=preprocess, output=output)
+
+
+def predict(
+    source_dir,
+    output_dir,
+    upscaler: TiledUpscaler,
+    scale=2,
+    include_multiple=False,
+    luma_upscaler: TiledUpscaler | None = None,
+    output: OutputMode | None = None,
+    output_format: str = "png",
+):
+    """Generate SR images from source_dir using upscaler and save to output_dir.
+
+    Preprocessing (bilateral smoothing) is run per tile inside the upscaler,
+    so the full image is only decoded once and never copied as a whole.
+
+    If luma_upscaler (a single-channel model) is given, effectively grayscale
+    images are routed to it as one luminance channel and the result is
+    replicated back to RGB, which moves and computes a third of the data.
+
+    output selects how results are stored and written (24-bit RGB by default,
+    or 1-bit / small-palette indexed images for line art, see output_modes),
+    output_format picks PNG or TIFF.
 
     If include_multiple is True, the function will iteratively feed the model's
     output back into the model to produce twice- and thrice-processed images
@@ -43,11 +132,7 @@ def predict(source_dir, output_dir, model, device, scale=2, include_multiple=Fal
     suffix.
     """
 
-    image_files = [
-        f
-        for f in os.listdir(source_dir)
-        if f.lower().endswith((".png", ".jpg", ".jpeg", ".webp"))
-    ]
+    image_files = list_images(source_dir)
 
     if not image_files:
         print(f"No images found in {source_dir}. Please place clean images there.")
@@ -55,41 +140,41 @@ def predict(source_dir, output_dir, model, device, scale=2, include_multiple=Fal
 
     os.makedirs(output_dir, exist_ok=True)
 
+    output = output or RGBOutput()
+    ext = OUTPUT_FORMATS[output_format]
+
+    n_luma = 0
     for filename in tqdm(image_files, desc="Generating SR outputs"):
         img_path = os.path.join(source_dir, filename)
         try:
             with Image.open(img_path) as img:
-                img = img.convert("RGB")
-                img = bileteral_smooth(img)
-
-                input_t = TF.to_tensor(img).unsqueeze(0).to(device)
-                with torch.no_grad():
-                    out_t = model(input_t)
-
-                out_t = out_t.clamp(0, 1).squeeze(0).cpu()
-                out_img = TF.to_pil_image(out_t)
-
-                base_no_ext = os.path.splitext(filename)[0]
-                out_name = f"{base_no_ext}_scaled_x{scale}_pass1.png"
-                out_img.save(os.path.join(output_dir, out_name))
-
-                if include_multiple:
-                    prev_img = out_img
-                    for p in (2,):
-                        input_t = TF.to_tensor(prev_img).unsqueeze(0).to(device)
-                        with torch.no_grad():
-                            out_t = model(input_t)
-
-                        out_t = out_t.clamp(0, 1).squeeze(0).cpu()
-                        out_img = TF.to_pil_image(out_t)
-
-                        overall_scale = scale**p
-                        out_name = f"{base_no_ext}_scaled_x{overall_scale}_pass{p}.png"
-                        out_img.save(os.path.join(output_dir, out_name))
-                        prev_img = out_img
+                img_arr = np.asarray(img.convert("RGB"))
+
+            luma = luma_upscaler is not None and is_grayscale(img_arr)
+            image_upscaler = luma_upscaler if luma else upscaler
+            n_luma += luma
+
+            canvas = _run_pass(image_upscaler, luma, img_arr, True, output)
+
+            base_no_ext = os.path.splitext(filename)[0]
+            out_name = f"{base_no_ext}_scaled_x{scale}_pass1{ext}"
+            output.save(output.finish(canvas), os.path.join(output_dir, out_name))
+
+            if include_multiple:
+                for p in (2,):
+                    canvas = _run_pass(image_upscaler, luma, canvas, False, output)
+
+                    overall_scale = scale**p
+                    out_name = f"{base_no_ext}_scaled_x{overall_scale}_pass{p}{ext}"
+                    output.save(
+                        output.finish(canvas), os.path.join(output_dir, out_name)
+                    )
         except Exception as e:
             print(f"Error processing {filename}: {e}")
 
+    if luma_upscaler is not None:
+        print(f"{n_luma}/{len(image_files)} images processed by the luma model")
+
 
 if __name__ == "__main__":
     import argparse
@@ -109,6 +194,12 @@ if __name__ == "__main__":
     parser.add_argument(
         "-m", "--model-path", required=True, help="Path to .pth model checkpoint"
     )
+    parser.add_argument(
+        "--luma-model-path",
+        default="",
+        help="Optional 1-channel checkpoint (see convert_checkpoint.py luma) "
+        "used for grayscale inputs",
+    )
     parser.add_argument(
         "--ensemble", action="store_true", help="Enable self-ensemble wrapper"
     )
@@ -120,8 +211,37 @@ if __name__ == "__main__":
     parser.add_argument(
         "--chop-size",
         type=int,
-        default=256,
-        help="Tile size for chopped inference (default: 256)",
+        default=None,
+        help="Tile size for chopped inference (default: machine profile, else 256)",
+    )
+    parser.add_argument(
+        "--tile-batch",
+        type=int,
+        default=None,
+        help="Tiles per forward pass (default: machine profile, else 1)",
+    )
+    parser.add_argument(
+        "--threads",
+        dest="num_threads",
+        type=int,
+        default=None,
+        help="torch intra-op threads (default: machine profile, else torch's)",
+    )
+    parser.add_argument(
+        "--interop-threads",
+        type=int,
+        default=None,
+        help="torch inter-op threads (default: machine profile, else torch's)",
+    )
+    parser.add_argument(
+        "--profile",
+        default=None,
+        help="Machine profile written by autotune.py (default: per-host cache)",
+    )
+    parser.add_argument(
+        "--no-profile",
+        action="store_true",
+        help="Ignore the machine profile",
     )
     parser.add_argument(
         "--chop-overlap",
@@ -134,10 +254,63 @@ if __name__ == "__main__":
         action="store_true",
         help="Also save outputs after processing images twice and thrice (iterative passes)",
     )
+    parser.add_argument(
+        "--preprocess",
+        choices=sorted(PREPROCESS_STAGES),
+        default="bilateral",
+        help="Per-tile preprocessing applied before the model (default: bilateral)",
+    )
+    parser.add_argument(
+        "--output-mode",
+        choices=OUTPUT_MODES,
+        default="rgb",
+        help="rgb (default), binary (1-bit) or palette (indexed gray levels)",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=None,
+        help="Binary mode threshold in [0, 1] (default: Otsu per image)",
+    )
+    parser.add_argument(
+        "--palette-size",
+        type=int,
+        default=4,
+        help="Number of gray levels in palette mode (default: 4)",
+    )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="Only estimate runtime, peak memory and disk usage from image "
+        "headers and a short calibration, then exit",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=int,
+        default=None,
+        help="With --plan: flag images whose peak RSS exceeds this many MiB "
+        "and suggest tile settings that fit",
+    )
+    parser.add_argument(
+        "--output-format",
+        choices=sorted(OUTPUT_FORMATS),
+        default="png",
+        help="Output file format (default: png)",
+    )
 
     args = parser.parse_args()
     device = "cuda" if torch.cuda.is_available() else "cpu"
 
+    profile = {} if args.no_profile else load_profile(args.profile)
+    resolve_settings(
+        args,
+        profile.get("inference", {}),
+        ["chop_size", "tile_batch", "num_threads", "interop_threads"],
+    )
+    args.chop_size = args.chop_size or 256
+    args.tile_batch = args.tile_batch or 1
+    apply_threads(args.num_threads, args.interop_threads)
+
     if not os.path.exists(args.source_dir):
         os.makedirs(args.source_dir)
         print(
@@ -145,25 +318,43 @@ if __name__ == "__main__":
         )
         raise SystemExit(1)
 
-    model = load_model(args.model_path, scale=2, device=device)
+    output = make_output_mode(args.output_mode, args.threshold, args.palette_size)
 
-    if args.chop:
-        model = ChoppedModel(
-            model, scale=2, chop_size=args.chop_size, chop_overlap=args.chop_overlap
-        )
-        model.to(device)
+    if args.plan:
+        plan(args, load_model(args.model_path, scale=2, device=device), output, device)
+        raise SystemExit(0)
 
-    if args.ensemble:
-        model = SelfEnsembleModel(model)
-        model.to(device)
+    def make_upscaler(model_path: str) -> TiledUpscaler:
+        model = load_model(model_path, scale=2, device=device)
 
-    model.eval()
+        if args.ensemble:
+            model = SelfEnsembleModel(model)
+            model.to(device)
+
+        model.eval()
+
+        return TiledUpscaler(
+            model,
+            scale=2,
+            chop_size=args.chop_size if args.chop else None,
+            chop_overlap=args.chop_overlap,
+            preprocess=PREPROCESS_STAGES[args.preprocess](),
+            device=device,
+            tile_batch=args.tile_batch,
+        )
+
+    upscaler = make_upscaler(args.model_path)
+    luma_upscaler = (
+        make_upscaler(args.luma_model_path) if args.luma_model_path else None
+    )
 
     predict(
         source_dir=args.source_dir,
         output_dir=args.output_dir,
-        model=model,
-        device=device,
+        upscaler=upscaler,
         scale=2,
         include_multiple=args.include_multiple,
+        luma_upscaler=luma_upscaler,
+        output=output,
+        output_format=args.output_format,
     )
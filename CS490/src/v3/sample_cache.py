@@ -0,0 +1,101 @@
+"""
+Decoded sample cache for HRLRDataset.
+
+All images of a split are decoded once into one flat uint8 file that is
+memory-mapped read-only by every process. DataLoader workers then share the
+same physical pages through the OS page cache instead of each decoding (and
+holding) their own copies, and later runs skip PNG decoding entirely. The
+cache is rebuilt when any source file changes size or modification time.
+
+Layout of {cache_dir}/{split}.bin / {split}.json:
+    .bin   all images back to back as (H, W, 3) uint8
+    .json  {"sources": {path: [size, mtime_ns]},
+            "index": {"<kind>/<name>": [offset, height, width]}}
+"""
+
+import json
+import os
+
+import numpy as np
+from PIL import Image
+from tqdm import tqdm
+
+
+def _signature(path: str) -> list[int]:
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+class SampleCache:
+    """
+    Read-only view of a built cache. The memory map is opened lazily in each
+    process and never pickled, so handing the cache to DataLoader workers
+    does not copy the data.
+    """
+
+    def __init__(self, data_path: str, index: dict[str, list[int]]):
+        self.data_path = data_path
+        self.index = index
+        self._data = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_data"] = None
+        return state
+
+    def get(self, kind: str, name: str) -> np.ndarray:
+        if self._data is None:
+            self._data = np.memmap(self.data_path, dtype=np.uint8, mode="r")
+        offset, height, width = self.index[f"{kind}/{name}"]
+        size = height * width * 3
+        return self._data[offset : offset + size].reshape(height, width, 3)
+
+    def __contains__(self, key: tuple[str, str]) -> bool:
+        return f"{key[0]}/{key[1]}" in self.index
+
+
+def _build(cache_dir: str, split: str, files: dict[str, str], sources: dict):
+    """Decode every file into {split}.bin; written to a temp file, then renamed."""
+    sizes = {}
+    for key, path in files.items():
+        with Image.open(path) as im:  # header only
+            sizes[key] = im.size
+    total = sum(w * h * 3 for w, h in sizes.values())
+
+    data_path = os.path.join(cache_dir, f"{split}.bin")
+    tmp_path = data_path + ".tmp"
+    data = np.memmap(tmp_path, dtype=np.uint8, mode="w+", shape=(max(total, 1),))
+    index = {}
+    offset = 0
+    for key, path in tqdm(files.items(), desc=f"Caching decoded {split} samples"):
+        with Image.open(path) as im:
+            arr = np.asarray(im.convert("RGB"))
+        data[offset : offset + arr.size] = arr.ravel()
+        index[key] = [offset, arr.shape[0], arr.shape[1]]
+        offset += arr.size
+    data.flush()
+    del data
+    os.replace(tmp_path, data_path)
+
+    with open(os.path.join(cache_dir, f"{split}.json"), "w") as f:
+        json.dump({"sources": sources, "index": index}, f)
+    return index
+
+
+def open_sample_cache(cache_dir: str, split: str, files: dict[str, str]) -> SampleCache:
+    """
+    Open the cache of `files` ({"<kind>/<name>": png path}), building it
+    upfront if it is missing or any source changed.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    sources = {path: _signature(path) for path in files.values()}
+    index_path = os.path.join(cache_dir, f"{split}.json")
+    index = None
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            meta = json.load(f)
+        if meta["sources"] == sources and set(meta["index"]) == set(files):
+            index = meta["index"]
+    if index is None:
+        index = _build(cache_dir, split, files, sources)
+    return SampleCache(os.path.join(cache_dir, f"{split}.bin"), index)
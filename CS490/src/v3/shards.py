@@ -0,0 +1,235 @@
+"""
+Packed shard format for HR/LR datasets.
+
+Instead of two PNG files per sample under {split}/{hr,lr}, samples are
+appended to large binary shards as raw (or zlib-compressed, lossless) uint8
+arrays, with one compact index per split:
+
+    {root}/{split}/shards/shard_00000.bin, shard_00001.bin, ...
+    {root}/{split}/shards/index.json
+        {"compression": "raw" | "zlib",
+         "fields": [...], "samples": [[name, shard, hr_offset, hr_nbytes,
+                                       hr_h, hr_w, lr_offset, lr_nbytes,
+                                       lr_h, lr_w], ...]}
+
+Raw shards are read through a memory map with zero-copy random access;
+zlib shards trade a fast decompress per read for 5-20x smaller files on
+line art. `HRLRDataset` uses the shards automatically when the index
+exists.
+
+Convert an existing PNG folder dataset:
+    python shards.py -i dataset -o dataset [--compression zlib]
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import zlib
+
+import numpy as np
+from PIL import Image
+from tqdm import tqdm
+
+FIELDS = [
+    "name",
+    "shard",
+    "hr_offset",
+    "hr_nbytes",
+    "hr_h",
+    "hr_w",
+    "lr_offset",
+    "lr_nbytes",
+    "lr_h",
+    "lr_w",
+]
+COMPRESSIONS = ["raw", "zlib"]
+
+
+def shard_dir(root: str, split: str) -> str:
+    return os.path.join(root, split, "shards")
+
+
+def has_shards(root: str, split: str) -> bool:
+    return os.path.exists(os.path.join(shard_dir(root, split), "index.json"))
+
+
+class ShardWriter:
+    """
+    Appends samples to the shards of one split; starts a new shard file
+    once the current one exceeds `shard_size_mb`. Appending to an existing
+    split continues its index in a fresh shard. Use as a context manager,
+    the index is written on close.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        split: str,
+        compression: str = "raw",
+        shard_size_mb: int = 256,
+    ):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression '{compression}'")
+        self.dir = shard_dir(root, split)
+        os.makedirs(self.dir, exist_ok=True)
+        self.shard_bytes = shard_size_mb * 1024 * 1024
+        self.samples = []
+        self.compression = compression
+        self.n_shards = 0
+
+        index_path = os.path.join(self.dir, "index.json")
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                index = json.load(f)
+            if index["compression"] != compression:
+                raise ValueError(
+                    f"{self.dir} is {index['compression']}-compressed, "
+                    f"cannot append {compression} samples"
+                )
+            self.samples = index["samples"]
+            self.n_shards = 1 + max((s[1] for s in self.samples), default=-1)
+        # Owns the open shard file once `_open_next` has fully opened it.
+        self._files = contextlib.ExitStack()
+        self._file = None
+        self._offset = 0
+
+    def _encode(self, arr: np.ndarray) -> bytes:
+        data = np.ascontiguousarray(arr, dtype=np.uint8).tobytes()
+        return zlib.compress(data, 6) if self.compression == "zlib" else data
+
+    def add(self, name: str, hr: np.ndarray, lr: np.ndarray):
+        """Append one sample; `hr` and `lr` are (H, W, 3) uint8 arrays."""
+        if self._file is None or self._offset >= self.shard_bytes:
+            self._open_next()
+        row = [name, self.n_shards - 1]
+        for arr in (hr, lr):
+            data = self._encode(arr)
+            self._file.write(data)
+            row += [self._offset, len(data), arr.shape[0], arr.shape[1]]
+            self._offset += len(data)
+        self.samples.append(row)
+
+    def remove(self, names: list[str]):
+        """
+        Drop samples from the index. Their bytes stay behind in the shard
+        files; regenerating into a fresh root reclaims the space.
+        """
+        names = set(names)
+        self.samples = [row for row in self.samples if row[0] not in names]
+
+    def _open_next(self):
+        self._files.close()
+        self._file = None
+        path = os.path.join(self.dir, f"shard_{self.n_shards:05d}.bin")
+        with contextlib.ExitStack() as stack:
+            self._file = stack.enter_context(open(path, "wb"))
+            self._files = stack.pop_all()
+        self._offset = 0
+        self.n_shards += 1
+
+    def close(self):
+        self._files.close()
+        self._file = None
+        with open(os.path.join(self.dir, "index.json"), "w") as f:
+            json.dump(
+                {
+                    "compression": self.compression,
+                    "fields": FIELDS,
+                    "samples": self.samples,
+                },
+                f,
+                separators=(",", ":"),
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ShardReader:
+    """
+    Random access to the samples of one split. Shard memory maps are opened
+    lazily per process and dropped when pickled, so DataLoader workers map
+    the files themselves instead of receiving copies.
+    """
+
+    def __init__(self, root: str, split: str):
+        self.dir = shard_dir(root, split)
+        with open(os.path.join(self.dir, "index.json")) as f:
+            index = json.load(f)
+        self.compression = index["compression"]
+        self.samples = index["samples"]
+        self.names = [s[0] for s in self.samples]
+        self._by_name = {name: i for i, name in enumerate(self.names)}
+        self._maps = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_maps"] = {}
+        return state
+
+    def __len__(self):
+        return len(self.samples)
+
+    def _map(self, shard: int) -> np.memmap:
+        if shard not in self._maps:
+            path = os.path.join(self.dir, f"shard_{shard:05d}.bin")
+            self._maps[shard] = np.memmap(path, dtype=np.uint8, mode="r")
+        return self._maps[shard]
+
+    def get(self, name: str, kind: str) -> np.ndarray:
+        """(H, W, 3) uint8 array of `kind` ("hr" or "lr") for sample `name`."""
+        row = self.samples[self._by_name[name]]
+        offset, nbytes, h, w = row[2:6] if kind == "hr" else row[6:10]
+        data = self._map(row[1])[offset : offset + nbytes]
+        if self.compression == "zlib":
+            data = np.frombuffer(zlib.decompress(data), dtype=np.uint8)
+        return data.reshape(h, w, 3)
+
+
+def convert_folder(
+    input_root: str,
+    output_root: str,
+    compression: str = "raw",
+    shard_size_mb: int = 256,
+):
+    """Pack {input_root}/{split}/{hr,lr}/*.png into shards under output_root."""
+    # Imported here: dataset imports this module for its shard backend.
+    from dataset import _refresh_file_lists_for
+
+    for split in ("train", "val"):
+        if not os.path.isdir(os.path.join(input_root, split, "hr")):
+            continue
+        if has_shards(output_root, split):
+            raise FileExistsError(f"{shard_dir(output_root, split)} already exists")
+        _, _, basenames = _refresh_file_lists_for(input_root, split)
+        with ShardWriter(output_root, split, compression, shard_size_mb) as writer:
+            for base in tqdm(basenames, desc=f"Packing {split}"):
+                arrays = []
+                for kind in ("hr", "lr"):
+                    path = os.path.join(input_root, split, kind, base + ".png")
+                    with Image.open(path) as im:
+                        arrays.append(np.asarray(im.convert("RGB")))
+                writer.add(base, *arrays)
+        print(f"Packed {len(basenames)} {split} samples into {writer.n_shards} shards")
+
+
+def main():
+    p = argparse.ArgumentParser(
+        description="Convert a {split}/{hr,lr} PNG dataset to packed shards"
+    )
+    p.add_argument("-i", "--input-root", required=True)
+    p.add_argument("-o", "--output-root", required=True)
+    p.add_argument("--compression", choices=COMPRESSIONS, default="raw")
+    p.add_argument("--shard-size-mb", type=int, default=256)
+    args = p.parse_args()
+    convert_folder(
+        args.input_root, args.output_root, args.compression, args.shard_size_mb
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+Tiled inference engine.
+
+The image stays a uint8 (H, W, C) array until a tile is about to be fed to
+the model: every tile is cut (with the halo its preprocessing needs),
+preprocessed, converted to a tensor and upscaled. Preprocessing of the next
+tile runs on a helper thread while the model works on the current one
+(OpenCV and torch both release the GIL), so the stages overlap and operate
+on small, cache-resident buffers instead of full-image copies.
+"""
+
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+from image_utils import BILATERAL_HALO, bilateral_smooth_array
+from ninasr import _get_windows
+from output_modes import OutputMode, RGBOutput
+
+
+class TileStage:
+    """
+    Per-tile uint8 preprocessing step.
+
+    `fn` maps an (h, w, C) uint8 array to an array of the same shape, `halo`
+    is the number of context pixels it needs on every side of a tile for the
+    result to match running `fn` on the whole image.
+    """
+
+    def __init__(self, fn: Callable[[np.ndarray], np.ndarray], halo: int):
+        self.fn = fn
+        self.halo = halo
+
+    def __call__(self, img: np.ndarray, rows: slice, cols: slice) -> np.ndarray:
+        height, width = img.shape[:2]
+        r0 = max(rows.start - self.halo, 0)
+        r1 = min(rows.stop + self.halo, height)
+        c0 = max(cols.start - self.halo, 0)
+        c1 = min(cols.stop + self.halo, width)
+        out = self.fn(np.ascontiguousarray(img[r0:r1, c0:c1]))
+        dr = rows.start - r0
+        dc = cols.start - c0
+        return out[dr : dr + rows.stop - rows.start, dc : dc + cols.stop - cols.start]
+
+
+def bilateral_stage() -> TileStage:
+    return TileStage(bilateral_smooth_array, BILATERAL_HALO)
+
+
+PREPROCESS_STAGES: dict[str, Callable[[], TileStage | None]] = {
+    "bilateral": bilateral_stage,
+    "none": lambda: None,
+}
+
+
+class Tile:
+    """
+    One tile of the grid: the input region fed to the model, and which part
+    of the upscaled output is kept (the rest is overlap owned by neighbours).
+    """
+
+    def __init__(self, rows: slice, cols: slice, keep_rows: slice, keep_cols: slice):
+        self.rows = rows
+        self.cols = cols
+        self.keep_rows = keep_rows
+        self.keep_cols = keep_cols
+
+
+def _axis_tiles(
+    size: int, chop_size: int, chop_overlap: int
+) -> list[tuple[slice, slice]]:
+    """Return (input range, kept range relative to the tile) along one axis."""
+    if size <= chop_size:
+        return [(slice(0, size), slice(0, size))]
+
+    starts = _get_windows(size, chop_size, chop_overlap)
+    out = []
+    for i, s in enumerate(starts):
+        e = min(s + chop_size, size)
+        lo = 0 if i == 0 else chop_overlap // 2
+        hi = 0 if i == len(starts) - 1 else chop_overlap - chop_overlap // 2
+        out.append((slice(s, e), slice(lo, e - s - hi)))
+    return out
+
+
+def make_tiles(
+    height: int, width: int, chop_size: int | None, chop_overlap: int
+) -> list[Tile]:
+    """
+    Same windows and seams as `ChoppedModel`; `chop_size=None` means the
+    whole image is a single tile.
+    """
+    if chop_size is None:
+        return [
+            Tile(slice(0, height), slice(0, width), slice(0, height), slice(0, width))
+        ]
+    if chop_overlap > chop_size / 2:
+        raise ValueError(
+            f"Chop size {chop_size} is too small for overlap {chop_overlap}"
+        )
+
+    row_tiles = _axis_tiles(height, chop_size, chop_overlap)
+    col_tiles = _axis_tiles(width, chop_size, chop_overlap)
+    return [
+        Tile(rows, cols, keep_rows, keep_cols)
+        for rows, keep_rows in row_tiles
+        for cols, keep_cols in col_tiles
+    ]
+
+
+def batch_tiles(tiles: list[Tile], batch_size: int) -> list[list[Tile]]:
+    """
+    Group consecutive tiles of identical shape into batches of at most
+    `batch_size`, so several tiles go through the model in one forward.
+    """
+    batches: list[list[Tile]] = []
+    for tile in tiles:
+        shape = (tile.rows.stop - tile.rows.start, tile.cols.stop - tile.cols.start)
+        if batches and len(batches[-1]) < batch_size:
+            last = batches[-1][-1]
+            last_shape = (
+                last.rows.stop - last.rows.start,
+                last.cols.stop - last.cols.start,
+            )
+            if last_shape == shape:
+                batches[-1].append(tile)
+                continue
+        batches.append([tile])
+    return batches
+
+
+def _scaled(s: slice, scale: int, offset: int = 0) -> slice:
+    return slice(offset + s.start * scale, offset + s.stop * scale)
+
+
+class TiledUpscaler:
+    """
+    Runs `model` tile by tile over uint8 images.
+
+    Args:
+        model: super-resolution model (may be wrapped, e.g. self-ensemble)
+        scale: upscaling factor of the model
+        chop_size: tile size in input pixels, None to process whole images
+        chop_overlap: overlap between neighbouring tiles in input pixels
+        preprocess: optional per-tile stage applied before the model
+        device: device the model lives on
+        tile_batch: number of same-sized tiles stacked into one forward
+    """
+
+    def __init__(
+        self,
+        model: torch.nn.Module,
+        scale: int,
+        chop_size: int | None = None,
+        chop_overlap: int = 0,
+        preprocess: TileStage | None = None,
+        device: str = "cpu",
+        tile_batch: int = 1,
+    ):
+        self.model = model
+        self.scale = scale
+        self.chop_size = chop_size
+        self.chop_overlap = chop_overlap
+        self.preprocess = preprocess
+        self.device = device
+        self.tile_batch = tile_batch
+
+    def _prepare(
+        self, img: np.ndarray, batch: list[Tile], preprocess: bool
+    ) -> torch.Tensor:
+        arrs = []
+        for tile in batch:
+            if preprocess and self.preprocess is not None:
+                arrs.append(self.preprocess(img, tile.rows, tile.cols))
+            else:
+                arrs.append(img[tile.rows, tile.cols])
+        x = torch.from_numpy(np.stack(arrs)).permute(0, 3, 1, 2)
+        return x.float().div_(255.0).to(self.device)
+
+    def upscale(
+        self,
+        img: np.ndarray,
+        preprocess: bool = True,
+        output: OutputMode | None = None,
+    ) -> np.ndarray:
+        """
+        Upscale an (H, W, C) uint8 image into an (sH, sW, C') uint8 array.
+
+        Every output tile is converted to uint8 by `output` (plain RGB/luma by
+        default) as soon as it is produced, so the full-size canvas never
+        exists in float. `preprocess=False` skips the preprocessing stage,
+        e.g. for repeated passes over an already upscaled output.
+        """
+        return self.upscale_many([self.model], img, preprocess, [output])[0]
+
+    def upscale_many(
+        self,
+        models: list[torch.nn.Module],
+        img: np.ndarray,
+        preprocess: bool = True,
+        outputs: list[OutputMode | None] | None = None,
+    ) -> list[np.ndarray]:
+        """
+        Upscale one image with several models (same scale and input channels)
+        at once: every tile batch is cut and preprocessed once and fed to each
+        model in turn, so comparing K models costs K forwards, not K full
+        pipelines. Returns one canvas per model.
+        """
+        outputs = [o or RGBOutput() for o in (outputs or [None] * len(models))]
+        height, width, channels = img.shape
+        tiles = make_tiles(height, width, self.chop_size, self.chop_overlap)
+        s = self.scale
+        results = []
+        for output in outputs:
+            results.append(
+                np.empty(
+                    (height * s, width * s, output.channels(channels)), dtype=np.uint8
+                )
+            )
+            output.start()
+
+        batches = batch_tiles(tiles, self.tile_batch)
+
+        with ThreadPoolExecutor(max_workers=1) as pool, torch.no_grad():
+            pending = pool.submit(self._prepare, img, batches[0], preprocess)
+            for k, batch in enumerate(batches):
+                x = pending.result()
+                if k + 1 < len(batches):
+                    # Overlap: prepare the next batch while this one runs.
+                    pending = pool.submit(
+                        self._prepare, img, batches[k + 1], preprocess
+                    )
+                for model, output, result in zip(models, outputs, results, strict=True):
+                    outs = model(x).clamp_(0, 1).cpu()
+                    for out, tile in zip(outs, batch, strict=True):
+                        out = out[
+                            :, _scaled(tile.keep_rows, s), _scaled(tile.keep_cols, s)
+                        ]
+                        dst_rows = _scaled(tile.keep_rows, s, tile.rows.start * s)
+                        dst_cols = _scaled(tile.keep_cols, s, tile.cols.start * s)
+                        result[dst_rows, dst_cols] = output.tile(out)
+        return results
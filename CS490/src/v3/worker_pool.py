@@ -0,0 +1,30 @@
+"""
+Process pool shared by the dataset generators.
+
+Generation is split into independent tasks (one source image, one chunk of
+synthetic samples) whose randomness derives only from the task itself, so
+the results are the same for any number of workers. Results come back in
+task order, which keeps shard contents and log output deterministic too.
+"""
+
+import os
+from collections.abc import Callable, Iterator, Sequence
+from concurrent.futures import ProcessPoolExecutor
+
+from tqdm import tqdm
+
+
+def default_workers() -> int:
+    return os.cpu_count() or 1
+
+
+def map_tasks(fn: Callable, tasks: Sequence, workers: int, desc: str) -> Iterator:
+    """
+    Yield `fn(task)` for every task in order, computed on `workers`
+    processes (inline when workers <= 1), with one progress bar for all.
+    """
+    if workers <= 1:
+        yield from tqdm(map(fn, tasks), total=len(tasks), desc=desc)
+        return
+    with ProcessPoolExecutor(workers) as pool:
+        yield from tqdm(pool.map(fn, tasks), total=len(tasks), desc=desc)
@@ -0,0 +1,9 @@
+"""
+The v3 modules import each other by bare name (they are run as scripts from
+src/v3), so the tests put that folder on the import path the same way.
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src" / "v3"))
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+import torch
+import torch.nn.functional as F
+from augment import BatchAugment
+from PIL import Image
+
+SIZE = 64
+
+
+def _blobs() -> np.ndarray:
+    """Two off-center Gaussian blobs: smooth, and not symmetric under rotation."""
+    y, x = np.mgrid[:SIZE, :SIZE]
+    big = np.exp(-((x - 44) ** 2 + (y - 20) ** 2) / (2 * 6**2))
+    small = 0.6 * np.exp(-((x - 18) ** 2 + (y - 40) ** 2) / (2 * 4**2))
+    return (big + small).astype(np.float32)
+
+
+def _params(n: int = 1, angle: float = 0.0, quarter: int = 0, flips=False) -> dict:
+    return {
+        "quarter": torch.full((n,), quarter),
+        "angle": torch.full((n,), angle),
+        "vflip": torch.full((n,), flips),
+        "hflip": torch.full((n,), flips),
+    }
+
+
+@pytest.mark.parametrize("angle", [-25.0, 7.5, 20.0])
+def test_free_rotation_matches_pil(angle):
+    img = _blobs()
+    pil = Image.fromarray((img * 255).astype(np.uint8))
+    expected = np.asarray(pil.rotate(angle, resample=Image.Resampling.BICUBIC)) / 255
+
+    out = BatchAugment.apply(torch.from_numpy(img)[None, None], _params(angle=angle))
+
+    assert np.abs(out[0, 0].numpy() - expected).max() < 0.02
+
+
+@pytest.mark.parametrize(
+    "params",
+    [_params(angle=20.0), _params(angle=-13.0, flips=True), _params(quarter=3)],
+)
+def test_lr_and_hr_stay_aligned(params):
+    hr = torch.from_numpy(_blobs())[None, None]
+    lr = F.avg_pool2d(hr, 2)
+
+    out_hr = BatchAugment.apply(hr, params)
+    out_lr = BatchAugment.apply(lr, params)
+
+    assert (F.avg_pool2d(out_hr, 2) - out_lr).abs().max() < 0.02
+
+
+def test_batch_transforms_teacher_like_hr():
+    hr = torch.from_numpy(_blobs()).expand(8, 3, SIZE, SIZE)
+    batch = {"lr": F.avg_pool2d(hr, 2), "hr": hr, "teacher": hr.clone()}
+
+    out = BatchAugment(seed=3)(batch)
+
+    assert torch.equal(out["teacher"], out["hr"])
+    assert (F.avg_pool2d(out["hr"], 2) - out["lr"]).abs().max() < 0.02
+    assert not torch.equal(out["hr"], hr)
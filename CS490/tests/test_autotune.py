@@ -0,0 +1,40 @@
+from argparse import Namespace
+
+import pytest
+from autotune import _measure_inference, tiled_chop_sizes
+
+IMAGE_SIZE = 96
+
+
+@pytest.mark.parametrize(
+    ("chop_sizes", "height", "width", "expected"),
+    [
+        ([128, 256, 512], 1024, 1024, [128, 256, 512]),
+        ([128, 256, 512], 512, 1024, [128, 256]),
+        ([128, 256, 512], 1024, 256, [128]),
+    ],
+)
+def test_chop_sizes_smaller_than_image(chop_sizes, height, width, expected):
+    assert tiled_chop_sizes(chop_sizes, height, width) == expected
+
+
+def test_no_tiling_chop_size_is_an_error():
+    with pytest.raises(ValueError, match="smaller than"):
+        tiled_chop_sizes([256, 512], 256, 300)
+
+
+def test_sweep_only_measures_chops_smaller_than_image():
+    args = Namespace(
+        model_path="",
+        image=None,
+        image_size=IMAGE_SIZE,
+        chop_sizes=[32, 64, 96, 128],
+        chop_overlap=8,
+        tile_batches=[1],
+        repeats=1,
+    )
+
+    results = _measure_inference(args)
+
+    assert [r["chop_size"] for r in results] == [32, 64]
+    assert min(results, key=lambda r: r["s_per_mpx"])["chop_size"] < IMAGE_SIZE
@@ -0,0 +1,14 @@
+import pytest
+from compare_checkpoints import checkpoint_labels
+
+
+@pytest.mark.parametrize(
+    ("paths", "expected"),
+    [
+        (["ck/v20.pt", "ck/v30.pt"], ["v20", "v30"]),
+        (["a/model.pt", "b/model.pt"], ["a_model", "b_model"]),
+        (["a/model.pt", "a/model.pth"], ["0_model", "1_model"]),
+    ],
+)
+def test_checkpoint_labels_are_unique(paths, expected):
+    assert checkpoint_labels(paths) == expected
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from image_utils import CONTENT_CELL, INK_LEVEL, ContentCrops
+
+CROP = 64
+
+
+@pytest.fixture
+def page() -> np.ndarray:
+    """Schematic-like page: thin lines and a box, wide blank margins."""
+    page = np.full((256, 320), 255, dtype=np.uint8)
+    page[96, 64:192] = 0
+    page[64:192, 150] = 0
+    page[180:200, 220:260] = 40
+    return page
+
+
+def _positions(crops: ContentCrops, n: int = 4000) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    return np.array([crops.position(rng) for _ in range(n)])
+
+
+def test_floor_one_is_uniform(page):
+    crops = ContentCrops(page, CROP, floor=1.0)
+
+    positions = _positions(crops, 20000)
+
+    np.testing.assert_allclose(np.diff(crops.cdf), 1.0)
+    span = np.array(page.shape) - CROP
+    np.testing.assert_allclose(positions.mean(0) / span, 0.5, atol=0.02)
+    assert positions.min() == 0
+    assert np.all(positions.max(0) == span)
+
+
+def test_floor_zero_never_picks_blank_windows(page):
+    crops = ContentCrops(page, CROP, floor=0.0)
+
+    positions = _positions(crops)
+
+    ink = [(page[t : t + CROP, s : s + CROP] < INK_LEVEL).sum() for t, s in positions]
+    assert min(ink) > 0
+
+
+def test_coverage_matches_brute_force_window_sums(page):
+    crops = ContentCrops(page, CROP, floor=0.0)
+    rows, cols = page.shape[0] // CONTENT_CELL, page.shape[1] // CONTENT_CELL
+    density = (page < INK_LEVEL).reshape(rows, CONTENT_CELL, cols, CONTENT_CELL)
+    density = density.mean(axis=(1, 3))
+    k = CROP // CONTENT_CELL
+    # The cells a crop starting anywhere in cell (r, c) always contains.
+    expected = np.array(
+        [
+            [density[r + 1 : r + k, c + 1 : c + k].sum() for c in range(cols - k + 1)]
+            for r in range(rows - k + 1)
+        ]
+    )
+
+    weights = np.diff(crops.cdf, prepend=0).reshape(expected.shape)
+
+    np.testing.assert_allclose(weights, expected / expected.max(), atol=1e-5)
+
+
+def test_blank_page_falls_back_to_uniform():
+    crops = ContentCrops(np.full((128, 128), 255, dtype=np.uint8), CROP, floor=0.0)
+
+    positions = _positions(crops, 500)
+
+    assert crops.cdf is None
+    assert positions.max() <= 128 - CROP
@@ -0,0 +1,129 @@
+import json
+from functools import partial
+
+import numpy as np
+import pytest
+from data_gen_real import _assign_splits, generate_dataset
+from manifest import Manifest
+from PIL import Image
+from shards import ShardReader
+
+N_SOURCES = 4
+
+
+@pytest.fixture
+def source_dir(tmp_path):
+    rng = np.random.default_rng(0)
+    src = tmp_path / "src"
+    src.mkdir()
+    for i in range(N_SOURCES):
+        page = rng.integers(0, 256, (96, 80, 3), dtype=np.uint8)
+        Image.fromarray(page).save(src / f"page{i}.png")
+    return src
+
+
+def _generate(source_dir, out, workers: int) -> dict[str, ShardReader]:
+    generate_dataset(
+        str(source_dir),
+        str(out),
+        samples_per_image=3,
+        hr_size=32,
+        output_format="shards",
+        seed=7,
+        workers=workers,
+    )
+    return {split: ShardReader(str(out), split) for split in ("train", "val")}
+
+
+def _contents(reader: ShardReader) -> list[tuple[str, bytes, bytes]]:
+    return [
+        (name, reader.get(name, "hr").tobytes(), reader.get(name, "lr").tobytes())
+        for name in reader.names
+    ]
+
+
+@pytest.mark.parametrize("workers", [2, 3])
+def test_output_does_not_depend_on_worker_count(source_dir, tmp_path, workers):
+    serial = _generate(source_dir, tmp_path / "serial", workers=1)
+
+    pooled = _generate(source_dir, tmp_path / "pooled", workers=workers)
+
+    assert len(serial["train"]) + len(serial["val"]) == 3 * N_SOURCES
+    assert {s: _contents(r) for s, r in pooled.items()} == {
+        s: _contents(r) for s, r in serial.items()
+    }
+
+
+def test_dedup_report_counts_only_skipped_crops(source_dir, tmp_path):
+    # Every crop of a blank page hashes the same: two of three are skipped.
+    Image.new("RGB", (96, 80), "white").save(source_dir / "blank.png")
+    # Smaller than a crop: yields no samples, but none were skipped.
+    tiny = np.random.default_rng(1).integers(0, 256, (16, 16, 3), dtype=np.uint8)
+    Image.fromarray(tiny).save(source_dir / "tiny.png")
+    out = tmp_path / "out"
+
+    generate_dataset(
+        str(source_dir),
+        str(out),
+        samples_per_image=3,
+        hr_size=32,
+        seed=7,
+        workers=1,
+        dedup_threshold=4,
+    )
+
+    report = json.loads((out / "dedup_report.json").read_text())
+    assert report["dropped_sources"] == {}
+    assert report["dropped_crops"] == 2
+
+
+def _sample_files(out) -> dict[str, int]:
+    """{relative path: mtime_ns} of every generated PNG."""
+    return {
+        str(p.relative_to(out)): p.stat().st_mtime_ns
+        for p in sorted(out.glob("*/*/*.png"))
+    }
+
+
+def test_incremental_run_only_regenerates_changes(source_dir, tmp_path):
+    out = tmp_path / "out"
+    run = partial(
+        generate_dataset,
+        str(source_dir),
+        str(out),
+        samples_per_image=2,
+        hr_size=32,
+        seed=7,
+        workers=1,
+    )
+    run()
+    before = _sample_files(out)
+    split = Manifest(str(out)).sources["page1.png"]["split"]
+    page = np.random.default_rng(9).integers(0, 256, (96, 80, 3), dtype=np.uint8)
+    Image.fromarray(page).save(source_dir / "page1.png")  # changed
+    (source_dir / "page2.png").unlink()  # removed
+    Image.fromarray(page).save(source_dir / "page9.png")  # added
+
+    run()
+
+    after = _sample_files(out)
+    stems = {f.split("/")[-1].split("_sample_")[0] for f in after}
+    assert stems == {"page0", "page1", "page3", "page9"}
+    assert all(after[f] == before[f] for f in after if "page0" in f or "page3" in f)
+    assert all(after[f] != before[f] for f in after if "page1" in f)
+    sources = Manifest(str(out)).sources
+    assert set(sources) == {s + ".png" for s in stems}
+    assert sources["page1.png"]["split"] == split
+
+
+def test_split_target_ignores_removed_sources(tmp_path):
+    manifest = Manifest(str(tmp_path))
+    manifest.sources = {f"old{i}": {"split": "train"} for i in range(8)}
+    manifest.sources |= {"val0": {"split": "val"}, "val1": {"split": "val"}}
+    new = [f"new{i}" for i in range(8)]
+
+    splits = _assign_splits(new, manifest, 0, removed=[f"old{i}" for i in range(8)])
+
+    # 8 of the 10 current sources end up in train, as if the removed ones
+    # had never been there.
+    assert sum(split == "train" for split in splits.values()) == 8
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+from dedup import HashIndex, hamming
+
+N_HASHES = 500
+
+
+@pytest.fixture
+def index() -> HashIndex:
+    rng = np.random.default_rng(0)
+    hashes = [int(h) for h in rng.integers(0, 2**63, N_HASHES, dtype=np.int64)]
+    # Near-duplicates of the first ten, one or two bits apart.
+    hashes += [h ^ 1 for h in hashes[:5]] + [h ^ 0b101 for h in hashes[5:10]]
+    idx = HashIndex()
+    idx.add("multi", hashes[:2])
+    for i, h in enumerate(hashes[2:], 2):
+        idx.add(f"k{i:04d}", [h])
+    return idx
+
+
+def test_pairs_match_brute_force(index):
+    hashes, owners = index._arrays()
+    i, j = np.nonzero(hamming(hashes[:, None], hashes[None, :]) <= 2)
+    expected = {
+        (min(a, b), max(a, b))
+        for a, b in zip(owners[i], owners[j], strict=True)
+        if a != b
+    }
+
+    assert index.pairs(2) == expected
+    assert len(expected) == 10
+
+
+@pytest.mark.parametrize("step_bytes", [1, 8 * N_HASHES, 8 * N_HASHES * 7 + 3])
+def test_pairs_do_not_depend_on_step_size(index, step_bytes):
+    assert index.pairs(2, step_bytes=step_bytes) == index.pairs(2)
@@ -0,0 +1,53 @@
+import random
+
+import numpy as np
+import pytest
+from image_utils import (
+    RESAMPLE_METHODS,
+    _resize_array,
+    degrade,
+    degrade_array,
+    downscale,
+)
+from PIL import Image
+
+SCALE = 4
+# One-pixel lines every third column: far above the LR Nyquist limit, so an
+# antialiased downscale leaves a nearly flat gray while fixed-support cubic,
+# Lanczos or linear kernels pick out single lines (std ~60-80).
+LINES = np.repeat(
+    np.where(np.arange(128) % 3 == 0, 255, 0).astype(np.uint8)[None, :], 128, 0
+)
+# Both pipelines draw their filters at random; compare the average over
+# many draws (about 6.5 for PIL, 27 for cv2's fixed-support resize).
+SEEDS = range(256)
+
+
+@pytest.mark.parametrize("method", RESAMPLE_METHODS)
+@pytest.mark.parametrize("channels", [1, 3])
+def test_resize_matches_pil(method, channels):
+    hr = np.repeat(LINES[:, :, None], channels, 2)
+    expected = np.asarray(Image.fromarray(hr.squeeze()).resize((32, 32), method))
+
+    out = _resize_array(hr, (32, 32), method)
+
+    assert np.array_equal(out, expected)
+
+
+def _pil_pipeline(hr: np.ndarray, seed: int) -> np.ndarray:
+    random.seed(seed)
+    np.random.seed(seed)
+    img = Image.fromarray(hr.squeeze())
+    return np.asarray(degrade(downscale(img, hr.shape[0], SCALE)))
+
+
+@pytest.mark.parametrize("channels", [1, 3])
+def test_degrade_matches_pil_pipeline_on_thin_lines(channels):
+    hr = np.repeat(LINES[:, :, None], channels, 2)
+
+    lrs = [degrade_array(hr, SCALE, np.random.default_rng(s)) for s in SEEDS]
+    lr_std = np.mean([lr.std() for lr in lrs])
+    ref_std = np.mean([_pil_pipeline(hr, s).std() for s in SEEDS])
+
+    assert lrs[0].shape == (128 // SCALE, 128 // SCALE, channels)
+    assert abs(lr_std - ref_std) < 2
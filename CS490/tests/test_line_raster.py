@@ -0,0 +1,61 @@
+import random
+
+import numpy as np
+import pytest
+from data_gen_synthetic import _render_lines_image
+from line_raster import _sample_shapes, render_lines
+from PIL import Image, ImageDraw
+
+HR_SIZE = 128
+INK = 128
+# Pages per renderer when comparing their coverage distributions.
+N_PAGES = 256
+
+
+def _pil_reference(shapes: dict, hr_size: int) -> np.ndarray:
+    """The shapes of page 0 drawn like `_render_lines_image`, on a 2x canvas."""
+    w = hr_size * 2
+    im = Image.new("RGB", (w, w), (255, 255, 255))
+    draw = ImageDraw.Draw(im)
+    for i in np.argsort(shapes["order"]):
+        p0, p1 = (shapes["p0"][i] * 2).tolist(), (shapes["p1"][i] * 2).tolist()
+        color = tuple(int(c) for c in shapes["color"][i])
+        if shapes["kind"][i] == 0:
+            width = int(shapes["size"][i] * 4)
+            draw.line((*p0, *p1), fill=color, width=width)
+            r = max(1, width / 2)
+            for x, y in (p0, p1):
+                draw.ellipse((x - r, y - r, x + r, y + r), fill=color)
+        else:
+            draw.rectangle((*p0, *p1), outline=color, width=int(shapes["size"][i] * 2))
+    im = im.resize((hr_size, hr_size), resample=Image.Resampling.LANCZOS)
+    return np.asarray(im)
+
+
+def _ink(page: np.ndarray) -> np.ndarray:
+    return page.min(axis=-1) < INK
+
+
+@pytest.mark.parametrize("seed", range(12))
+def test_pages_match_pil_drawing_of_the_same_shapes(seed):
+    shapes = _sample_shapes(1, HR_SIZE, np.random.default_rng(seed))
+    reference = _ink(_pil_reference(shapes, HR_SIZE))
+
+    ink = _ink(render_lines(1, HR_SIZE, np.random.default_rng(seed))[0])
+
+    # Analytic edges and PIL's integer strokes differ by up to a pixel at
+    # the borders, which costs thin lines most of the IoU.
+    iou = (ink & reference).sum() / (ink | reference).sum()
+    assert iou > 0.8
+    assert ink.mean() == pytest.approx(reference.mean(), rel=0.1)
+
+
+def test_ink_coverage_matches_pil_renderer():
+    random.seed(0)
+    pil = [
+        _ink(np.asarray(_render_lines_image(HR_SIZE))).mean() for _ in range(N_PAGES)
+    ]
+
+    sdf = _ink(render_lines(N_PAGES, HR_SIZE, np.random.default_rng(0))).mean()
+
+    assert sdf == pytest.approx(np.mean(pil), rel=0.1)
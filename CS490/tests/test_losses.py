@@ -0,0 +1,134 @@
+import pytest
+import torch
+import torch.nn.functional as F
+from losses import GRAY_WEIGHTS, SOBEL_X, SSIM_C1, SSIM_C2, FusedLoss, PerceptualLoss
+
+SHAPE = (2, 3, 24, 20)
+BIN_K, BIN_THRESH = 20.0, 0.1
+LAMBDAS = {"l1": 0.7, "edge": 0.3, "bin": 0.2, "ssim": 0.5}
+# Inputs are float64, but the SSIM window buffer is built in float32.
+TOLERANCE = {"rtol": 1e-6, "atol": 1e-9}
+
+
+def _gray(x):
+    weights = torch.tensor(GRAY_WEIGHTS, dtype=x.dtype).view(1, 3, 1, 1)
+    return (x * weights).sum(1, keepdim=True)
+
+
+def _sobel_mag(gray):
+    kx = torch.tensor(SOBEL_X, dtype=gray.dtype)[None, None]
+    gx = F.conv2d(gray, kx, padding=2)
+    gy = F.conv2d(gray, kx.transpose(-1, -2), padding=2)
+    return torch.sqrt(gx**2 + gy**2 + 1e-12)
+
+
+def _soft_bin(gray):
+    return torch.sigmoid(BIN_K * (gray - BIN_THRESH))
+
+
+def _ssim(x, y, size=11, sigma=1.5):
+    coords = torch.arange(size, dtype=x.dtype) - size // 2
+    g = torch.exp(-(coords**2) / (2 * sigma**2))
+    window = torch.outer(g, g) / torch.outer(g, g).sum()
+    c = x.size(1)
+    window = window.expand(c, 1, size, size)
+
+    def blur(t):
+        return F.conv2d(t, window, padding=size // 2, groups=c)
+
+    mu_x, mu_y = blur(x), blur(y)
+    var_x = blur(x * x) - mu_x**2
+    var_y = blur(y * y) - mu_y**2
+    cov = blur(x * y) - mu_x * mu_y
+    ssim_map = ((2 * mu_x * mu_y + SSIM_C1) * (2 * cov + SSIM_C2)) / (
+        (mu_x**2 + mu_y**2 + SSIM_C1) * (var_x + var_y + SSIM_C2)
+    )
+    return ssim_map.mean()
+
+
+REFERENCE = {
+    "l1": F.l1_loss,
+    "edge": lambda x, y: F.l1_loss(_sobel_mag(_gray(x)), _sobel_mag(_gray(y))),
+    "bin": lambda x, y: F.l1_loss(_soft_bin(_gray(x)), _soft_bin(_gray(y))),
+    "ssim": lambda x, y: 1 - _ssim(x, y),
+}
+
+
+@pytest.fixture
+def images():
+    gen = torch.Generator().manual_seed(0)
+    out = torch.rand(SHAPE, generator=gen, dtype=torch.float64)
+    hr = torch.rand(SHAPE, generator=gen, dtype=torch.float64)
+    return out.requires_grad_(), hr
+
+
+def _fused_loss() -> FusedLoss:
+    return FusedLoss(
+        lambda_l1=LAMBDAS["l1"],
+        lambda_edge=LAMBDAS["edge"],
+        lambda_bin=LAMBDAS["bin"],
+        bin_k=BIN_K,
+        bin_thresh=BIN_THRESH,
+        lambda_ssim=LAMBDAS["ssim"],
+    ).double()
+
+
+@pytest.mark.parametrize("name", LAMBDAS)
+def test_term_matches_reference(images, name):
+    out, hr = images
+
+    terms = _fused_loss()(out, hr)
+
+    expected = REFERENCE[name](out, hr) * LAMBDAS[name]
+    torch.testing.assert_close(terms[name], expected, **TOLERANCE)
+
+
+def test_input_gradient_matches_reference(images):
+    out, hr = images
+
+    (grad,) = torch.autograd.grad(sum(_fused_loss()(out, hr).values()), out)
+
+    reference = sum(REFERENCE[name](out, hr) * w for name, w in LAMBDAS.items())
+    (expected,) = torch.autograd.grad(reference, out)
+    torch.testing.assert_close(grad, expected, **TOLERANCE)
+
+
+def test_only_enabled_terms_are_returned(images):
+    out, hr = images
+
+    terms = FusedLoss(lambda_l1=1.0, lambda_ssim=0.5).double()(out, hr)
+
+    assert list(terms) == ["l1", "ssim"]
+
+
+EVERY = 3
+
+
+def _perceptual(every: int) -> PerceptualLoss:
+    torch.manual_seed(0)
+    return PerceptualLoss(0.5, layer="relu2_2", every=every, pretrained=False)
+
+
+def test_vgg_every_weights_applied_steps_by_n():
+    gen = torch.Generator().manual_seed(0)
+    out, hr = torch.rand(2, 2, 3, 32, 32, generator=gen)
+    sparse, dense = _perceptual(EVERY), _perceptual(1)
+
+    losses = [sparse(out, hr) for _ in range(2 * EVERY)]
+
+    expected = dense(out, hr) * EVERY
+    assert [loss is None for loss in losses] == [False, True, True] * 2
+    torch.testing.assert_close(losses[0], expected)
+    torch.testing.assert_close(losses[EVERY], expected)
+
+
+def test_vgg_every_is_ignored_without_grad():
+    gen = torch.Generator().manual_seed(0)
+    out, hr = torch.rand(2, 2, 3, 32, 32, generator=gen)
+    sparse, dense = _perceptual(EVERY), _perceptual(1)
+
+    with torch.no_grad():
+        losses = [sparse(out, hr) for _ in range(EVERY)]
+
+    expected = dense(out, hr).detach()
+    assert all(torch.allclose(loss, expected) for loss in losses)
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+import torch
+from image_utils import is_grayscale, rgb_to_luma
+from ninasr import build_ninasr, ninasr_b0, rgb_to_luma_state_dict
+
+
+def _gray_rgb_pair(model: torch.nn.Module) -> tuple[torch.Tensor, torch.Tensor]:
+    """Outputs of `model` and of its luma conversion on one gray batch."""
+    luma = build_ninasr(2, {**model.config, "n_colors": 1})
+    luma.load_state_dict(rgb_to_luma_state_dict(model.state_dict(), 2))
+    luma.eval()
+    x = torch.rand(2, 1, 24, 24, generator=torch.Generator().manual_seed(0))
+    with torch.no_grad():
+        rgb_mean = model(x.repeat(1, 3, 1, 1)).mean(1, keepdim=True)
+        return rgb_mean, luma(x)
+
+
+def test_luma_conversion_is_exact_for_uniform_head_mean():
+    # The head's per-color mean is the only approximated part of the
+    # conversion; with equal means the luma model is the RGB model's mean.
+    model = ninasr_b0(2).eval()
+    state = model.state_dict()
+    state["head.0.bias"][:] = state["head.0.bias"].mean()
+    model.load_state_dict(state)
+
+    rgb_mean, luma = _gray_rgb_pair(model)
+
+    torch.testing.assert_close(luma, rgb_mean, atol=1e-5, rtol=0)
+
+
+def test_luma_conversion_stays_close_with_rgb_mean():
+    # The error depends on the random init; a fixed one keeps the bound stable.
+    torch.manual_seed(0)
+    rgb_mean, luma = _gray_rgb_pair(ninasr_b0(2).eval())
+
+    assert (luma - rgb_mean).abs().max() < 0.05
+
+
+def test_rgb_to_luma_keeps_gray_values():
+    gray = np.random.default_rng(0).integers(0, 256, (8, 9, 1), dtype=np.uint8)
+
+    luma = rgb_to_luma(np.repeat(gray, 3, axis=2))
+
+    assert np.array_equal(luma, gray)
+
+
+@pytest.mark.parametrize(
+    ("pixel", "expected"),
+    [((120, 120, 120), True), ((120, 125, 118), True), ((200, 40, 40), False)],
+)
+def test_is_grayscale(pixel, expected):
+    img = np.full((16, 16, 3), pixel, dtype=np.uint8)
+
+    assert is_grayscale(img) is expected
@@ -0,0 +1,28 @@
+import argparse
+import json
+import os
+
+from machine_profile import load_profile, resolve_settings, save_profile
+
+
+def test_resolve_settings_keeps_command_line_values():
+    args = argparse.Namespace(num_threads=2, chop_size=None, tile_batch=None)
+
+    resolve_settings(args, {"num_threads": 8, "chop_size": 512}, list(vars(args)))
+
+    assert vars(args) == {"num_threads": 2, "chop_size": 512, "tile_batch": None}
+
+
+def test_profile_round_trip(tmp_path):
+    path = str(tmp_path / "host.json")
+
+    save_profile({"inference": {"chop_size": 384}}, path)
+
+    assert load_profile(path)["inference"] == {"chop_size": 384}
+
+
+def test_profile_of_other_machine_is_ignored(tmp_path):
+    path = tmp_path / "host.json"
+    path.write_text(json.dumps({"machine": {"cpu_count": (os.cpu_count() or 1) + 1}}))
+
+    assert load_profile(str(path)) == {}
@@ -0,0 +1,63 @@
+import random
+
+import pytest
+import torch
+from metrics import MetricSums, format_metrics
+
+N_STEPS = 12
+VGG_EVERY = 3
+
+
+@pytest.fixture
+def steps() -> list[tuple[dict, int]]:
+    """Uneven batches of tensor and float metrics; vgg only every 3rd step."""
+    rng = random.Random(0)
+    steps = []
+    for i in range(N_STEPS):
+        values = {
+            "l1": torch.tensor(rng.random(), requires_grad=True),
+            "psnr": rng.uniform(20, 40),
+        }
+        if i % VGG_EVERY == 0:
+            values["vgg"] = torch.tensor(rng.random(), dtype=torch.float64)
+        steps.append((values, rng.randint(1, 16)))
+    return steps
+
+
+def _running_means(steps) -> dict[str, float]:
+    """Per-sample mean over every sample seen, missing terms counting zero."""
+    totals, count = {}, 0
+    for values, n in steps:
+        for name, value in values.items():
+            totals[name] = totals.get(name, 0.0) + torch.as_tensor(value).item() * n
+        count += n
+    return {name: total / count for name, total in totals.items()}
+
+
+def test_means_are_sample_weighted(steps):
+    metrics = MetricSums()
+
+    for values, n in steps:
+        metrics.add(values, n)
+
+    assert metrics.count == sum(n for _, n in steps)
+    assert metrics.means() == pytest.approx(_running_means(steps), rel=1e-6)
+    assert list(metrics.means()) == ["l1", "psnr", "vgg"]
+
+
+def test_add_detaches_tensors(steps):
+    metrics = MetricSums()
+
+    metrics.add(*steps[0])
+
+    assert not any(
+        v.requires_grad for v in metrics._sums.values() if isinstance(v, torch.Tensor)
+    )
+
+
+def test_empty_sums_have_no_means():
+    assert MetricSums().means() == {}
+
+
+def test_format_metrics_sorts_names():
+    assert format_metrics({"psnr": 30.0, "l1": 0.5}) == "L1=0.500000 PSNR=30.000000"
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+import torch
+from output_modes import BinaryOutput, PaletteOutput, otsu_threshold, palette_levels
+
+
+def _bimodal_hist(low: int, high: int) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    values = np.concatenate([rng.normal(low, 8, 2000), rng.normal(high, 8, 6000)]).clip(
+        0, 255
+    )
+    return np.bincount(values.astype(np.int64), minlength=256)
+
+
+@pytest.mark.parametrize(("low", "high"), [(30, 220), (80, 160), (120, 250)])
+def test_otsu_splits_between_modes(low, high):
+    thr = otsu_threshold(_bimodal_hist(low, high))
+
+    assert low + 16 < thr < high - 16
+
+
+def test_otsu_of_empty_histogram():
+    assert otsu_threshold(np.zeros(256, dtype=np.int64)) == 0
+
+
+@pytest.mark.parametrize("n_levels", [2, 3, 4, 8])
+def test_palette_levels_are_sorted_and_at_most_k(n_levels):
+    hist = np.random.default_rng(n_levels).integers(0, 100, 256)
+
+    levels = palette_levels(hist, n_levels)
+
+    assert 1 <= len(levels) <= n_levels
+    assert np.all(np.diff(levels.astype(int)) > 0)
+
+
+@pytest.mark.parametrize("n_levels", [2, 4, 16])
+def test_palette_output_uses_at_most_k_levels(n_levels):
+    mode = PaletteOutput(n_levels)
+    mode.start()
+    canvas = mode.tile(torch.rand(3, 40, 50))
+
+    img = mode.finish(canvas)
+
+    assert img.mode == "P"
+    assert len(np.unique(np.asarray(img))) <= n_levels
+    assert len(np.unique(np.asarray(img.convert("L")))) <= n_levels
+
+
+def test_binary_output_thresholds_tiles_with_otsu():
+    gray = torch.where(torch.rand(1, 32, 32) < 0.3, 0.1, 0.9)
+    mode = BinaryOutput()
+    mode.start()
+    canvas = mode.tile(gray)
+
+    img = mode.finish(canvas)
+
+    assert img.mode == "1"
+    assert np.array_equal(np.asarray(img), gray[0].numpy() > 0.5)
+
+
+def test_binary_output_fixed_threshold():
+    mode = BinaryOutput(threshold=0.5)
+    mode.start()
+    canvas = mode.tile(torch.tensor([[[0.2, 0.49, 0.51, 0.8]]]))
+
+    img = mode.finish(canvas)
+
+    assert np.asarray(img).tolist() == [[False, False, True, True]]
@@ -0,0 +1,63 @@
+import pytest
+import torch
+from output_modes import make_output_mode
+from planner import Calibration, calibrate, plan_image
+
+CONFIG = {"n_feats": 16, "expansion": 2.0, "n_colors": 3}
+CALIB = Calibration(
+    forward_s_per_px=1e-6,
+    preprocess_s_per_px=1e-7,
+    encode_s_per_px=1e-8,
+    disk_bytes_per_px=0.1,
+    base_rss=100 * 2**20,
+)
+
+
+def _plan(size: int, calib: Calibration = CALIB, **kwargs):
+    settings = {
+        "scale": 2,
+        "chop_size": 128,
+        "chop_overlap": 16,
+        "ensemble": False,
+        "passes": 1,
+        "output_channels": 3,
+        "preprocess": True,
+    } | kwargs
+    return plan_image("page", size, size, calib, CONFIG, **settings)
+
+
+def _calibrate(mode: str, output_format: str) -> Calibration:
+    # Nearest upsampling is cheap and keeps the strokes of the test tile.
+    model = torch.nn.Upsample(scale_factor=2, mode="nearest")
+    return calibrate(
+        model,
+        2,
+        make_output_mode(mode),
+        None,
+        tile_size=128,
+        repeats=1,
+        output_format=output_format,
+    )
+
+
+@pytest.mark.parametrize("passes", [1, 2])
+def test_plan_grows_with_image_size(passes):
+    small, large = _plan(256, passes=passes), _plan(1024, passes=passes)
+
+    assert large.n_tiles > small.n_tiles
+    assert large.seconds > small.seconds
+    assert large.peak_bytes > small.peak_bytes
+    assert large.disk_bytes == pytest.approx(16 * small.disk_bytes, rel=1e-3)
+
+
+@pytest.mark.parametrize("mode", ["binary", "palette"])
+def test_calibration_follows_output_format(mode):
+    png, tiff = _calibrate(mode, "png"), _calibrate(mode, "tiff")
+
+    assert _plan(1024, png).disk_bytes != _plan(1024, tiff).disk_bytes
+
+
+def test_calibration_follows_output_mode():
+    rgb, binary = _calibrate("rgb", "png"), _calibrate("binary", "png")
+
+    assert _plan(1024, binary).disk_bytes < _plan(1024, rgb).disk_bytes
@@ -0,0 +1,53 @@
+import torch
+from ninasr import ResBlock, ninasr_b0
+from prune import prune_ninasr
+
+MID = 32  # mid channels of a b0 ResBlock
+
+
+def _model() -> torch.nn.Module:
+    torch.manual_seed(0)
+    return ninasr_b0(2).eval()
+
+
+def _kill_upper_channels(module: torch.nn.Module):
+    # Zero filters and biases: these channels are 0 after the ReLU.
+    if isinstance(module, ResBlock):
+        module.body[0].weight.data[MID // 2 :] = 0
+        module.body[0].bias.data[MID // 2 :] = 0
+
+
+def test_prune_ninasr_shapes_and_config():
+    model = _model()
+    keep = {0: torch.tensor([0, 3, 7]), 2: torch.arange(MID)}
+
+    pruned = prune_ninasr(model, keep)
+
+    assert [b["src"] for b in pruned.config["blocks"]] == [0, 2]
+    assert pruned.body[0].body[0].weight.shape[0] == 3
+    assert pruned.body[0].body[3].weight.shape[1] == 3
+    assert len(pruned.body) == 2
+
+
+def test_prune_ninasr_copies_kept_weights():
+    model = _model()
+    ch = torch.tensor([1, 4, 5])
+
+    pruned = prune_ninasr(model, {0: ch})
+
+    assert torch.equal(pruned.body[0].body[0].weight, model.body[0].body[0].weight[ch])
+    assert torch.equal(
+        pruned.body[0].body[3].weight, model.body[0].body[3].weight[:, ch]
+    )
+
+
+def test_removing_dead_channels_keeps_output():
+    model = _model()
+    model.apply(_kill_upper_channels)
+    keep = dict.fromkeys(range(len(model.body)), torch.arange(MID // 2))
+    x = torch.rand(1, 3, 16, 16)
+
+    pruned = prune_ninasr(model, keep).eval()
+
+    with torch.no_grad():
+        torch.testing.assert_close(pruned(x), model(x))
@@ -0,0 +1,23 @@
+import torch
+from ninasr import RepConv, build_ninasr, fuse_repconv_state_dict, ninasr_b0
+
+
+def _randomize_branches(module: torch.nn.Module):
+    # The 1x1 branches start at zero; give them weights so fusing matters.
+    if isinstance(module, RepConv):
+        torch.nn.init.normal_(module.branch_1x1.weight, std=0.05)
+
+
+def test_fused_repconv_matches_training_model():
+    torch.manual_seed(0)
+    model = ninasr_b0(2, block_type="repconv").eval()
+    model.apply(_randomize_branches)
+    x = torch.rand(1, 3, 20, 20)
+
+    state, config = fuse_repconv_state_dict(model.state_dict(), model.config)
+    fused = build_ninasr(2, config)
+    fused.load_state_dict(state)
+
+    with torch.no_grad():
+        torch.testing.assert_close(fused.eval()(x), model(x), atol=1e-5, rtol=1e-4)
+    assert config["block_type"] == "standard"
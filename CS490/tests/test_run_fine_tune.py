@@ -0,0 +1,30 @@
+import pytest
+from run_fine_tune import check_args, make_parser
+
+DATA = ["--dataset-root", "dataset"]
+
+
+def _check(argv: list[str]):
+    p = make_parser()
+    check_args(p, p.parse_args(argv))
+
+
+@pytest.mark.parametrize(
+    "argv",
+    [
+        ["--augment", "batch"],
+        ["--augment", "pil"],
+        ["--vgg-crop", "32"],
+        ["--online-degradation"],
+        ["--synthetic-ratio", "0.5"],
+    ],
+)
+def test_vgg_cache_refuses_changing_targets(argv, capsys):
+    with pytest.raises(SystemExit):
+        _check([*DATA, "--vgg-cache", *argv])
+
+    assert "--vgg-cache needs stored" in capsys.readouterr().err
+
+
+def test_vgg_cache_accepts_stored_unaugmented_data():
+    _check([*DATA, "--vgg-cache", "--augment", "none"])
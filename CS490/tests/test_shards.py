@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from shards import ShardReader, ShardWriter
+
+
+def _samples() -> dict[str, tuple[np.ndarray, np.ndarray]]:
+    rng = np.random.default_rng(0)
+    return {
+        f"s{i}": (
+            rng.integers(0, 256, (8 + 4 * i, 12, 3), dtype=np.uint8),
+            rng.integers(0, 256, (2 + i, 3, 3), dtype=np.uint8),
+        )
+        for i in range(5)
+    }
+
+
+@pytest.mark.parametrize("compression", ["raw", "zlib"])
+def test_samples_round_trip(tmp_path, compression):
+    samples = _samples()
+    # A zero size budget starts a new shard for every sample.
+    with ShardWriter(str(tmp_path), "train", compression, shard_size_mb=0) as w:
+        for name, (hr, lr) in samples.items():
+            w.add(name, hr, lr)
+
+    reader = ShardReader(str(tmp_path), "train")
+
+    assert reader.names == list(samples)
+    assert w.n_shards == len(samples)
+    assert all(
+        np.array_equal(reader.get(name, "hr"), hr)
+        and np.array_equal(reader.get(name, "lr"), lr)
+        for name, (hr, lr) in samples.items()
+    )
+
+
+def test_append_continues_index_and_remove_drops(tmp_path):
+    samples = _samples()
+    names = list(samples)
+    with ShardWriter(str(tmp_path), "val") as w:
+        w.add(names[0], *samples[names[0]])
+    with ShardWriter(str(tmp_path), "val") as w:
+        w.add(names[1], *samples[names[1]])
+        w.add(names[2], *samples[names[2]])
+        w.remove([names[1]])
+
+    reader = ShardReader(str(tmp_path), "val")
+
+    assert reader.names == [names[0], names[2]]
+    assert np.array_equal(reader.get(names[2], "hr"), samples[names[2]][0])
+
+
+def test_append_rejects_other_compression(tmp_path):
+    with ShardWriter(str(tmp_path), "train", "raw"):
+        pass
+
+    with pytest.raises(ValueError, match="raw-compressed"):
+        ShardWriter(str(tmp_path), "train", "zlib")
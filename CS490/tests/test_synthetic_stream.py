@@ -0,0 +1,85 @@
+from types import SimpleNamespace
+
+import data_gen_synthetic
+import pytest
+import torch
+from data_gen_synthetic import SyntheticStream
+
+HR_SIZE = 32
+N_REAL = 30
+
+
+def _real(i: int) -> dict:
+    hr = torch.full((3, HR_SIZE, HR_SIZE), i / N_REAL)
+    return {"hr": hr, "lr": hr[:, ::2, ::2], "name": f"real_{i}"}
+
+
+REAL = [_real(i) for i in range(N_REAL)]
+
+
+def _epoch(stream: SyntheticStream, monkeypatch, worker: int = 0, n_workers: int = 1):
+    """Everything one DataLoader worker of the stream yields in an epoch."""
+    info = SimpleNamespace(id=worker, num_workers=n_workers)
+    monkeypatch.setattr(data_gen_synthetic, "get_worker_info", lambda: info)
+    return list(stream)
+
+
+def _hrs(samples: list[dict]) -> torch.Tensor:
+    return torch.stack([s["hr"] for s in samples])
+
+
+def test_same_seed_and_epoch_reproduce(monkeypatch):
+    first = _epoch(SyntheticStream(HR_SIZE, epoch_size=6, seed=3), monkeypatch)
+
+    again = _epoch(SyntheticStream(HR_SIZE, epoch_size=6, seed=3), monkeypatch)
+
+    assert [s["name"] for s in again] == [s["name"] for s in first]
+    assert torch.equal(_hrs(again), _hrs(first))
+
+
+def test_set_epoch_changes_samples(monkeypatch):
+    stream = SyntheticStream(HR_SIZE, epoch_size=6, seed=3)
+    first = _epoch(stream, monkeypatch)
+
+    stream.set_epoch(1)
+    second = _epoch(stream, monkeypatch)
+
+    assert not torch.equal(_hrs(second), _hrs(first))
+
+
+def test_workers_yield_different_samples(monkeypatch):
+    stream = SyntheticStream(HR_SIZE, epoch_size=12, seed=3)
+
+    w0 = _epoch(stream, monkeypatch, worker=0, n_workers=2)
+    w1 = _epoch(stream, monkeypatch, worker=1, n_workers=2)
+
+    assert len(w0) == len(w1) == 6
+    assert not torch.equal(_hrs(w0), _hrs(w1))
+    assert not {s["name"] for s in w0} & {s["name"] for s in w1}
+
+
+@pytest.mark.parametrize(("ratio", "n_synthetic"), [(0.25, 10), (0.5, 30)])
+@pytest.mark.parametrize("n_workers", [1, 3])
+def test_interleave_ratio(monkeypatch, ratio, n_synthetic, n_workers):
+    stream = SyntheticStream(real=REAL, synthetic_ratio=ratio, seed=5)
+
+    samples = [
+        s
+        for w in range(n_workers)
+        for s in _epoch(stream, monkeypatch, worker=w, n_workers=n_workers)
+    ]
+
+    real = sorted(s["name"] for s in samples if s["name"].startswith("real_"))
+    assert len(stream) == N_REAL + n_synthetic
+    assert len(samples) - len(real) == n_synthetic
+    assert real == sorted(s["name"] for s in REAL)
+
+
+def test_real_samples_are_interleaved(monkeypatch):
+    stream = SyntheticStream(real=REAL, synthetic_ratio=0.5, seed=5)
+
+    samples = _epoch(stream, monkeypatch)
+
+    first_half = samples[: len(samples) // 2]
+    n_real = sum(s["name"].startswith("real_") for s in first_half)
+    assert 0.25 * len(first_half) < n_real < 0.75 * len(first_half)
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+import torch
+from image_utils import bilateral_smooth_array
+from ninasr import ninasr_b0
+from tiling import TiledUpscaler, bilateral_stage
+
+
+@pytest.fixture
+def page() -> np.ndarray:
+    return np.random.default_rng(0).integers(0, 256, (70, 90, 3), dtype=np.uint8)
+
+
+@pytest.mark.parametrize("tile_batch", [1, 4])
+def test_tiles_match_whole_image(page, tile_batch):
+    # Nearest upsampling is pointwise, so any seam error shows up exactly.
+    model = torch.nn.Upsample(scale_factor=2, mode="nearest")
+    tiled = TiledUpscaler(model, 2, 32, 8, tile_batch=tile_batch)
+
+    out = tiled.upscale(page)
+
+    assert np.array_equal(out, TiledUpscaler(model, 2).upscale(page))
+
+
+def test_per_tile_bilateral_matches_full_image(page):
+    model = ninasr_b0(2).eval()
+    full = TiledUpscaler(model, 2, 32, 8)
+    fused = TiledUpscaler(model, 2, 32, 8, preprocess=bilateral_stage())
+
+    out = fused.upscale(page)
+
+    assert np.array_equal(out, full.upscale(bilateral_smooth_array(page)))